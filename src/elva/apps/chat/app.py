@@ -23,7 +23,7 @@ from elva.cli import get_data_file_path, get_render_file_path
 from elva.parser import ArrayEventParser, MapEventParser
 from elva.provider import WebsocketProvider
 from elva.renderer import TextRenderer
-from elva.store import SQLiteStore
+from elva.store import get_store_class
 from elva.widgets.awareness import AwarenessView
 from elva.widgets.config import ConfigView
 from elva.widgets.screens import Dashboard, ErrorScreen, InputScreen
@@ -164,7 +164,7 @@ class History(MessageList, ArrayEventParser, can_focus=False):
         """
         self.messages.unobserve(self._subscription)
 
-    def _on_edit(self, retain: int = 0, delete: int = 0, insert: list = [], txn = None):
+    def _on_edit(self, retain: int = 0, delete: int = 0, insert: list = [], txn=None):
         """
         Hook called by the [`parse`][elva.parser.ArrayEventParser.parse] method.
 
@@ -227,7 +227,9 @@ class Future(MessageList, MapEventParser, can_focus=False):
         """
         self.messages.unobserve(self._subscription)
 
-    def _on_edit(self, delete: dict = {}, update: dict = {}, insert: dict = {}, txn = None):
+    def _on_edit(
+        self, delete: dict = {}, update: dict = {}, insert: dict = {}, txn=None
+    ):
         """
         Hook called by the [`parse`][elva.parser.MapEventParser.parse] method.
 
@@ -336,10 +338,12 @@ class UI(App):
         self.components = []
 
         if c.get("file") is not None:
-            self.store = SQLiteStore(
+            store_class = get_store_class(c)
+            self.store = store_class(
                 self.ydoc,
                 c["identifier"],
                 c["file"],
+                **store_class.get_options(c),
             )
             self.components.append(self.store)
 
@@ -351,6 +355,7 @@ class UI(App):
                 port=c.get("port"),
                 safe=c.get("safe", True),
                 on_exception=self.on_provider_exception,
+                store=getattr(self, "store", None),
             )
 
             data = {}
@@ -590,15 +595,22 @@ class UI(App):
 
         path = Path(name)
 
-        data_file_path = get_data_file_path(path)
+        store_class = get_store_class(self.config)
+        data_file_path = get_data_file_path(path, store_class.suffix)
         if data_file:
             self.config["file"] = data_file_path
-            self.store = SQLiteStore(
-                self.ydoc, self.config["identifier"], data_file_path
+            self.store = store_class(
+                self.ydoc,
+                self.config["identifier"],
+                data_file_path,
+                **store_class.get_options(self.config),
             )
             self.components.append(self.store)
             self.run_worker(self.store.start())
 
+            if hasattr(self, "provider"):
+                self.provider.store = self.store
+
         if self.config.get("render") is None:
             render_file_path = get_render_file_path(data_file_path)
             self.config["render"] = render_file_path
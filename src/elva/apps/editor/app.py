@@ -17,7 +17,7 @@ from elva.component import Component, ComponentState
 from elva.core import FILE_SUFFIX
 from elva.provider import WebsocketProvider
 from elva.renderer import TextRenderer
-from elva.store import SQLiteStore
+from elva.store import get_store_class
 from elva.widgets.awareness import AwarenessView
 from elva.widgets.config import ConfigView
 from elva.widgets.screens import Dashboard, ErrorScreen, InputScreen
@@ -89,6 +89,18 @@ class UI(App):
 
         self.components = list()
 
+        # the store is started before the provider,
+        # so the loaded contents are sent with the initial sync
+        if c.get("file") is not None:
+            store_class = get_store_class(c)
+            self.store = store_class(
+                self.ydoc,
+                c["identifier"],
+                c["file"],
+                **store_class.get_options(c),
+            )
+            self.components.append(self.store)
+
         if c.get("host") is not None:
             self.provider = WebsocketProvider(
                 self.ydoc,
@@ -97,6 +109,7 @@ class UI(App):
                 port=c.get("port"),
                 safe=c.get("safe", True),
                 on_exception=self.on_provider_exception,
+                store=getattr(self, "store", None),
             )
 
             data = {}
@@ -107,14 +120,6 @@ class UI(App):
 
             self.components.append(self.provider)
 
-        if c.get("file") is not None:
-            self.store = SQLiteStore(
-                self.ydoc,
-                c["identifier"],
-                c["file"],
-            )
-            self.components.append(self.store)
-
         if c.get("render") is not None:
             self.renderer = TextRenderer(
                 self.ytext,
@@ -315,15 +320,22 @@ class UI(App):
 
         path = Path(name)
 
-        data_file_path = get_data_file_path(path)
+        store_class = get_store_class(self.config)
+        data_file_path = get_data_file_path(path, store_class.suffix)
         if data_file:
             self.config["file"] = data_file_path
-            self.store = SQLiteStore(
-                self.ydoc, self.config["identifier"], data_file_path
+            self.store = store_class(
+                self.ydoc,
+                self.config["identifier"],
+                data_file_path,
+                **store_class.get_options(self.config),
             )
             self.components.append(self.store)
             self.run_worker(self.store.start())
 
+            if hasattr(self, "provider"):
+                self.provider.store = self.store
+
         if self.config.get("render") is None:
             render_file_path = get_render_file_path(data_file_path)
             self.config["render"] = render_file_path
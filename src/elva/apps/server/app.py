@@ -2,30 +2,105 @@
 App definition.
 """
 
+import logging
+import multiprocessing
+import queue
+import signal
+import sys
+
 import anyio
 from websockets.asyncio.server import basic_auth
 
 from elva.auth import DummyAuth, LDAPAuth
-from elva.server import WebsocketServer, free_tcp_port
+from elva.bus import BusBroker, UnixSocketBus
+from elva.component import Component
+from elva.log import LOGGER_NAME, DefaultFormatter
+from elva.server import WebsocketRouter, WebsocketServer, free_tcp_port
+from elva.store import get_store_class
 
+STATS_INTERVAL = 10
+"""Seconds between two statistics reports of a worker."""
 
-async def main(config: dict):
+WORKER_START_TIMEOUT = 30
+"""Seconds a worker may take to start serving."""
+
+WORKER_STOP_TIMEOUT = 10
+"""Seconds a worker may take to stop gracefully before it is killed."""
+
+MONITOR_INTERVAL = 1
+"""Seconds between two checks of the workers being alive."""
+
+
+def setup_logging(config: dict):
     """
-    Main app routine.
+    Set up the logger of this app.
+
+    Arguments:
+        config: configuration parameter mapping.
+    """
+    name = __package__
+
+    LOGGER_NAME.set(name)
+    log = logging.getLogger(name)
 
-    Starts a server component and handles process signals.
+    if config.get("log") is not None:
+        log_handler = logging.FileHandler(config["log"])
+    else:
+        log_handler = logging.StreamHandler(sys.stdout)
+    log_handler.setFormatter(DefaultFormatter())
+    log.addHandler(log_handler)
+
+    level_name = config.get("level") or "INFO"
+    level = logging.getLevelNamesMapping()[level_name]
+    log.setLevel(level)
+
+
+def get_server(config: dict, port: int) -> WebsocketServer:
+    """
+    Create a server component from the configuration.
 
     Arguments:
         config: configuration parameter mapping.
+        port: port to listen on.
+
+    Returns:
+        the server component.
     """
     c = config
 
     host = c.get("host", "0.0.0.0")
-    port = c.get("port") or free_tcp_port()
     persistent = c.get("persistent", False)
     path = c.get("path")
     ldap = c.get("ldap")
     dummy = c.get("dummy", False)
+    idle_timeout = c.get("idle_timeout")
+    max_rooms = c.get("max_rooms")
+    max_memory = c.get("max_memory")
+    volatile_eviction = c.get("volatile_eviction", "refuse")
+    shards = c.get("shards")
+    broadcast_window = c.get("broadcast_window")
+    batch_ingest = c.get("batch_ingest", False)
+    max_syncs = c.get("max_syncs")
+    max_room_syncs = c.get("max_room_syncs")
+    max_sync_queue = c.get("max_sync_queue", 100)
+    bus = c.get("bus")
+    max_lag = c.get("max_lag", 30)
+    awareness_interval = c.get("awareness_interval")
+    store_class = get_store_class(c)
+
+    store_options = dict()
+    for key in (
+        "max_batch_size",
+        "max_batch_latency",
+        "merge_batch",
+        "compact_rows",
+        "compact_bytes",
+        "max_buffer_bytes",
+    ):
+        if c.get(key) is not None:
+            store_options[key] = c[key]
+
+    store_options.update(store_class.get_options(c))
 
     if ldap is not None:
         process_request = LDAPAuth(*ldap).check
@@ -40,13 +115,415 @@ async def main(config: dict):
             check_credentials=process_request,
         )
 
-    server = WebsocketServer(
+    return WebsocketServer(
         host=host,
         port=port,
         persistent=persistent,
         path=path,
         process_request=process_request,
+        idle_timeout=idle_timeout,
+        max_rooms=max_rooms,
+        max_memory=max_memory,
+        volatile_eviction=volatile_eviction,
+        store_options=store_options,
+        shards=shards,
+        store_class=store_class,
+        broadcast_window=broadcast_window,
+        batch_ingest=batch_ingest,
+        max_syncs=max_syncs,
+        max_room_syncs=max_room_syncs,
+        max_sync_queue=max_sync_queue,
+        bus=UnixSocketBus(bus) if bus is not None else None,
+        max_lag=max_lag,
+        awareness_interval=awareness_interval,
     )
 
+
+async def main(config: dict):
+    """
+    Main app routine.
+
+    Starts a server component, or a pool of workers if `workers` is given, and handles process signals.
+    With `bus_broker`, a bus broker is started beforehand on the socket given by `bus`.
+
+    Arguments:
+        config: configuration parameter mapping.
+    """
+    port = config.get("port") or free_tcp_port()
+
+    if config.get("workers"):
+        component = WorkerPool(config, port)
+    else:
+        component = get_server(config, port)
+
+    if config.get("bus_broker"):
+        if config.get("bus") is None:
+            raise ValueError("running a bus broker requires a bus socket")
+        broker = BusBroker(config["bus"])
+    else:
+        broker = None
+
+    async with anyio.create_task_group() as tg:
+        if broker is not None:
+            await tg.start(broker.start)
+
+        await tg.start(component.start)
+
+
+async def serve_worker(config: dict, index: int, reports: multiprocessing.Queue):
+    """
+    Worker routine running a server component and reporting its statistics.
+
+    The server listens on a port chosen by the operating system,
+    which is reported together with the readiness of the worker.
+
+    Arguments:
+        config: configuration parameter mapping.
+        index: index of this worker.
+        reports: queue to put readiness and statistics reports on.
+    """
+    server = get_server(config, 0)
+
     async with anyio.create_task_group() as tg:
         await tg.start(server.start)
+
+        sub = server.subscribe()
+        while server.states.SERVING not in server.state:
+            await sub.receive()
+        server.unsubscribe(sub)
+
+        # signal readiness
+        logging.getLogger(__package__).info(
+            f"worker {index} listening on port {server.port}"
+        )
+        reports.put(("ready", server.port))
+        tg.start_soon(_report_statistics, server, index, reports)
+
+        # stop the server gracefully, i.e. with all stores flushed
+        with anyio.open_signal_receiver(signal.SIGTERM) as signals:
+            async for _ in signals:
+                tg.cancel_scope.cancel()
+                break
+
+
+async def _report_statistics(
+    server: WebsocketServer, index: int, reports: multiprocessing.Queue
+):
+    """
+    Put the statistics of a server on a queue periodically.
+
+    Arguments:
+        server: the server component of this worker.
+        index: index of this worker.
+        reports: queue to put statistics reports on.
+    """
+    while True:
+        stats = dict(server.stats)
+        stats["rooms"] = len(server.rooms)
+        stats["connections"] = sum(len(room.clients) for room in server.rooms.values())
+
+        lags = [
+            outbox.lag
+            for room in server.rooms.values()
+            for outbox in room.outboxes.values()
+        ]
+        stats["lagging_connections"] = len(lags)
+        stats["max_lag"] = round(max(lags, default=0), 1)
+
+        reports.put(("stats", stats))
+
+        await anyio.sleep(STATS_INTERVAL)
+
+
+def run_worker(config: dict, index: int, reports: multiprocessing.Queue):
+    """
+    Entry point of a worker process.
+
+    Arguments:
+        config: configuration parameter mapping.
+        index: index of this worker.
+        reports: queue to put readiness and statistics reports on.
+    """
+    setup_logging(config)
+
+    # the pool stops workers gracefully with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    anyio.run(serve_worker, config, index, reports)
+
+
+class WorkerPool(Component):
+    """
+    Component running a server in each of several worker processes behind a [`WebsocketRouter`][elva.server.WebsocketRouter].
+
+    Workers exiting unexpectedly are respawned, while the router refuses connections to them.
+    On `SIGHUP`, the workers are restarted one after another.
+    On `SIGUSR1`, the latest statistics of all workers are logged.
+    On `SIGTERM`, all workers are stopped gracefully.
+    """
+
+    config: dict
+    """configuration parameter mapping."""
+
+    router: WebsocketRouter
+    """component redirecting connections to the workers."""
+
+    processes: list[multiprocessing.Process]
+    """worker processes."""
+
+    stats: dict[int, dict]
+    """mapping of worker indices to their latest statistics report."""
+
+    _ready: dict[int, anyio.Event]
+    """mapping of worker indices to events set when the worker is serving."""
+
+    _locks: list[anyio.Lock]
+    """locks serializing the replacement of each worker."""
+
+    def __init__(self, config: dict, port: int):
+        """
+        Arguments:
+            config: configuration parameter mapping.
+            port: port the router listens on.
+        """
+        if config.get("shards") is not None:
+            raise ValueError("shared databases are not supported with workers")
+
+        self.config = config
+        host = config.get("host", "0.0.0.0")
+
+        # the ports are reported by the workers once they are serving
+        workers = [0] * config["workers"]
+        self.router = WebsocketRouter(host, port, workers)
+
+        # start fresh interpreters without the state of this event loop
+        self._context = multiprocessing.get_context("spawn")
+
+        self.processes = [None] * len(workers)
+        self.stats = dict()
+        self._ready = dict()
+        self._locks = [anyio.Lock() for _ in workers]
+
+    def _spawn(self, index: int):
+        """
+        Start a worker process.
+
+        Each process reports on a queue of its own, so that a process
+        killed while writing to it can not block the reports of others.
+
+        Arguments:
+            index: index of the worker.
+        """
+        self._ready[index] = anyio.Event()
+        reports = self._context.Queue()
+
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.config, index, reports),
+            name=f"elva-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+        self._task_group.start_soon(self._read_reports, index, process, reports)
+
+    async def _wait_ready(self, index: int):
+        """
+        Wait for a worker process to serve.
+
+        Arguments:
+            index: index of the worker.
+
+        Raises:
+            RuntimeError: if the worker exited before serving.
+            TimeoutError: if the worker did not serve within [`WORKER_START_TIMEOUT`][elva.apps.server.app.WORKER_START_TIMEOUT] seconds.
+        """
+        process = self.processes[index]
+        ready = self._ready[index]
+
+        with anyio.fail_after(WORKER_START_TIMEOUT):
+            while not ready.is_set():
+                if not process.is_alive():
+                    raise RuntimeError(
+                        f"worker {index} exited with code {process.exitcode} on startup"
+                    )
+
+                with anyio.move_on_after(MONITOR_INTERVAL):
+                    await ready.wait()
+
+    async def _terminate(self, index: int):
+        """
+        Stop a worker process gracefully and wait for it to exit.
+
+        Workers not exiting within [`WORKER_STOP_TIMEOUT`][elva.apps.server.app.WORKER_STOP_TIMEOUT] seconds are killed.
+
+        Arguments:
+            index: index of the worker.
+        """
+        process = self.processes[index]
+        if process is None or not process.is_alive():
+            return
+
+        process.terminate()
+        await anyio.to_thread.run_sync(process.join, WORKER_STOP_TIMEOUT)
+
+        if process.is_alive():
+            self.log.warning(f"worker {index} did not stop in time, killing it")
+            process.kill()
+            await anyio.to_thread.run_sync(process.join)
+
+    async def _terminate_all(self):
+        """
+        Stop all worker processes concurrently.
+        """
+        async with anyio.create_task_group() as tg:
+            for index in range(len(self.processes)):
+                tg.start_soon(self._terminate, index)
+
+    async def _replace(self, index: int) -> bool:
+        """
+        Stop a worker process and start a new one in its place.
+
+        Connections to rooms of the worker are refused by the router until the new worker serves.
+
+        Arguments:
+            index: index of the worker.
+
+        Returns:
+            `True` if the new worker serves, else `False`.
+        """
+        async with self._locks[index]:
+            self.router.unavailable.add(index)
+
+            try:
+                await self._terminate(index)
+                self._spawn(index)
+                await self._wait_ready(index)
+            except Exception as exc:
+                self.log.error(f"failed to start worker {index}: {exc}")
+                with anyio.CancelScope(shield=True):
+                    await self._terminate(index)
+                return False
+
+            self.router.unavailable.discard(index)
+            return True
+
+    async def _read_reports(
+        self,
+        index: int,
+        process: multiprocessing.Process,
+        reports: multiprocessing.Queue,
+    ):
+        """
+        Hook receiving the readiness and statistics reports of a worker process.
+
+        It returns once the process has been replaced.
+
+        Arguments:
+            index: index of the worker.
+            process: the worker process.
+            reports: queue the worker process puts its reports on.
+        """
+        while self.processes[index] is process:
+            try:
+                kind, value = await anyio.to_thread.run_sync(
+                    reports.get, True, 0.5, abandon_on_cancel=True
+                )
+            except queue.Empty:
+                continue
+
+            if self.processes[index] is not process:
+                break
+
+            if kind == "ready":
+                self.router.workers[index] = value
+                self._ready[index].set()
+            else:
+                self.stats[index] = value
+
+    async def _monitor(self):
+        """
+        Hook respawning worker processes which exited unexpectedly.
+        """
+        while True:
+            await anyio.sleep(MONITOR_INTERVAL)
+
+            for index, process in enumerate(self.processes):
+                if process.is_alive() or self._locks[index].locked():
+                    continue
+
+                self.log.error(
+                    f"worker {index} exited with code {process.exitcode}, respawning"
+                )
+                if await self._replace(index):
+                    self.log.info(f"respawned worker {index}")
+
+    async def restart(self):
+        """
+        Restart the workers one after another.
+
+        Connections to rooms of a restarting worker are refused by the router
+        with a hint to retry, while the rooms of all other workers stay available.
+        """
+        for index in range(len(self.processes)):
+            if await self._replace(index):
+                self.log.info(f"restarted worker {index}")
+
+    def log_statistics(self):
+        """
+        Log the latest statistics of all workers.
+        """
+        for index in range(len(self.processes)):
+            stats = dict(self.stats.get(index, dict()))
+            stats.update(self.router.worker_stats[index])
+            report = ", ".join(f"{key}={value}" for key, value in sorted(stats.items()))
+            self.log.info(f"worker {index}: {report}")
+
+    async def _handle_signals(self):
+        """
+        Hook handling process signals.
+        """
+        with anyio.open_signal_receiver(
+            signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM
+        ) as signals:
+            async for signum in signals:
+                match signum:
+                    case signal.SIGHUP:
+                        await self.restart()
+                    case signal.SIGUSR1:
+                        self.log_statistics()
+                    case signal.SIGTERM:
+                        await self.stop()
+
+    async def before(self):
+        """
+        Hook starting the workers and waiting for them to serve.
+
+        If any worker fails to serve, all workers are stopped again.
+        """
+        try:
+            for index in range(len(self.processes)):
+                self._spawn(index)
+
+            for index in range(len(self.processes)):
+                await self._wait_ready(index)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self._terminate_all()
+            raise
+
+    async def run(self):
+        """
+        Hook starting the router, monitoring the workers and handling process signals.
+        """
+        await self._task_group.start(self.router.start)
+        self._task_group.start_soon(self._monitor)
+        self._task_group.start_soon(self._handle_signals)
+
+    async def cleanup(self):
+        """
+        Hook stopping all workers gracefully.
+        """
+        await self._terminate_all()
+
+        self.log_statistics()
@@ -75,6 +75,262 @@ def resolve_persistence(
     flag_value="",
     callback=resolve_persistence,
 )
+@click.option(
+    "--shards",
+    "shards",
+    metavar="NUMBER",
+    help=(
+        "Save all documents in NUMBER shared databases under DIRECTORY "
+        "instead of one data file per document. "
+        "NUMBER cannot be changed afterwards; use 'elva convert' to switch layouts."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--idle-timeout",
+    "idle_timeout",
+    metavar="SECONDS",
+    help=(
+        "Evict documents from memory after they had no connections "
+        "for SECONDS. They are reloaded from disk on the next connection. "
+        "Documents held only in volatile memory are kept."
+    ),
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--max-rooms",
+    "max_rooms",
+    metavar="NUMBER",
+    help=(
+        "Hold at most NUMBER documents in memory. "
+        "The least recently used documents without connections are evicted first."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--max-memory",
+    "max_memory",
+    metavar="BYTES",
+    help=(
+        "Spend at most about BYTES on documents held in memory, "
+        "estimated from their encoded size. "
+        "The least recently used documents without connections are evicted first."
+    ),
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--volatile-eviction",
+    "volatile_eviction",
+    help=(
+        "What to do on evicting documents held only in volatile memory: "
+        "keep them in memory ('refuse') or move them to a temporary file ('spill')."
+    ),
+    type=click.Choice(["refuse", "spill"]),
+)
+@click.option(
+    "--workers",
+    "workers",
+    metavar="NUMBER",
+    help=(
+        "Serve documents from NUMBER worker processes. "
+        "Connections are redirected to the worker serving the requested document."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--awareness-interval",
+    "awareness_interval",
+    metavar="SECONDS",
+    help=(
+        "Collect awareness changes, e.g. cursor moves, for SECONDS "
+        "and broadcast only the latest state of each client. Requires persistence."
+    ),
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--max-lag",
+    "max_lag",
+    metavar="SECONDS",
+    help=(
+        "Close connections which cannot keep up with the updates "
+        "of their document for longer than SECONDS. Defaults to 30."
+    ),
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--bus",
+    "bus",
+    metavar="SOCKET",
+    help=(
+        "Replicate documents with other servers via the bus broker "
+        "listening on the Unix domain socket SOCKET. Requires persistence."
+    ),
+    type=click.Path(path_type=Path, dir_okay=False),
+)
+@click.option(
+    "--bus-broker",
+    "bus_broker",
+    help="Run the bus broker on the socket given with --bus in this server.",
+    is_flag=True,
+)
+@click.option(
+    "--max-syncs",
+    "max_syncs",
+    metavar="NUMBER",
+    help=(
+        "Let at most NUMBER connections load a document and synchronize at the same time. "
+        "Further connections wait in a queue."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--max-room-syncs",
+    "max_room_syncs",
+    metavar="NUMBER",
+    help=(
+        "Let at most NUMBER connections synchronize with the same document at the same time. "
+        "Further connections wait in a queue."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--max-sync-queue",
+    "max_sync_queue",
+    metavar="NUMBER",
+    help=(
+        "Refuse new connections while NUMBER connections are waiting to synchronize, "
+        "advising them to retry later."
+    ),
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--broadcast-window",
+    "broadcast_window",
+    metavar="SECONDS",
+    help=(
+        "Merge the updates a document receives within SECONDS "
+        "and send them as a single message to each connection. "
+        "Requires persistence."
+    ),
+    type=click.FloatRange(min=0, min_open=True),
+)
+@click.option(
+    "--batch-ingest/--no-batch-ingest",
+    "batch_ingest",
+    help=(
+        "Apply all updates a document receives while the server is busy "
+        "merged into a single one. Requires persistence."
+    ),
+    default=None,
+)
+@click.option(
+    "--store",
+    "store",
+    help=(
+        "Format of the data file per document: "
+        "an SQLite database ('sqlite') or an append-only log ('log')."
+    ),
+    type=click.Choice(["sqlite", "log"]),
+)
+@click.option(
+    "--fsync",
+    "fsync",
+    help=(
+        "When the log store flushes written updates to disk: "
+        "on every write ('always'), at most every --fsync-interval ('interval') "
+        "or as the operating system decides ('never')."
+    ),
+    type=click.Choice(["always", "interval", "never"]),
+)
+@click.option(
+    "--fsync-interval",
+    "fsync_interval",
+    metavar="SECONDS",
+    help="Flush written updates of the log store at most every SECONDS.",
+    type=click.FloatRange(min=0),
+)
+@click.option(
+    "--batch-size",
+    "max_batch_size",
+    metavar="NUMBER",
+    help="Write up to NUMBER buffered updates per document in a single transaction.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--batch-latency",
+    "max_batch_latency",
+    metavar="SECONDS",
+    help="Wait up to SECONDS for further updates before writing a batch.",
+    type=click.FloatRange(min=0),
+)
+@click.option(
+    "--merge-batch/--no-merge-batch",
+    "merge_batch",
+    help="Merge a batch of updates into a single one before writing.",
+    default=None,
+)
+@click.option(
+    "--buffer-size",
+    "max_buffer_bytes",
+    metavar="BYTES",
+    help=(
+        "Hold at most BYTES of updates per document in memory while they wait "
+        "to be written; further updates are merged and spilled to disk."
+    ),
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--compact-rows",
+    "compact_rows",
+    metavar="NUMBER",
+    help="Merge the stored updates of a document when there are more than NUMBER.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--compact-bytes",
+    "compact_bytes",
+    metavar="BYTES",
+    help="Merge the stored updates of a document when they exceed BYTES in total.",
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--journal-mode",
+    "journal_mode",
+    help="SQLite journal mode of the data files, e.g. 'wal' for write-ahead logging.",
+    type=click.Choice(
+        ["delete", "truncate", "persist", "memory", "wal", "off"],
+        case_sensitive=False,
+    ),
+)
+@click.option(
+    "--synchronous",
+    "synchronous",
+    help="SQLite synchronization level of the data files on commit.",
+    type=click.Choice(["off", "normal", "full", "extra"], case_sensitive=False),
+)
+@click.option(
+    "--cache-size",
+    "cache_size",
+    metavar="NUMBER",
+    help=(
+        "SQLite page cache size per data file; "
+        "pages if positive, kibibytes if negative."
+    ),
+    type=click.INT,
+)
+@click.option(
+    "--mmap-size",
+    "mmap_size",
+    metavar="BYTES",
+    help="Maximum number of bytes of a data file being memory-mapped by SQLite.",
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--temp-store",
+    "temp_store",
+    help="Where SQLite stores temporary tables and indices.",
+    type=click.Choice(["default", "file", "memory"], case_sensitive=False),
+)
 @click.option(
     "--ldap",
     metavar="REALM SERVER BASE",
@@ -99,33 +355,18 @@ def cli(config: dict, *args: tuple, **kwargs: dict):
         kwargs: parameters passed from the CLI.
     """
     # imports
-    logging = import_("logging")
-    sys = import_("sys")
-
     anyio = import_("anyio")
 
-    _log = import_("elva.log")
     app = import_("elva.apps.server.app")
 
     # logging
-    _log.LOGGER_NAME.set(__package__)
-    log = logging.getLogger(__package__)
-
-    if config.get("log") is not None:
-        log_handler = logging.FileHandler(config["log"])
-    else:
-        log_handler = logging.StreamHandler(sys.stdout)
-    log_handler.setFormatter(_log.DefaultFormatter())
-    log.addHandler(log_handler)
-
-    level_name = config.get("level") or "INFO"
-    level = logging.getLevelNamesMapping()[level_name]
-    log.setLevel(level)
+    app.setup_logging(config)
 
-    # run app, catch file permission errors with an appropriate message
+    # run app, catch file permission errors and invalid option combinations
+    # with an appropriate message
     try:
         anyio.run(app.main, config)
-    except PermissionError as exc:
+    except (PermissionError, ValueError) as exc:
         raise click.UsageError(exc)
     except KeyboardInterrupt:
         pass
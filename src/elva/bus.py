@@ -0,0 +1,510 @@
+"""
+Module holding message bus components replicating rooms between servers.
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import anyio
+from anyio.abc import ByteStream, SocketListener
+from anyio.streams.buffered import BufferedByteReceiveStream
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+
+from elva.component import Component
+from elva.protocol import Message, prepend_var_uint, strip_var_uint
+from elva.retry import backoff
+
+OUTBOX_SIZE = 4096
+"""Maximum number of frames queued for sending, by a bus to the broker and by the broker to each bus."""
+
+TOPIC_QUEUE_SIZE = 1024
+"""Maximum number of messages queued for a joined topic before further ones are dropped and its room catches up."""
+
+
+class BusFrame(Message):
+    """
+    Frame types exchanged between [`UnixSocketBus`][elva.bus.UnixSocketBus] clients and the [`BusBroker`][elva.bus.BusBroker].
+
+    The payload of each frame holds the topic, prepended by its length, followed by the message.
+    """
+
+    JOIN = (ord("B"), ord("J"))
+    """Request to receive the messages published to a topic."""
+
+    LEAVE = (ord("B"), ord("L"))
+    """Request to stop receiving the messages published to a topic."""
+
+    PUBLISH = (ord("B"), ord("P"))
+    """Message published to a topic."""
+
+
+def encode_frame(frame: BusFrame, topic: str, message: bytes = b"") -> bytes:
+    """
+    Encode a bus frame.
+
+    Arguments:
+        frame: the type of the frame.
+        topic: the topic the frame refers to.
+        message: the message published to the topic.
+
+    Returns:
+        the encoded frame.
+    """
+    payload, _ = prepend_var_uint(topic.encode())
+    data, _ = frame.encode(payload + message)
+    return data
+
+
+async def receive_frame(
+    stream: BufferedByteReceiveStream,
+) -> tuple[BusFrame, str, bytes]:
+    """
+    Receive and decode a bus frame.
+
+    Arguments:
+        stream: the stream to receive the frame from.
+
+    Raises:
+        ValueError: if the frame type is unknown.
+        anyio.IncompleteRead: if the stream has been closed in the middle of a frame.
+
+    Returns:
+        a tuple of the frame type, the topic and the message.
+    """
+    frame = BusFrame(tuple(await stream.receive_exactly(2)))
+
+    # read the variable unsigned integer length byte by byte
+    length = 0
+    shift = 0
+    while True:
+        (byte,) = await stream.receive_exactly(1)
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+
+    payload = await stream.receive_exactly(length)
+    topic, offset = strip_var_uint(payload)
+
+    return frame, topic.decode(), payload[offset:]
+
+
+class Bus(Component, ABC):
+    """
+    Interface of a message bus distributing messages published to a topic to all other participants joined to it.
+
+    A [`Room`][elva.server.Room] with a bus uses its identifier as topic.
+    Messages are not echoed back to the participant having published them.
+
+    Implementations for message brokers need to provide [`publish`][elva.bus.Bus.publish],
+    [`join`][elva.bus.Bus.join] and [`leave`][elva.bus.Bus.leave].
+    """
+
+    @abstractmethod
+    async def join(self, topic: str) -> MemoryObjectReceiveStream:
+        """
+        Start receiving the messages published to a topic.
+
+        Arguments:
+            topic: the topic to join.
+
+        Returns:
+            a stream of messages published by others to `topic`.
+            A `None` item signals that messages might have been missed, e.g. after a reconnection.
+        """
+
+    @abstractmethod
+    async def leave(self, topic: str):
+        """
+        Stop receiving the messages published to a topic.
+
+        Arguments:
+            topic: the topic to leave.
+        """
+
+    @abstractmethod
+    def publish(self, topic: str, message: bytes):
+        """
+        Publish a message to a topic without waiting for it to be sent.
+
+        Arguments:
+            topic: the topic to publish to.
+            message: the message to publish.
+        """
+
+
+class UnixSocketBus(Bus):
+    """
+    Bus connected to a [`BusBroker`][elva.bus.BusBroker] via a Unix domain socket.
+
+    The connection is reestablished automatically.
+    Messages published in the meantime are queued and sent after reconnecting.
+
+    Messages are dropped instead of queued beyond [`OUTBOX_SIZE`][elva.bus.OUTBOX_SIZE] or [`TOPIC_QUEUE_SIZE`][elva.bus.TOPIC_QUEUE_SIZE].
+    The rooms of affected topics receive a `None` item afterwards to catch up with the rooms of other servers.
+    """
+
+    path: Path
+    """Path of the Unix domain socket the broker listens on."""
+
+    _topics: dict[str, MemoryObjectSendStream]
+    """Mapping of joined topics to the streams their messages are sent on."""
+
+    _outbox_send: MemoryObjectSendStream
+    """Stream of frames to send to the broker."""
+
+    _outbox_recv: MemoryObjectReceiveStream
+    """Stream of frames to be sent to the broker."""
+
+    _pending: None | bytes
+    """Frame taken from the outbox but not sent to the broker yet."""
+
+    _dropped: set[str]
+    """Topics of frames dropped from the full outbox."""
+
+    _catching_up: set[str]
+    """Topics with a `None` item waiting for space in their full stream."""
+
+    def __init__(self, path: str | Path):
+        """
+        Arguments:
+            path: path of the Unix domain socket the broker listens on.
+        """
+        self.path = Path(path)
+        self._topics = dict()
+        self._outbox_send, self._outbox_recv = anyio.create_memory_object_stream(
+            max_buffer_size=OUTBOX_SIZE
+        )
+        self._pending = None
+        self._dropped = set()
+        self._catching_up = set()
+
+    async def join(self, topic: str) -> MemoryObjectReceiveStream:
+        send, recv = anyio.create_memory_object_stream(max_buffer_size=TOPIC_QUEUE_SIZE)
+        self._topics[topic] = send
+        self._enqueue(topic, encode_frame(BusFrame.JOIN, topic))
+        return recv
+
+    async def leave(self, topic: str):
+        send = self._topics.pop(topic, None)
+        if send is not None:
+            send.close()
+            self._enqueue(topic, encode_frame(BusFrame.LEAVE, topic))
+
+    def publish(self, topic: str, message: bytes):
+        self._enqueue(topic, encode_frame(BusFrame.PUBLISH, topic, message))
+
+    def _enqueue(self, topic: str, frame: bytes):
+        """
+        Queue a frame for sending to the broker without waiting.
+
+        If the outbox is full, the frame is dropped and its topic is rejoined and caught up
+        as soon as the outbox has been emptied.
+
+        Arguments:
+            topic: the topic the frame refers to.
+            frame: the encoded frame.
+        """
+        try:
+            self._outbox_send.send_nowait(frame)
+        except anyio.WouldBlock:
+            if topic not in self._dropped:
+                self.log.warning(f"outbox full, dropping frames of topic {topic}")
+            self._dropped.add(topic)
+
+    def _deliver(self, topic: str, message: None | bytes):
+        """
+        Put a message on the stream of a joined topic without waiting.
+
+        If the stream is full, the message is dropped and the room is signalled to catch up
+        as soon as there is space again.
+
+        Arguments:
+            topic: the topic the message has been published to.
+            message: the message, or `None` to signal that messages might have been missed.
+        """
+        send = self._topics.get(topic)
+        if send is None or topic in self._catching_up:
+            # the topic has been left or its room is going to catch up anyway
+            return
+
+        try:
+            send.send_nowait(message)
+        except anyio.WouldBlock:
+            self.log.warning(f"room of topic {topic} is lagging, dropping messages")
+            self._catching_up.add(topic)
+            self._task_group.start_soon(self._catch_up, topic, send)
+        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+            # the room stopped receiving
+            pass
+
+    async def _catch_up(self, topic: str, send: MemoryObjectSendStream):
+        """
+        Hook signalling the room of a topic to catch up once there is space in its stream.
+
+        Arguments:
+            topic: the topic whose messages have been dropped.
+            send: the stream of the topic.
+        """
+        try:
+            await send.send(None)
+        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+            pass
+        finally:
+            self._catching_up.discard(topic)
+
+    async def run(self):
+        """
+        Hook connecting to the broker and exchanging frames until cancelled.
+        """
+        delays = backoff()
+        reconnect = False
+
+        while True:
+            try:
+                stream = await anyio.connect_unix(self.path)
+            except OSError as exc:
+                delay = next(delays)
+                self.log.warning(
+                    f"failed to connect to broker at {self.path}, retrying in {delay:.1f} seconds: {exc}"
+                )
+                await anyio.sleep(delay)
+                continue
+
+            delays = backoff()
+            self.log.info(f"connected to broker at {self.path}")
+
+            async with stream:
+                # rejoin all topics and let their rooms catch up on missed messages
+                if reconnect:
+                    self._dropped.clear()
+                    for topic in list(self._topics):
+                        await stream.send(encode_frame(BusFrame.JOIN, topic))
+                        self._deliver(topic, None)
+
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(self._send, stream)
+                    await self._receive(stream)
+                    tg.cancel_scope.cancel()
+
+            self.log.warning(f"lost connection to broker at {self.path}")
+            reconnect = True
+
+    async def _send(self, stream: ByteStream):
+        """
+        Hook sending queued frames to the broker.
+
+        A frame failing to be sent is kept and sent again after reconnecting.
+        Once the outbox has been emptied, topics with dropped frames are joined again
+        and their rooms are signalled to catch up.
+
+        Arguments:
+            stream: the connection to the broker.
+        """
+        while True:
+            if self._pending is None:
+                if (
+                    self._dropped
+                    and not self._outbox_recv.statistics().current_buffer_used
+                ):
+                    # topics left in the meantime do not need to catch up
+                    dropped = self._dropped & self._topics.keys()
+                    self._dropped.clear()
+
+                    for topic in dropped:
+                        try:
+                            await stream.send(encode_frame(BusFrame.JOIN, topic))
+                        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                            # all topics are joined again after reconnecting
+                            return
+                        self._deliver(topic, None)
+
+                self._pending = await self._outbox_recv.receive()
+
+            try:
+                await stream.send(self._pending)
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                return
+
+            self._pending = None
+
+    async def _receive(self, stream: ByteStream):
+        """
+        Hook receiving messages from the broker until the connection is closed.
+
+        Arguments:
+            stream: the connection to the broker.
+        """
+        buffered = BufferedByteReceiveStream(stream)
+
+        while True:
+            try:
+                frame, topic, message = await receive_frame(buffered)
+            except (
+                anyio.EndOfStream,
+                anyio.IncompleteRead,
+                anyio.BrokenResourceError,
+            ):
+                return
+
+            if frame == BusFrame.PUBLISH:
+                self._deliver(topic, message)
+
+
+class BusBroker(Component):
+    """
+    Broker distributing the messages published by [`UnixSocketBus`][elva.bus.UnixSocketBus] clients on one host.
+
+    Each connection has its own queue of frames to send, so that a slow bus does not delay the others.
+    A bus falling behind by more than [`OUTBOX_SIZE`][elva.bus.OUTBOX_SIZE] frames is disconnected
+    and catches up after reconnecting.
+    """
+
+    path: Path
+    """Path of the Unix domain socket to listen on."""
+
+    _topics: dict[str, set[ByteStream]]
+    """Mapping of topics to the connections joined to them."""
+
+    _outboxes: dict[ByteStream, MemoryObjectSendStream]
+    """Mapping of connections to the streams of frames to send on them."""
+
+    _scopes: dict[ByteStream, anyio.CancelScope]
+    """Mapping of connections to the cancel scopes of their handlers."""
+
+    _listener: SocketListener
+    """Listener accepting connections on [`path`][elva.bus.BusBroker.path]."""
+
+    def __init__(self, path: str | Path):
+        """
+        Arguments:
+            path: path of the Unix domain socket to listen on.
+        """
+        self.path = Path(path)
+        self._topics = dict()
+        self._outboxes = dict()
+        self._scopes = dict()
+
+    async def before(self):
+        """
+        Hook listening on [`path`][elva.bus.BusBroker.path] before the `RUNNING` state is set.
+        """
+        # remove a socket file left over from a previous run
+        self.path.unlink(missing_ok=True)
+
+        self._listener = await anyio.create_unix_listener(self.path)
+        self.log.info(f"listening on {self.path}")
+
+    async def run(self):
+        """
+        Hook accepting and serving connections.
+        """
+        await self._listener.serve(self._handle, task_group=self._task_group)
+
+    async def cleanup(self):
+        """
+        Hook closing the listener and removing the socket file.
+        """
+        await self._listener.aclose()
+        self.path.unlink(missing_ok=True)
+
+    async def _handle(self, stream: ByteStream):
+        """
+        Hook handling the frames of a connection.
+
+        Arguments:
+            stream: the connection to a bus.
+        """
+        send, recv = anyio.create_memory_object_stream(max_buffer_size=OUTBOX_SIZE)
+        buffered = BufferedByteReceiveStream(stream)
+
+        try:
+            async with anyio.create_task_group() as tg:
+                self._outboxes[stream] = send
+                self._scopes[stream] = tg.cancel_scope
+                tg.start_soon(self._send, stream, recv)
+
+                while True:
+                    try:
+                        frame, topic, message = await receive_frame(buffered)
+                    except (
+                        anyio.EndOfStream,
+                        anyio.IncompleteRead,
+                        anyio.BrokenResourceError,
+                    ):
+                        break
+
+                    match frame:
+                        case BusFrame.JOIN:
+                            self._topics.setdefault(topic, set()).add(stream)
+                        case BusFrame.LEAVE:
+                            self._leave(topic, stream)
+                        case BusFrame.PUBLISH:
+                            self._forward(topic, message, stream)
+
+                tg.cancel_scope.cancel()
+        finally:
+            for topic in list(self._topics):
+                self._leave(topic, stream)
+            del self._outboxes[stream]
+            del self._scopes[stream]
+            send.close()
+            await stream.aclose()
+
+    async def _send(self, stream: ByteStream, recv: MemoryObjectReceiveStream):
+        """
+        Hook sending the queued frames of a connection.
+
+        Arguments:
+            stream: the connection to a bus.
+            recv: stream of frames to send on `stream`.
+        """
+        async with recv:
+            async for frame in recv:
+                try:
+                    await stream.send(frame)
+                except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                    # the connection is being closed
+                    return
+
+    def _leave(self, topic: str, stream: ByteStream):
+        """
+        Remove a connection from a topic.
+
+        Arguments:
+            topic: the topic to leave.
+            stream: the connection leaving the topic.
+        """
+        streams = self._topics.get(topic)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self._topics[topic]
+
+    def _forward(self, topic: str, message: bytes, origin: ByteStream):
+        """
+        Queue a published message for all other connections joined to its topic.
+
+        Connections with a full queue are closed.
+
+        Arguments:
+            topic: the topic the message has been published to.
+            message: the published message.
+            origin: the connection the message has been published by.
+        """
+        frame = encode_frame(BusFrame.PUBLISH, topic, message)
+
+        for stream in list(self._topics.get(topic, ())):
+            if stream is origin:
+                continue
+
+            try:
+                self._outboxes[stream].send_nowait(frame)
+            except anyio.WouldBlock:
+                self.log.warning("bus connection is lagging, disconnecting it")
+                for joined in list(self._topics):
+                    self._leave(joined, stream)
+                self._scopes[stream].cancel()
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError, KeyError):
+                # the connection is being closed
+                pass
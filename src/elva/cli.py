@@ -16,7 +16,7 @@ from deepmerge import always_merger
 
 from elva.auth import Password
 from elva.core import APP_NAME, CONFIG_NAME, FILE_SUFFIX, LOG_SUFFIX
-from elva.store import get_metadata
+from elva.store import get_store_class
 
 #
 # CONSTANTS
@@ -95,12 +95,13 @@ def get_composed_decorator(*decorators: Callable) -> Callable:
 #
 
 
-def get_data_file_path(path: Path) -> Path:
+def get_data_file_path(path: Path, suffix: str = FILE_SUFFIX) -> Path:
     """
     Ensure a correct and resolved data file path.
 
     Arguments:
         path: the path to the data file.
+        suffix: the data file suffix of the store writing the data file.
 
     Returns:
         the correct and resolved data file path.
@@ -109,8 +110,8 @@ def get_data_file_path(path: Path) -> Path:
     path = path.resolve()
 
     # append the ELVA data file suffix if necessary
-    if FILE_SUFFIX not in path.suffixes:
-        path = path.with_name(path.name + FILE_SUFFIX)
+    if suffix not in path.suffixes:
+        path = path.with_name(path.name + suffix)
 
     return path
 
@@ -174,22 +175,29 @@ def get_log_file_path(path: Path) -> Path:
 #
 
 
-def read_data_file(path: str | Path) -> dict:
+def read_data_file(path: str | Path, config: None | dict = None) -> dict:
     """
     Get metadata from file as parameter mapping.
 
+    The file is read by the store class picked from `config`, see [`get_store_class`][elva.store.get_store_class],
+    with the store options set in `config`, like SQLite pragmas.
+
     Arguments:
-        path: path where the ELVA SQLite database is stored.
+        path: path where the ELVA data file is stored.
+        config: mapping of configuration parameters to their values.
 
     Returns:
-        parameter mapping stored in the ELVA SQLite database.
+        parameter mapping stored in the ELVA data file.
     """
     try:
-        return get_metadata(path)
+        config = config or dict()
+        store_class = get_store_class(config)
+        return store_class.read_metadata(path, **store_class.get_options(config))
     except (
         FileNotFoundError,
         PermissionError,
         sqlite3.DatabaseError,
+        ValueError,
     ) as exc:
         warn(f"Ignoring {path}: {exc}")
 
@@ -294,6 +302,15 @@ def merge_configs(ctx: click.Context, app: None | str = None) -> dict:
     # config defined in the metadata of an ELVA data file
     file = ctx.params.get("file")
     if file is not None:
+        # the data file suffix depends on the configured store
+        store_class = get_store_class(config | cli)
+        if store_class.suffix != FILE_SUFFIX:
+            file = derive_stem(file, store_class.suffix)
+            if "file" in cli:
+                cli["file"] = file
+            else:
+                config["file"] = file
+
         # derive render and log file paths if not already present
         for param, get_param_path in (
             ("render", get_render_file_path),
@@ -304,7 +321,7 @@ def merge_configs(ctx: click.Context, app: None | str = None) -> dict:
                 config[param] = path
 
         # read in config from data file
-        data_file_config = read_data_file(file)
+        data_file_config = read_data_file(file, config | cli)
         config.update(data_file_config)
 
     # merge with arguments *explicitly* given via CLI
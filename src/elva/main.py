@@ -5,6 +5,7 @@ Subcommands are defined in the respective app package.
 """
 
 import importlib
+import sqlite3
 from pathlib import Path
 
 import click
@@ -15,8 +16,10 @@ from elva.cli import (
     common_options,
     file_paths_option_and_argument,
     pass_config,
+    warn,
 )
-from elva.core import APP_NAME, ELVA_APP_DIR_NAME, get_app_import_path
+from elva.core import APP_NAME, ELVA_APP_DIR_NAME, FILE_SUFFIX, get_app_import_path
+from elva.store import compact_updates, export_rooms, import_rooms
 
 
 @click.group()
@@ -61,6 +64,99 @@ def context(config: dict, *args: tuple, **kwargs: dict):
     click.echo(tomli_w.dumps(config))
 
 
+@elva.command
+@click.option(
+    "--snapshot",
+    "snapshot",
+    help="Write the encoded document state instead of the merged updates.",
+    is_flag=True,
+)
+@click.argument(
+    "paths",
+    metavar="[PATH]...",
+    nargs=-1,
+    type=click.Path(path_type=Path, exists=True),
+)
+def compact(paths: tuple[Path], snapshot: bool):
+    """
+    Merge the updates in ELVA data files into a single one.
+    \f
+
+    Directories are searched for data files non-recursively.
+
+    Arguments:
+        paths: paths to data files or directories containing data files.
+        snapshot: flag whether to write the encoded document state instead of the merged updates.
+    """
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.glob(f"*{FILE_SUFFIX}")))
+        else:
+            files.append(path)
+
+    for file in files:
+        try:
+            num_rows, size = compact_updates(file, snapshot=snapshot)
+        except sqlite3.DatabaseError as exc:
+            warn(f"Ignoring {file}: {exc}")
+        else:
+            click.echo(f"{file}: compacted {num_rows} updates into {size} bytes")
+
+
+@elva.command
+@click.option(
+    "--to",
+    "layout",
+    help=(
+        "Layout to convert to: one data file per document ('files') "
+        "or shared databases as written by 'elva server --shards' ('shards')."
+    ),
+    type=click.Choice(["files", "shards"]),
+    required=True,
+)
+@click.option(
+    "--shards",
+    "shards",
+    metavar="NUMBER",
+    help="Number of shared databases to distribute the documents on.",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+)
+@click.argument(
+    "source",
+    type=click.Path(path_type=Path, exists=True, file_okay=False),
+)
+@click.argument(
+    "target",
+    type=click.Path(path_type=Path, file_okay=False),
+)
+def convert(layout: str, shards: int, source: Path, target: Path):
+    """
+    Convert the documents in a server directory between storage layouts.
+    \f
+
+    Each document is written as a single merged update.
+    Documents already present in TARGET get merged.
+
+    Arguments:
+        layout: the layout to convert to.
+        shards: the number of shared databases when converting to them.
+        source: the directory to read the documents from.
+        target: the directory to write the documents to.
+    """
+    try:
+        if layout == "files":
+            identifiers = export_rooms(source, target)
+        else:
+            identifiers = import_rooms(source, target, shards)
+    except (ValueError, sqlite3.DatabaseError) as exc:
+        raise click.ClickException(str(exc)) from exc
+
+    click.echo(f"converted {len(identifiers)} documents into {target}")
+
+
 ###
 #
 # import `cli` functions of apps
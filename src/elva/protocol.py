@@ -44,23 +44,24 @@ def write_var_uint(num: int) -> list[int]:
     return res
 
 
-def read_var_uint(data: bytes) -> tuple[int, int]:
+def read_var_uint(data: bytes, offset: int = 0) -> tuple[int, int]:
     """
-    Read the first variable unsigned integer in `data`.
+    Read the first variable unsigned integer in `data` starting at `offset`.
 
     Arguments:
         data: data holding the variable unsigned integer.
+        offset: the position in `data` where the variable unsigned integer starts.
 
     Returns:
         a tuple of the decoded variable unsigned integer and its number of bytes
     """
-    # we start at the very first byte/bit of `data`
+    # we start at the very first byte/bit of `data` after `offset`
     uint = 0
     bit = 0
     byte_idx = 0
 
     while True:
-        byte = data[byte_idx]
+        byte = data[offset + byte_idx]
 
         #  byte & 127          <=>  extract the last 7 bits in the current `byte`
         # (byte & 127) << bit  <=>  shift bits in `res` `bit` times to the left
@@ -221,6 +222,50 @@ class Message(YCodec, Enum):
         """
         return super().decode(data, errors=errors)
 
+    @classmethod
+    def peek(cls, message: bytes) -> tuple[Self, int, int]:
+        """
+        Infer the type of the given message and locate its payload without copying any data.
+
+        Arguments:
+            message: the Y protocol message.
+
+        Raises:
+            ValueError: if the message type is unknown or the message is incomplete.
+
+        Returns:
+            A tuple of three objects: the inferred message type of `message`, the start and the end position of the payload in `message`.
+        """
+        try:
+            mb1, offset = read_var_uint(message)
+
+            if mb1 == 1:
+                # awareness message is the only type with a single magic byte
+                magic_bytes = (mb1,)
+            else:
+                mb2, mb2_off = read_var_uint(message, offset)
+                offset += mb2_off
+                magic_bytes = (mb1, mb2)
+
+            length, length_off = read_var_uint(message, offset)
+        except IndexError:
+            raise ValueError(f"Message is not a complete {cls.__name__}") from None
+
+        try:
+            ymsg = cls(magic_bytes)
+        except ValueError:
+            raise ValueError(
+                f"Message with magic bytes {', '.join(map(str, magic_bytes))} is not a valid {cls.__name__}"
+            ) from None
+
+        start = offset + length_off
+        end = start + length
+
+        if end > len(message):
+            raise ValueError(f"Message is not a complete {cls.__name__}")
+
+        return ymsg, start, end
+
     @classmethod
     def infer_and_decode(
         cls, message: bytes, errors: str = "strict"
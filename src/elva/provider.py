@@ -2,25 +2,63 @@
 Module holding provider components.
 """
 
+import json
 import logging
+import math
+import time
+from collections import Counter
 from inspect import Signature, isawaitable, signature
 from typing import Any, Awaitable, Callable, Literal
 from urllib.parse import urlunparse
 
-from anyio import CancelScope, WouldBlock, create_memory_object_stream
-from pycrdt import Doc, Subscription, TransactionEvent
+from anyio import (
+    CancelScope,
+    WouldBlock,
+    create_memory_object_stream,
+    move_on_after,
+    sleep,
+)
+from pycrdt import Doc, Subscription, TransactionEvent, merge_updates
 from websockets.asyncio.client import connect
-from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.exceptions import ConnectionClosed, InvalidStatus, WebSocketException
 
 from elva.awareness import Awareness
 from elva.component import Component, create_component_state
 from elva.protocol import YMessage
+from elva.retry import backoff
+from elva.store import SYNCED_STATE_KEY, Store
 
 WebsocketProviderState = create_component_state(
     "WebsocketProviderState", ("CONNECTED",)
 )
 """The states for the [`WebsocketProvider`][elva.provider.WebsocketProvider] component."""
 
+AWARENESS_INTERVAL = 0.1
+"""Seconds within which local awareness changes are coalesced into a single message."""
+
+STORE_START_TIMEOUT = 5
+"""Seconds to wait for a starting store before syncing without the synced states saved in it."""
+
+
+def get_retry_after(exc: Exception) -> None | float:
+    """
+    Get the number of seconds a server asked to wait before retrying.
+
+    Arguments:
+        exc: the exception raised on connecting.
+
+    Returns:
+        the value of the `Retry-After` header of a rejected handshake in seconds, or `None` if there is none.
+    """
+    if not isinstance(exc, InvalidStatus):
+        return None
+
+    try:
+        return float(exc.response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        # the HTTP-date format is not supported
+        return None
+
 
 class WebsocketProvider(Component):
     """
@@ -56,6 +94,47 @@ class WebsocketProvider(Component):
     _awareness_subscription: str
     """(while running) Identifier for the callback to which changes in [`awareness`][elva.provider.WebsocketProvider.awareness] are sent to ."""
 
+    awareness_interval: None | float
+    """Minimum seconds between two awareness messages, or `None` to send each local awareness change right away."""
+
+    batch_window: None | float
+    """Seconds to wait for further queued messages before sending them as a batch, or `None` to send each message on its own."""
+
+    stats: Counter
+    """Counters of `awareness_sent` messages, of `awareness_coalesced` local changes not sent on their own, of `sync_bytes_sent` with proactive sync step 2 messages, and of `frames_sent` and `frames_saved` by sending batches."""
+
+    synced_states: dict[str, bytes]
+    """
+    Mapping of server URIs to the state vector of [`ydoc`][elva.provider.WebsocketProvider.ydoc] when all queued messages had been sent to the server last.
+
+    Only servers having answered a sync step 1 message with one of their own are included,
+    as only they ask for the changes they are missing.
+    """
+
+    store: None | Store
+    """Store of [`ydoc`][elva.provider.WebsocketProvider.ydoc] to save the [`synced_states`][elva.provider.WebsocketProvider.synced_states] in, or `None` to keep them in memory only."""
+
+    _synced_state_changed: bool
+    """Flag whether the [`synced_states`][elva.provider.WebsocketProvider.synced_states] have changed since they have been saved last."""
+
+    _synced_state_saved: bool
+    """Flag whether the [`synced_states`][elva.provider.WebsocketProvider.synced_states] have been saved on the current connection."""
+
+    _step2_queued: bool
+    """Flag whether the proactive sync step 2 message has been queued on the current connection."""
+
+    _step1_answered: bool
+    """Flag whether the server has answered the sync step 1 message on the current connection with a sync step 2 and a sync step 1 message."""
+
+    _last_received: None | YMessage
+    """Type of the last message received on the current connection."""
+
+    _awareness_sent: float
+    """Monotonic time at which the last awareness message has been queued."""
+
+    _awareness_pending: bool
+    """Flag whether a local awareness change is going to be sent at the end of the current interval."""
+
     def __init__(
         self,
         ydoc: Doc,
@@ -65,6 +144,9 @@ class WebsocketProvider(Component):
         port: int = None,
         safe: bool = True,
         on_exception: Awaitable | None = None,
+        awareness_interval: None | float = AWARENESS_INTERVAL,
+        batch_window: None | float = None,
+        store: None | Store = None,
         **kwargs: dict[Any],
     ):
         """
@@ -75,6 +157,9 @@ class WebsocketProvider(Component):
             port: port of the Y Document synchronizing websocket server.
             safe: flag whether to establish a secured (`True`) or unsecured (`False`) connection.
             on_exception: callback to which the current connection exception and a reference to the connection option mapping is given.
+            awareness_interval: minimum seconds between two awareness messages, see [`_on_awareness_change`][elva.provider.WebsocketProvider._on_awareness_change]. If `None`, each local awareness change is sent right away.
+            batch_window: seconds to wait for further queued messages before sending them as a batch, see [`_batch`][elva.provider.WebsocketProvider._batch]. If `None`, each message is sent on its own.
+            store: store of `ydoc` to save the synced state vector in, so that changes made offline are sent as a single diff after a restart as well. It is expected to be started alongside this provider.
             *args: positional arguments passed to [`connect`][websockets.asyncio.client.connect].
             **kwargs: keyword arguments passed to [`connect`][websockets.asyncio.client.connect].
         """
@@ -100,6 +185,19 @@ class WebsocketProvider(Component):
         # callable attribute
         self.on_exception = on_exception
 
+        self.awareness_interval = awareness_interval
+        self.batch_window = batch_window
+        self.store = store
+        self.stats = Counter()
+        self.synced_states = dict()
+        self._synced_state_changed = False
+        self._synced_state_saved = False
+        self._step2_queued = False
+        self._step1_answered = False
+        self._last_received = None
+        self._awareness_sent = -math.inf
+        self._awareness_pending = False
+
         # buffer for messages to send
         self._buffer_in, self._buffer_out = create_memory_object_stream(
             max_buffer_size=65536
@@ -115,12 +213,41 @@ class WebsocketProvider(Component):
     async def _connect(self):
         """
         Hook running the main connection loop in a shielded cancel scope.
+
+        Failed attempts are retried with delays drawn from [`backoff`][elva.retry.backoff],
+        extended by the time given in a `Retry-After` header of the response.
+        After a closed connection, the first attempt is delayed as well.
         """
-        # accepts only 101 and 3xx HTTP status codes,
-        # retries only on 5xx by default
-        async for self._connection in connect(
-            *self._signature.args, **self._signature.kwargs
-        ):
+        delays = backoff()
+        delay = 0
+
+        while True:
+            await sleep(delay)
+
+            # accepts only 101 and 3xx HTTP status codes,
+            # retries only on 5xx by default
+            connection = connect(*self._signature.args, **self._signature.kwargs)
+            try:
+                self._connection = await connection
+            except Exception as exc:
+                # same semantics as in `async for ... in connect(...)`
+                new_exc = connection.process_exception(exc)
+                if new_exc is exc:
+                    raise
+                if new_exc is not None:
+                    raise new_exc from exc
+
+                delay = next(delays)
+
+                retry_after = get_retry_after(exc)
+                if retry_after is not None:
+                    delay += retry_after
+
+                self.log.info(
+                    f"failed to connect to {self.uri}, retrying in {delay:.1f} seconds: {exc}"
+                )
+                continue
+
             self.log.info(f"opened connection to {self.uri}")
 
             # add `CONNECTED` state
@@ -134,6 +261,10 @@ class WebsocketProvider(Component):
             )
 
             # perform the cross sync
+            self._step2_queued = False
+            self._step1_answered = False
+            self._last_received = None
+            self._synced_state_saved = False
             self._task_group.start_soon(self._on_connect)
 
             # immediately refresh the clock on the own local state, thereby
@@ -165,6 +296,12 @@ class WebsocketProvider(Component):
             self.awareness.unobserve(self._awareness_subscription)
             del self._awareness_subscription
 
+            await self._write_synced_state()
+
+            # start over with short delays
+            delays = backoff()
+            delay = next(delays)
+
     async def _handle_connection(self):
         """
         Hook connecting and listening for incoming data.
@@ -275,19 +412,181 @@ class WebsocketProvider(Component):
             del self._connection
             self.log.info(f"closed connection to {self.uri}")
 
+        await self._write_synced_state()
+
     async def _send(self):
         """
         Hook listening for messages on the internal buffer
         and sending them.
+
+        Once all queued messages including the proactive sync step 2 message have been sent
+        to a server having answered the sync step 1 message,
+        the server is considered to hold all contents of [`ydoc`][elva.provider.WebsocketProvider.ydoc]
+        and its state vector is remembered in [`synced_states`][elva.provider.WebsocketProvider.synced_states].
         """
         self.log.info("listening for outgoing data")
         try:
             async for message in self._buffer_out:
-                await self._connection.send(message)
-                self.log.debug(f"sent message {message}")
+                if self.batch_window is not None:
+                    messages = await self._batch(message)
+                else:
+                    messages = [message]
+
+                for message in messages:
+                    await self._connection.send(message)
+                    self.log.debug(f"sent message {message}")
+                    self.stats["frames_sent"] += 1
+
+                if (
+                    self._step1_answered
+                    and self._step2_queued
+                    and not self._buffer_out.statistics().current_buffer_used
+                ):
+                    self.synced_states[self.options["uri"]] = self.ydoc.get_state()
+                    self._synced_state_changed = True
+
+                    # save the first synced state of a connection right away
+                    # and all later ones on disconnecting
+                    if not self._synced_state_saved:
+                        self._synced_state_saved = True
+                        self._task_group.start_soon(self._write_synced_state)
         except ConnectionClosed:
             pass
 
+    async def _batch(self, message: bytes) -> list[bytes]:
+        """
+        Collect the messages queued after `message` into a batch.
+
+        Messages queued while the connection was busy sending are collected right away,
+        further ones for up to [`batch_window`][elva.provider.WebsocketProvider.batch_window] seconds.
+        Within a batch, all sync update messages are merged into a single one at the position of the first,
+        and only the last awareness message is kept, as it holds the latest local state.
+
+        Arguments:
+            message: the first message of the batch.
+
+        Returns:
+            the messages to send in order.
+        """
+        if self.batch_window > 0:
+            await sleep(self.batch_window)
+
+        messages = [message]
+        while True:
+            try:
+                messages.append(self._buffer_out.receive_nowait())
+            except WouldBlock:
+                break
+
+        if len(messages) == 1:
+            return messages
+
+        batch = list()
+        first_update = None
+        updates = list()
+        awareness = None
+
+        for message in messages:
+            try:
+                message_type, start, end = YMessage.peek(message)
+            except ValueError:
+                batch.append(message)
+                continue
+
+            match message_type:
+                case YMessage.SYNC_UPDATE:
+                    # keep the position of the first update
+                    if first_update is None:
+                        first_update = len(batch)
+                        batch.append(message)
+                    updates.append(message[start:end])
+                case YMessage.AWARENESS:
+                    awareness = message
+                case _:
+                    batch.append(message)
+
+        if len(updates) > 1:
+            batch[first_update], _ = YMessage.SYNC_UPDATE.encode(
+                merge_updates(*updates)
+            )
+
+        if awareness is not None:
+            batch.append(awareness)
+
+        self.stats["frames_saved"] += len(messages) - len(batch)
+        return batch
+
+    async def _load_synced_state(self):
+        """
+        Read the [`synced_states`][elva.provider.WebsocketProvider.synced_states] saved in the [`store`][elva.provider.WebsocketProvider.store].
+
+        A store being started is waited for at most [`STORE_START_TIMEOUT`][elva.provider.STORE_START_TIMEOUT] seconds,
+        as it needs to be running for reading.
+        Without a running store, the whole document is synced.
+        States in memory take precedence over saved ones.
+        """
+        if self.store is None or self.store.states.ACTIVE not in self.store.state:
+            return
+
+        sub = self.store.subscribe()
+        try:
+            with move_on_after(STORE_START_TIMEOUT):
+                while (
+                    self.store.states.ACTIVE in self.store.state
+                    and self.store.states.RUNNING not in self.store.state
+                ):
+                    await sub.receive()
+        finally:
+            self.store.unsubscribe(sub)
+
+        if self.store.states.RUNNING not in self.store.state:
+            self.log.warning("store not running, syncing without synced states")
+            return
+
+        metadata = await self.store.get_metadata()
+
+        try:
+            states = json.loads(metadata.get(SYNCED_STATE_KEY, "{}"))
+            states = {uri: bytes.fromhex(state) for uri, state in states.items()}
+        except (ValueError, TypeError, AttributeError):
+            self.log.warning("ignoring invalid synced states in store")
+            return
+
+        self.synced_states = states | self.synced_states
+        self.log.debug("loaded synced states from store")
+
+    async def _write_synced_state(self):
+        """
+        Write changed [`synced_states`][elva.provider.WebsocketProvider.synced_states] to the [`store`][elva.provider.WebsocketProvider.store] if it is running.
+
+        This happens once per connection after the first sync and on disconnecting,
+        so that stores appending each metadata change, like a [`LogStore`][elva.store.LogStore], do not grow with every message sent.
+        A saved state older than the actual one only enlarges the next proactive sync step 2 message.
+        """
+        if not self._synced_state_changed:
+            return
+
+        if self.store is None or self.store.states.RUNNING not in self.store.state:
+            return
+
+        states = dict(self.synced_states)
+
+        try:
+            await self.store.set_metadata(
+                {
+                    SYNCED_STATE_KEY: json.dumps(
+                        {uri: state.hex() for uri, state in states.items()}
+                    )
+                }
+            )
+        except Exception as exc:
+            # the store might be closing at the same time
+            self.log.warning(f"failed to save synced state: {exc}")
+        else:
+            # states changed while writing are saved next time
+            self._synced_state_changed = self.synced_states != states
+            self.log.debug("saved synced state in store")
+
     async def _recv(self):
         """
         Hook listening for incoming messages on the websocket connection
@@ -324,6 +623,10 @@ class WebsocketProvider(Component):
         When called, updates from origin `local` are encoded as [`AWARENESS`][elva.protocol.YMessage.AWARENESS] update message.
         Messages from every other origin are ignored, as they came from remote and were already applied.
 
+        At most one message is sent per [`awareness_interval`][elva.provider.WebsocketProvider.awareness_interval].
+        Changes within an interval are sent at its end with the latest local state.
+        A removed local state, i.e. a disconnect, is sent right away.
+
         Arguments:
             topic: The categorization of the awareness state change, either `"update"` for all updates, even only renewals, or `"change"` for changes in the state itself.
             change: a tuple of actions (`"added"`, `"updated"`, `"removed"`) and the origin of the awareness state change.
@@ -337,28 +640,77 @@ class WebsocketProvider(Component):
         # the `update` topic includes the `change` topic;
         # `local` origin is hardcoded in `pycrdt._awareness` module
         if topic == "update" and origin == "local":
-            # include all mentioned clients in the update message
-            client_ids = actions["added"] + actions["updated"] + actions["removed"]
+            if (
+                self.awareness.get_local_state() is None
+                or self.awareness_interval is None
+            ):
+                # a pending change is superseded by this one
+                self._awareness_pending = False
+                self._queue_awareness()
+                return
+
+            # the latest state is going to be sent anyways
+            if self._awareness_pending:
+                self.stats["awareness_coalesced"] += 1
+                return
+
+            delay = self._awareness_sent + self.awareness_interval - time.monotonic()
+            if delay <= 0:
+                self._queue_awareness()
+            else:
+                self._awareness_pending = True
+                self._task_group.start_soon(self._queue_awareness_later, delay)
 
-            # encode the awareness update message
-            payload = self.awareness.encode_awareness_update(client_ids)
-            message, _ = YMessage.AWARENESS.encode(payload)
+    def _queue_awareness(self):
+        """
+        Queue an awareness update message holding the current local state.
+        """
+        payload = self.awareness.encode_awareness_update([self.awareness.client_id])
+        message, _ = YMessage.AWARENESS.encode(payload)
 
-            # send the awareness update message
-            self._buffer_in.send_nowait(message)
+        # send the awareness update message
+        self._buffer_in.send_nowait(message)
+        self._awareness_sent = time.monotonic()
+        self.stats["awareness_sent"] += 1
 
-            # log awareness disconnect message separately
-            if self.awareness.get_local_state() is None:
-                self.log.debug("queued disconnect awareness update")
-            else:
-                self.log.debug("queued awareness update")
+        # log awareness disconnect message separately
+        if self.awareness.get_local_state() is None:
+            self.log.debug("queued disconnect awareness update")
+        else:
+            self.log.debug("queued awareness update")
+
+    async def _queue_awareness_later(self, delay: float):
+        """
+        Hook queueing the latest local awareness state at the end of the current interval.
+
+        Arguments:
+            delay: seconds until the end of the current interval.
+        """
+        await sleep(delay)
+
+        if self._awareness_pending:
+            self._awareness_pending = False
+            self._queue_awareness()
 
     async def _on_connect(self):
         """
         Hook initializing cross synchronization.
 
-        When called, it sends a Y sync step 1 message and a Y sync step 2 message with respect to the null state, effectively doing a pro-active cross synchronization.
+        When called, it sends a Y sync step 1 message and a Y sync step 2 message, effectively doing a pro-active cross synchronization.
+
+        The sync step 2 message holds only the changes since the state vector in [`synced_states`][elva.provider.WebsocketProvider.synced_states]
+        for the server, or the whole Y Document if there is none.
+        Messages are not acknowledged by the server, so sent messages might have been lost with the connection,
+        or the server might have lost changes in the meantime.
+        These are sent on answering the sync step 1 message of the server, so only servers having answered one before
+        are in [`synced_states`][elva.provider.WebsocketProvider.synced_states].
+        Others, e.g. broadcasting servers not holding the Y Document, get the whole Y Document.
         """
+        uri = self.options["uri"]
+        if uri not in self.synced_states:
+            await self._load_synced_state()
+        synced_state = self.synced_states.get(uri)
+
         # init sync
         state = self.ydoc.get_state()
         step1, _ = YMessage.SYNC_STEP1.encode(state)
@@ -366,10 +718,18 @@ class WebsocketProvider(Component):
         self.log.debug("queued sync step 1")
 
         # proactive cross sync
-        update = self.ydoc.get_update(b"\x00")
+        update = self.ydoc.get_update(synced_state or b"\x00")
         step2, _ = YMessage.SYNC_STEP2.encode(update)
         await self._buffer_in.send(step2)
-        self.log.debug("queued proactive sync step 2")
+        self._step2_queued = True
+
+        self.stats["sync_bytes_sent"] += len(step2)
+        if synced_state is not None:
+            self.log.debug(
+                f"queued proactive sync step 2 since synced state with {len(step2)} bytes"
+            )
+        else:
+            self.log.debug("queued proactive sync step 2")
 
     async def _on_recv(self, data: bytes):
         """
@@ -387,6 +747,15 @@ class WebsocketProvider(Component):
             self.log.debug(f"failed to infer message: {exc}")
             return
 
+        # the server answers a sync step 1 message with a sync step 2 message
+        # directly followed by a sync step 1 message of its own
+        if (
+            message_type == YMessage.SYNC_STEP1
+            and self._last_received == YMessage.SYNC_STEP2
+        ):
+            self._step1_answered = True
+        self._last_received = message_type
+
         match message_type:
             case YMessage.SYNC_STEP1:
                 await self._on_sync_step1(payload)
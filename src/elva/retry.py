@@ -0,0 +1,41 @@
+"""
+Module holding utilities for retrying failed connection attempts.
+"""
+
+import random
+from typing import Iterator
+
+BACKOFF_INITIAL_DELAY = 1.0
+"""Upper bound in seconds of the first delay before reconnecting."""
+
+BACKOFF_MAX_DELAY = 60.0
+"""Upper bound in seconds of any delay before reconnecting."""
+
+BACKOFF_FACTOR = 2.0
+"""Factor by which the upper bound of the delay grows with each failed attempt."""
+
+
+def backoff(
+    initial_delay: float = BACKOFF_INITIAL_DELAY,
+    max_delay: float = BACKOFF_MAX_DELAY,
+    factor: float = BACKOFF_FACTOR,
+) -> Iterator[float]:
+    """
+    Generate delays between reconnection attempts with exponential backoff and full jitter.
+
+    Each delay is drawn uniformly between zero and an upper bound, which starts at `initial_delay`
+    and grows by `factor` up to `max_delay`.
+    Thereby, clients losing their connection at the same time spread their attempts.
+
+    Arguments:
+        initial_delay: upper bound in seconds of the first delay.
+        max_delay: upper bound in seconds of any delay.
+        factor: factor by which the upper bound grows with each delay.
+
+    Yields:
+        seconds to wait before the next attempt.
+    """
+    delay = initial_delay
+    while True:
+        yield random.uniform(0, delay)
+        delay = min(delay * factor, max_delay)
@@ -2,16 +2,24 @@
 Module containing server components.
 """
 
+import hashlib
 import logging
+import math
 import re
 import socket
-from contextlib import closing
+import time
+from bisect import bisect
+from collections import Counter, deque
+from contextlib import AsyncExitStack, closing
 from http import HTTPStatus
 from pathlib import Path
-from typing import Callable, Iterable
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Iterable, Literal
+from urllib.parse import urlsplit
 
 import anyio
-from pycrdt import Doc
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+from pycrdt import Doc, merge_updates
 from websockets import (
     ConnectionClosed,
     broadcast,
@@ -19,11 +27,14 @@ from websockets import (
 )
 from websockets.asyncio.server import ServerConnection
 from websockets.datastructures import Headers
+from websockets.frames import CloseCode
 from websockets.http11 import Request, Response
 
+from elva.awareness import Awareness
+from elva.bus import Bus
 from elva.component import Component, create_component_state
-from elva.protocol import YMessage
-from elva.store import SQLiteStore
+from elva.protocol import EMPTY_UPDATE, ElvaMessage, YMessage
+from elva.store import ShardedSQLiteDatabase, ShardedSQLiteStore, SQLiteStore, Store
 
 
 def free_tcp_port(host: None | str = None) -> int:
@@ -77,6 +88,21 @@ def free_tcp_port(host: None | str = None) -> int:
 RE_IDENTIFIER = re.compile(r"^[A-Za-z0-9\-_]{10,250}$")
 """Regular expression for a valid Y Doc identifier."""
 
+INGEST_QUEUE_SIZE = 1024
+"""Maximum number of received messages a room queues for batched processing before connections have to wait."""
+
+SYNC_CACHE_SIZE = 16
+"""Maximum number of sync step 2 messages a room caches for distinct state vectors."""
+
+SLOW_CRDT_SECONDS = 0.1
+"""Seconds a single CRDT operation of a room may block the event loop before a warning is logged."""
+
+OUTBOX_SIZE = 64
+"""Maximum number of messages queued for a connection which cannot keep up with the broadcasts of a room."""
+
+SYNC_TIMEOUT = 10
+"""Seconds a new connection may occupy a synchronization slot before sending its first message."""
+
 
 class RequestProcessor:
     """
@@ -115,6 +141,166 @@ RoomState = create_component_state("RoomState")
 """The states of a [`Room`][elva.server.Room] component."""
 
 
+class HashRing:
+    """
+    Consistent hash ring mapping identifiers to nodes.
+
+    Each node is placed on the ring multiple times, so that identifiers are distributed evenly
+    and only a small share of them is mapped to other nodes when nodes are added or removed.
+    """
+
+    nodes: list
+    """Nodes on the ring."""
+
+    replicas: int
+    """Number of places of each node on the ring."""
+
+    _keys: list[int]
+    """Sorted hashes of the places on the ring."""
+
+    _places: dict[int, Any]
+    """Mapping of the hashes of the places on the ring to their nodes."""
+
+    def __init__(self, nodes: Iterable = (), replicas: int = 100):
+        """
+        Arguments:
+            nodes: nodes to place on the ring.
+            replicas: number of places of each node on the ring.
+        """
+        self.nodes = list()
+        self.replicas = replicas
+        self._keys = list()
+        self._places = dict()
+
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        """
+        Hash a key to a place on the ring.
+
+        Arguments:
+            key: the key to hash.
+
+        Returns:
+            the place on the ring.
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, node: Any):
+        """
+        Place a node on the ring.
+
+        Arguments:
+            node: the node to add.
+        """
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            self._places[self._hash(f"{node}-{replica}")] = node
+        self._keys = sorted(self._places)
+
+    def remove(self, node: Any):
+        """
+        Remove a node from the ring.
+
+        Arguments:
+            node: the node to remove.
+        """
+        self.nodes.remove(node)
+        for replica in range(self.replicas):
+            del self._places[self._hash(f"{node}-{replica}")]
+        self._keys = sorted(self._places)
+
+    def get_node(self, identifier: str) -> Any:
+        """
+        Get the node an identifier is mapped to.
+
+        Arguments:
+            identifier: the identifier to look up.
+
+        Raises:
+            LookupError: if there are no nodes on the ring.
+
+        Returns:
+            the first node clockwise from the place of `identifier` on the ring.
+        """
+        if not self._keys:
+            raise LookupError("no nodes on the ring")
+
+        index = bisect(self._keys, self._hash(identifier)) % len(self._keys)
+        return self._places[self._keys[index]]
+
+
+class Outbox:
+    """
+    Queue of messages to a connection whose write buffer is full.
+    """
+
+    messages: deque[bytes]
+    """Messages waiting to be sent in order."""
+
+    size: int
+    """Number of bytes of all queued messages."""
+
+    since: float
+    """Monotonic time at which the connection fell behind."""
+
+    collapses: int
+    """Number of times the queued sync updates have been merged into a single one."""
+
+    scope: anyio.CancelScope
+    """Cancel scope of sending the queued messages, cancelled when the connection is given up."""
+
+    def __init__(self, deadline: float = math.inf):
+        """
+        Arguments:
+            deadline: the time at which the connection is given up if it has not caught up until then.
+        """
+        self.messages = deque()
+        self.size = 0
+        self.since = time.monotonic()
+        self.collapses = 0
+        self.scope = anyio.CancelScope(deadline=deadline)
+
+    @property
+    def lag(self) -> float:
+        """Seconds the connection has been falling behind."""
+        return time.monotonic() - self.since
+
+    def append(self, message: bytes):
+        """
+        Queue a message.
+
+        Arguments:
+            message: the message to queue.
+        """
+        self.messages.append(message)
+        self.size += len(message)
+
+    def popleft(self) -> bytes:
+        """
+        Take the oldest queued message.
+
+        Returns:
+            the oldest queued message.
+        """
+        message = self.messages.popleft()
+        self.size -= len(message)
+        return message
+
+    def replace(self, messages: list[bytes]):
+        """
+        Replace all queued messages.
+
+        Arguments:
+            messages: the messages to queue instead.
+        """
+        self.messages = deque(messages)
+        self.size = sum(len(message) for message in messages)
+
+
 class Room(Component):
     """
     Connection handler for one Y Document following the Yjs protocol.
@@ -132,17 +318,112 @@ class Room(Component):
     clients: set[ServerConnection]
     """Set of active connections."""
 
+    idle_since: None | float
+    """Monotonic time at which the last connection has been removed, `None` while connections are present or joining."""
+
+    joining: int
+    """Number of connections waiting to be added, see [`reserve`][elva.server.Room.reserve]."""
+
     ydoc: Doc
     """Y Document instance holding received updates."""
 
-    store: SQLiteStore
+    size: int
+    """Estimated memory footprint of [`ydoc`][elva.server.Room.ydoc] in bytes as of the last call to [`estimate_size`][elva.server.Room.estimate_size]."""
+
+    store: Store
     """Component responsible for writing received Y updates to disk."""
 
+    store_class: type[Store]
+    """Class of the store saving the Y Document to its own file."""
+
+    store_options: dict
+    """Mapping of keyword arguments passed to [`store_class`][elva.server.Room.store_class]."""
+
+    broadcast_window: None | float
+    """Seconds for which received sync updates are collected and merged before being broadcasted, or `None` to broadcast them immediately."""
+
+    stats: Counter
+    """
+    Counters of the work done by this room, namely
+
+    - `frames_sent` and `frames_saved` by merging sync updates,
+    - `updates_merged` on [`batch_ingest`][elva.server.Room.batch_ingest],
+    - `invalid_messages` closing their connection,
+    - `sync_cache_hits` and `sync_cache_misses` on answering sync step 1 messages,
+    - `crdt_calls` and `crdt_seconds` spent in CRDT operations,
+    - `updates_replicated` from the rooms of other servers,
+    - `slow_connections`, `outbox_collapses` and `slow_disconnects` of connections falling behind,
+    - `awareness_changes` and `awareness_frames` sent.
+    """
+
+    batch_ingest: bool
+    """Flag whether to process all queued messages at once, applying their sync updates merged into a single one."""
+
+    _pending: list[tuple[ServerConnection, bytes]]
+    """Sync updates received within the current broadcast window together with the connection they came from."""
+
+    sync_limiter: None | anyio.CapacityLimiter
+    """Limiter of connections synchronizing with this room at the same time, or `None` if unlimited."""
+
+    _sync_cache: dict[bytes, bytes]
+    """Mapping of state vectors to the sync step 2 messages answering them, valid until the next update is applied."""
+
+    _ingest_send: MemoryObjectSendStream
+    """Stream to queue received messages on for batched processing."""
+
+    _ingest_recv: MemoryObjectReceiveStream
+    """Stream to receive queued messages from for batched processing."""
+
+    _ingested: int
+    """Number of messages queued for batched processing so far."""
+
+    _processed: int
+    """Number of queued messages processed so far."""
+
+    _ingesting: bool
+    """Flag whether queued messages are being processed."""
+
+    _progress: anyio.Event
+    """Event set on processed batches, replaced afterwards."""
+
+    bus: None | Bus
+    """Bus replicating applied sync updates to the rooms of other servers, or `None` if this room is not replicated."""
+
+    outboxes: dict[ServerConnection, Outbox]
+    """Mapping of connections which cannot keep up with the broadcasted messages to the messages queued for them."""
+
+    max_lag: None | float
+    """Seconds after which a connection still falling behind is closed, or `None` to wait for it indefinitely."""
+
+    awareness: Awareness
+    """Awareness states of all clients connected to this room."""
+
+    awareness_interval: None | float
+    """Seconds for which awareness changes are collected before being broadcasted, or `None` to broadcast them immediately."""
+
+    _awareness_clients: dict[ServerConnection, set[int]]
+    """Mapping of connections to the awareness client IDs they have sent states for."""
+
+    _awareness_pending: dict[int, None | ServerConnection]
+    """Awareness client IDs changed within the current interval together with the connection the change came from."""
+
+    _awareness_flush_scheduled: bool
+    """Flag whether the pending awareness changes are going to be broadcasted at the end of the current interval."""
+
     def __init__(
         self,
         identifier: str,
         persistent: bool = False,
         path: None | Path = None,
+        store_options: None | dict = None,
+        database: None | ShardedSQLiteDatabase = None,
+        store_class: type[Store] = SQLiteStore,
+        broadcast_window: None | float = None,
+        batch_ingest: bool = False,
+        max_syncs: None | int = None,
+        bus: None | Bus = None,
+        max_lag: None | float = None,
+        awareness_interval: None | float = None,
     ):
         """
         If `persistent = False` and `path = None`, messages will be broadcasted only.
@@ -151,49 +432,217 @@ class Room(Component):
         If `persistent = True` and `path = None`, a Y Document will be present in this room, saving all incoming Y updates in there. This happens only in volatile memory.
 
         If `persistent = True` and `path = Path(to/some/directory)`, a Y Document will be present and its contents will be saved to disk under the given directory.
-        The name of the corresponding file is derived from [`identifier`][elva.server.Room.identifier].
+        The name of the corresponding file is derived from [`identifier`][elva.server.Room.identifier] and the suffix of `store_class`.
+
+        If `persistent = True` and a `database` is given, the contents are saved to the shared database instead and `path` is ignored.
+
+        If `persistent = True` and a `broadcast_window` is given, sync updates received within this window are merged
+        and sent to each other client as a single frame, see [`flush`][elva.server.Room.flush].
+
+        If `persistent = True` and `batch_ingest = True`, messages are queued with [`ingest`][elva.server.Room.ingest]
+        and all messages queued while the room is busy are processed at once.
+
+        If `persistent = True` and a `bus` is given, sync updates received from clients are published under
+        [`identifier`][elva.server.Room.identifier] and sync updates published by the rooms of other servers
+        are applied and broadcasted, see [`process_replicated`][elva.server.Room.process_replicated].
+
+        If `persistent = True`, awareness states are held in [`awareness`][elva.server.Room.awareness],
+        see [`process_awareness`][elva.server.Room.process_awareness].
 
         Arguments:
             identifier: identifier for the used Y Document.
             persistent: flag whether to store received Y Document updates.
             path: path where to save a Y Document on disk.
+            store_options: mapping of keyword arguments passed to `store_class`, e.g. for group commits.
+            database: running database component shared by all rooms.
+            store_class: class of the store saving the Y Document to its own file.
+            broadcast_window: seconds for which received sync updates are collected and merged before being broadcasted. If `None`, they are broadcasted immediately.
+            batch_ingest: flag whether to process all queued messages at once, applying their sync updates merged into a single one.
+            max_syncs: maximum number of connections synchronizing with this room at the same time. If `None`, the number is unlimited.
+            bus: running bus component shared by all rooms.
+            max_lag: seconds after which a connection still falling behind is closed, see [`broadcast`][elva.server.Room.broadcast]. If `None`, it is waited for indefinitely.
+            awareness_interval: seconds for which awareness changes are collected before being broadcasted. If `None`, they are broadcasted immediately.
         """
         self.identifier = identifier
         self.persistent = persistent
+        self.store_class = store_class
+        self.store_options = store_options or dict()
+        self.broadcast_window = broadcast_window
+        self.batch_ingest = persistent and batch_ingest
+        self.bus = bus if persistent else None
+        self.max_lag = max_lag
+        self.awareness_interval = awareness_interval
+
+        if max_syncs is not None:
+            self.sync_limiter = anyio.CapacityLimiter(max_syncs)
+        else:
+            self.sync_limiter = None
 
         if path is not None:
-            self.path = path / f"{identifier}.y"
+            self.path = path / f"{identifier}{store_class.suffix}"
         else:
             self.path = None
 
         self.clients = set()
+        self.idle_since = time.monotonic()
+        self.joining = 0
+        self.size = 0
+        self.stats = Counter()
+        self._pending = list()
+        self._sync_cache = dict()
+        self.outboxes = dict()
+        self._awareness_clients = dict()
+        self._awareness_pending = dict()
+        self._awareness_flush_scheduled = False
+        self._ingested = 0
+        self._processed = 0
+        self._ingesting = False
+        self._progress = anyio.Event()
 
         if persistent:
             self.ydoc = Doc()
-            if path is not None:
-                self.store = SQLiteStore(self.ydoc, identifier, self.path)
+
+            # the room has no awareness state of its own
+            self.awareness = Awareness(self.ydoc)
+            self.awareness.remove_awareness_states(
+                [self.awareness.client_id], origin="local"
+            )
+            self.awareness.observe(self._on_awareness_update)
+            if database is not None:
+                self.store = ShardedSQLiteStore(self.ydoc, identifier, database)
+            elif path is not None:
+                self.store = store_class(
+                    self.ydoc, identifier, self.path, **self.store_options
+                )
 
     @property
     def states(self) -> RoomState:
         """The states this component can have."""
         return RoomState
 
+    @property
+    def evictable(self) -> bool:
+        """
+        Flag whether this room can be dropped from memory without losing content.
+
+        This is the case when nothing is held in memory at all or when all
+        content is written to disk.
+        """
+        return not self.persistent or hasattr(self, "store")
+
+    def estimate_size(self) -> int:
+        """
+        Estimate the memory footprint of [`ydoc`][elva.server.Room.ydoc] from the size of its encoded state.
+
+        The result is cached in [`size`][elva.server.Room.size].
+
+        Returns:
+            the estimated footprint in bytes.
+        """
+        if hasattr(self, "ydoc"):
+            self.size = len(self._crdt(self.ydoc.get_update))
+
+        return self.size
+
     async def before(self):
         """
         Hook runnig before the `RUNNING` state is set.
 
-        Used to start the Y Document store.
+        Used to start the Y Document store and the awareness, and to catch up with the rooms of other servers.
         """
         if hasattr(self, "store"):
             await self._task_group.start(self.store.start)
 
+        # the awareness only needs to run for removing outdated states
+        if hasattr(self, "awareness"):
+            self._task_group.start_soon(self.awareness.start)
+
+        if self.bus is not None:
+            recv = await self.bus.join(self.identifier)
+            self._task_group.start_soon(self._receive_replicated, recv)
+            self._publish_state()
+
+        if self.batch_ingest:
+            self._ingest_send, self._ingest_recv = anyio.create_memory_object_stream(
+                max_buffer_size=INGEST_QUEUE_SIZE
+            )
+            self._ingesting = True
+
+    async def run(self):
+        """
+        Hook running after the `RUNNING` state is set.
+
+        Used to process queued messages in batches.
+        """
+        if not self.batch_ingest:
+            return
+
+        try:
+            async for item in self._ingest_recv:
+                # take all messages which have been queued in the meantime
+                batch = [item] + self._receive_queued()
+                await self.process_batch(batch)
+
+                self._processed += len(batch)
+                self._notify()
+        finally:
+            self._ingesting = False
+            self._notify()
+
+    def _notify(self):
+        """
+        Wake up all connections waiting for their queued messages to be processed.
+        """
+        self._progress.set()
+        self._progress = anyio.Event()
+
+    def _receive_queued(self) -> list[tuple[bytes, ServerConnection]]:
+        """
+        Take all messages currently queued for batched processing.
+
+        Returns:
+            the queued messages together with the connection they came from.
+        """
+        batch = list()
+
+        while True:
+            try:
+                batch.append(self._ingest_recv.receive_nowait())
+            except anyio.WouldBlock:
+                return batch
+
     async def cleanup(self):
         """
         Hook running after the component got cancelled and before it states become unset to `NONE`.
 
-        Used to close all client connections gracefully.
-        The store is closed automatically and calls its cleanup method separately.
+        Used to send pending sync updates and to close all client connections gracefully.
+        The store is closed automatically and calls its cleanup method separately,
+        but we wait for it to finish so that all updates are on disk when this room
+        is stopped.
         """
+        if self.batch_ingest:
+            # process messages which have been queued but not processed yet
+            await self.process_batch(self._receive_queued())
+            self._ingest_recv.close()
+
+        if self.bus is not None:
+            await self.bus.leave(self.identifier)
+
+        self.flush()
+
+        if self.stats["frames_saved"]:
+            self.log.info(
+                f"saved {self.stats['frames_saved']} of "
+                f"{self.stats['frames_saved'] + self.stats['frames_sent']} frames "
+                "by merging sync updates"
+            )
+
+        if self.stats["crdt_calls"]:
+            self.log.info(
+                f"spent {self.stats['crdt_seconds']:.3f} seconds "
+                f"in {self.stats['crdt_calls']} CRDT operations"
+            )
+
         clients = self.clients.copy()
         async with anyio.create_task_group() as tg:
             for client in clients:
@@ -207,6 +656,30 @@ class Room(Component):
 
         self.log.info("closed all connections")
 
+        if hasattr(self, "store"):
+            sub = self.store.subscribe()
+            while self.store.states.ACTIVE in self.store.state:
+                await sub.receive()
+            self.store.unsubscribe(sub)
+
+    def reserve(self):
+        """
+        Keep this room from becoming idle while a connection waits to be added.
+
+        Every call needs to be followed by a call to [`release`][elva.server.Room.release].
+        """
+        self.joining += 1
+        self.idle_since = None
+
+    def release(self):
+        """
+        Release a reservation made with [`reserve`][elva.server.Room.reserve].
+        """
+        self.joining -= 1
+
+        if not self.clients and not self.joining:
+            self.idle_since = time.monotonic()
+
     def add(self, client: ServerConnection):
         """
         Add a client connection.
@@ -216,6 +689,7 @@ class Room(Component):
         """
         nclients = len(self.clients)
         self.clients.add(client)
+        self.idle_since = None
         if nclients < len(self.clients):
             self.log.info(f"added connection {id(client)}")
 
@@ -224,106 +698,748 @@ class Room(Component):
         Remove a client connection.
 
         Arguments:
-            client: connection to remove from the list of connections.
+            client: connection to remove from the list of connections.
+        """
+        self.clients.remove(client)
+        self.log.info(f"removed connection {id(client)}")
+
+        # let the other clients drop the states of this connection
+        client_ids = self._awareness_clients.pop(client, None)
+        if client_ids:
+            self.awareness.remove_awareness_states(list(client_ids), origin=client)
+
+        if not self.clients and not self.joining:
+            self.idle_since = time.monotonic()
+
+    def broadcast(self, data: bytes, client: ServerConnection):
+        """
+        Broadcast `data` to all clients except `client`.
+
+        Messages are written to the connections directly as long as they keep up.
+        Once the write buffer of a connection is full, its messages are queued in an [`Outbox`][elva.server.Outbox] instead, see [`send`][elva.server.Room.send].
+
+        Arguments:
+            data: data to send.
+            client: connection from which `data` came and thus to exclude from broadcasting.
+        """
+        # no other client to send to
+        if len(self.clients) < 2:
+            return
+
+        # `send` is synchronous, so iterating the clients directly
+        # instead of a copy is safe
+        self.send((other for other in self.clients if other is not client), data)
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            client_ids = set(id(other) for other in self.clients if other is not client)
+            self.log.debug(f"broadcasted {data} from {id(client)} to {client_ids}")
+
+    def send(self, clients: Iterable[ServerConnection], message: bytes):
+        """
+        Send a message to the given clients without waiting for them.
+
+        Connections which cannot keep up get their messages queued and sent in a separate task.
+        When more than [`OUTBOX_SIZE`][elva.server.OUTBOX_SIZE] messages are queued, the queued sync updates are merged into a single one.
+        Connections falling behind for longer than [`max_lag`][elva.server.Room.max_lag] seconds, or still having too many messages queued after merging, are closed.
+        They catch up by synchronizing again on reconnect.
+
+        Arguments:
+            clients: the connections to send `message` to.
+            message: the message to send.
+        """
+        direct = list()
+
+        for client in clients:
+            outbox = self.outboxes.get(client)
+
+            # the write buffer is above its high-water mark
+            if outbox is None and client.paused:
+                deadline = math.inf
+                if self.max_lag is not None:
+                    deadline = anyio.current_time() + self.max_lag
+
+                outbox = self.outboxes[client] = Outbox(deadline)
+                self.stats["slow_connections"] += 1
+                self._task_group.start_soon(self._drain, client, outbox)
+
+            if outbox is None:
+                direct.append(client)
+                continue
+
+            # the connection is being closed
+            if outbox.scope.cancel_called:
+                continue
+
+            outbox.append(message)
+            if len(outbox.messages) > OUTBOX_SIZE:
+                self._collapse(outbox)
+                if len(outbox.messages) > OUTBOX_SIZE:
+                    outbox.scope.cancel()
+
+        # TODO: set raise_exceptions=True and catch with ExceptionGroup
+        broadcast(direct, message)
+
+    def _collapse(self, outbox: Outbox):
+        """
+        Merge the sync updates queued in an outbox into a single sync update message.
+
+        Arguments:
+            outbox: the outbox of a connection falling behind.
+        """
+        updates = list()
+        others = list()
+
+        for message in outbox.messages:
+            try:
+                message_type, start, end = YMessage.peek(message)
+            except ValueError:
+                others.append(message)
+                continue
+
+            if message_type in (YMessage.SYNC_UPDATE, YMessage.SYNC_STEP2):
+                updates.append(message[start:end])
+            else:
+                others.append(message)
+
+        if len(updates) < 2:
+            return
+
+        message, _ = YMessage.SYNC_UPDATE.encode(self._crdt(merge_updates, *updates))
+        outbox.replace([message] + others)
+        outbox.collapses += 1
+        self.stats["outbox_collapses"] += 1
+
+    async def _drain(self, client: ServerConnection, outbox: Outbox):
+        """
+        Hook sending the queued messages to a connection until it has caught up.
+
+        Arguments:
+            client: the connection falling behind.
+            outbox: the messages queued for `client`.
+        """
+        try:
+            with outbox.scope:
+                while outbox.messages:
+                    # waits for the write buffer to drain
+                    await client.send(outbox.popleft())
+
+            if outbox.scope.cancelled_caught:
+                self.stats["slow_disconnects"] += 1
+                self.log.warning(
+                    f"closing connection {id(client)} falling behind for {outbox.lag:.1f} seconds "
+                    f"with {len(outbox.messages)} queued messages"
+                )
+                outbox.replace([])
+
+                with anyio.move_on_after(client.close_timeout) as scope:
+                    await client.close(CloseCode.TRY_AGAIN_LATER, "falling behind")
+
+                # the close frame cannot be written either
+                if scope.cancelled_caught:
+                    client.transport.abort()
+        except ConnectionClosed:
+            pass
+        finally:
+            del self.outboxes[client]
+
+    def lag_statistics(self) -> dict[int, dict[str, float | int]]:
+        """
+        Statistics of the connections currently falling behind.
+
+        Returns:
+            a mapping of connection IDs to their `lag` in seconds and the number of `messages`, `bytes` and `collapses` of their outbox.
+        """
+        return {
+            id(client): dict(
+                lag=outbox.lag,
+                messages=len(outbox.messages),
+                bytes=outbox.size,
+                collapses=outbox.collapses,
+            )
+            for client, outbox in self.outboxes.items()
+        }
+
+    async def ingest(self, data: bytes, client: ServerConnection, wait: bool = False):
+        """
+        Queue data received from a client for being processed in a batch.
+
+        If [`batch_ingest`][elva.server.Room.batch_ingest] is not set, `data` is processed right away.
+
+        Arguments:
+            data: data received from `client`.
+            client: connection from which `data` was received.
+            wait: flag whether to return only after queued `data` has been processed.
+        """
+        if self.batch_ingest:
+            self._ingested += 1
+            target = self._ingested
+
+            try:
+                await self._ingest_send.send((data, client))
+            except anyio.BrokenResourceError:
+                # the room has been stopped
+                return
+
+            if wait:
+                while self._ingesting and self._processed < target:
+                    await self._progress.wait()
+        else:
+            await self.process(data, client)
+
+    async def process_batch(self, batch: list[tuple[bytes, ServerConnection]]):
+        """
+        Process a batch of Y messages in order.
+
+        Consecutive sync updates are merged, applied to [`ydoc`][elva.server.Room.ydoc]
+        in a single transaction and broadcasted once.
+        Any other message is processed after all sync updates before it have been applied.
+
+        Arguments:
+            batch: Y messages together with the connection they came from.
+        """
+        updates = list()
+
+        for data, client in batch:
+            try:
+                message_type, start, end = YMessage.peek(data)
+            except ValueError:
+                continue
+
+            if message_type in (YMessage.SYNC_UPDATE, YMessage.SYNC_STEP2):
+                update = data[start:end]
+                if update != EMPTY_UPDATE:
+                    updates.append((client, update))
+                continue
+
+            if updates:
+                self._apply_updates(updates)
+                updates = list()
+
+            try:
+                await self.process(data, client)
+            except ValueError as exc:
+                self._reject(client, exc)
+
+        if updates:
+            self._apply_updates(updates)
+
+    def _apply_updates(self, updates: list[tuple[ServerConnection, bytes]]):
+        """
+        Apply sync updates merged into a single one and broadcast them.
+
+        If the updates cannot be merged or applied, they are applied one by one instead
+        and the connections having sent invalid ones are closed.
+
+        Arguments:
+            updates: sync updates together with the connection they came from.
+        """
+        try:
+            if len(updates) == 1:
+                update = updates[0][1]
+            else:
+                update = self._crdt(merge_updates, *(update for _, update in updates))
+
+            self._apply_update(update)
+        except ValueError:
+            valid = list()
+
+            for client, update in updates:
+                try:
+                    self._apply_update(update)
+                except ValueError as exc:
+                    self._reject(client, exc)
+                else:
+                    self._publish_update(update)
+                    valid.append((client, update))
+
+            if valid:
+                self._broadcast_updates(valid)
+            return
+
+        if len(updates) > 1:
+            self.stats["updates_merged"] += len(updates)
+
+        self._publish_update(update)
+        self._broadcast_updates(updates)
+
+    def _reject(self, client: ServerConnection, exc: ValueError):
+        """
+        Close a connection having sent a message which could not be processed.
+
+        Messages are processed in the task of this room on [`batch_ingest`][elva.server.Room.batch_ingest],
+        so the error is not raised in the connection handler.
+
+        Arguments:
+            client: the connection the message came from.
+            exc: the error raised on processing the message.
+        """
+        self.stats["invalid_messages"] += 1
+        self.log.warning(
+            f"closing connection {id(client)} after invalid message: {exc}"
+        )
+        self._task_group.start_soon(
+            client.close, CloseCode.INVALID_DATA, "invalid message"
+        )
+
+    async def process(self, data: bytes, client: ServerConnection):
+        """
+        Process incoming messages from `client`.
+
+        If `persistent = False`, just call [`broadcast(data, client)`][elva.server.Room.broadcast].
+
+        If `persistent = True`, `data` is assumed to be a Y message and its type and payload are located with [`YMessage.peek`][elva.protocol.Message.peek].
+        Actions are taken according to the [Yjs protocol spec](https://github.com/yjs/y-protocols/blob/master/PROTOCOL.md).
+        Sync update and awareness messages are relayed to the other clients as received,
+        so only the update payload is copied for being applied.
+
+        Arguments:
+            data: data received from `client`.
+            client: connection from which `data` was received.
+        """
+        if self.persistent:
+            # properly dispatch message
+            try:
+                message_type, start, end = YMessage.peek(data)
+            except ValueError:
+                return
+
+            match message_type:
+                case YMessage.SYNC_UPDATE:
+                    await self.process_sync_update(data[start:end], client, data)
+                case YMessage.AWARENESS:
+                    await self.process_awareness(data[start:end], client)
+                case YMessage.SYNC_STEP1:
+                    await self.process_sync_step1(data[start:end], client)
+                case YMessage.SYNC_STEP2:
+                    await self.process_sync_update(data[start:end], client)
+        else:
+            # simply forward incoming messages to all other clients
+            self.broadcast(data, client)
+
+    async def process_sync_step1(self, state: bytes, client: ServerConnection):
+        """
+        Process a sync step 1 payload `state` from `client`.
+
+        Answer it with a sync step 2.
+        Also, start a reactive cross-sync by answering with a sync step 1 additionally.
+
+        The answers are sent with [`send`][elva.server.Room.send] without waiting for `client`,
+        so a connection not reading them does not hold up processing the messages of the other connections.
+
+        Arguments:
+            state: payload of the received sync step 1 message from `client`.
+            client: connection from which the sync step 1 message came.
+        """
+        # answer with sync step 2, which is the same for clients with equal state
+        # as long as no update has been applied
+        message = self._sync_cache.get(state)
+        if message is None:
+            self.stats["sync_cache_misses"] += 1
+
+            update = self._crdt(self.ydoc.get_update, state)
+            message, _ = YMessage.SYNC_STEP2.encode(update)
+
+            if len(self._sync_cache) >= SYNC_CACHE_SIZE:
+                # drop the oldest entry
+                del self._sync_cache[next(iter(self._sync_cache))]
+            self._sync_cache[bytes(state)] = message
+        else:
+            self.stats["sync_cache_hits"] += 1
+
+        self.send((client,), message)
+
+        # reactive cross sync
+        state = self._crdt(self.ydoc.get_state)
+        message, _ = YMessage.SYNC_STEP1.encode(state)
+        self.send((client,), message)
+
+        # let the client know about all other clients right away
+        own = self._awareness_clients.get(client, ())
+        client_ids = [
+            client_id
+            for client_id in self.awareness.client_states
+            if client_id not in own
+        ]
+        if client_ids:
+            self.send((client,), self._encode_awareness(client_ids))
+
+    def _crdt(self, func: Callable, *args: tuple) -> Any:
+        """
+        Call a CRDT operation and account the time it blocks the event loop.
+
+        pycrdt holds the global interpreter lock while operating on updates,
+        so the time is spent on the event loop even when the call is moved to a worker thread.
+        A warning is logged for calls taking longer than [`SLOW_CRDT_SECONDS`][elva.server.SLOW_CRDT_SECONDS].
+
+        Arguments:
+            func: the pycrdt function or method to call.
+            args: positional arguments passed to `func`.
+
+        Returns:
+            the return value of `func`.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats["crdt_calls"] += 1
+            self.stats["crdt_seconds"] += seconds
+
+            if seconds > SLOW_CRDT_SECONDS:
+                self.log.warning(
+                    f"{func.__name__} blocked the event loop for {seconds:.3f} seconds"
+                )
+
+    def _apply_update(self, update: bytes):
+        """
+        Apply an update to [`ydoc`][elva.server.Room.ydoc] and invalidate the cached sync step 2 messages.
+
+        Arguments:
+            update: the update to apply.
+        """
+        self._crdt(self.ydoc.apply_update, update)
+        self._sync_cache.clear()
+
+    async def process_sync_update(
+        self, update: bytes, client: ServerConnection, message: None | bytes = None
+    ):
+        """
+        Process a sync update message payload `update` from `client`.
+
+        Apply the update to the internal [`ydoc`][elva.server.Room.ydoc] instance and broadcast the same update to all other clients than `client`.
+
+        Arguments:
+            update: payload of the received sync update message from `client`.
+            client: connection from which the sync update message came.
+            message: the received sync update message to relay unchanged. If `None`, it is encoded from `update`.
+        """
+        if update != EMPTY_UPDATE:
+            # pycrdt requires `bytes`, so the payload cannot be a view on `message`
+            self._apply_update(update)
+            self._publish_update(update)
+
+            if self.broadcast_window is not None:
+                self._broadcast_updates([(client, update)])
+                return
+
+            if message is None:
+                message, _ = YMessage.SYNC_UPDATE.encode(update)
+
+            # selectively broadcast to all other clients
+            self.broadcast(message, client)
+
+    async def _flush_after_window(self):
+        """
+        Hook flushing the pending sync updates at the end of the current broadcast window.
+        """
+        await anyio.sleep(self.broadcast_window)
+        self.flush()
+
+    def flush(self):
+        """
+        Broadcast the sync updates received within the current broadcast window.
+        """
+        if not self._pending:
+            return
+
+        pending = self._pending
+        self._pending = list()
+
+        self._send_updates(pending)
+
+    def _broadcast_updates(self, updates: list[tuple[ServerConnection, bytes]]):
+        """
+        Broadcast applied sync updates right away or at the end of the current broadcast window.
+
+        Arguments:
+            updates: sync updates together with the connection they came from.
+        """
+        if self.broadcast_window is None:
+            self._send_updates(updates)
+            return
+
+        # open a new window with the first update
+        if not self._pending:
+            self._task_group.start_soon(self._flush_after_window)
+
+        self._pending.extend(updates)
+
+    def _send_updates(self, pending: list[tuple[ServerConnection, bytes]]):
+        """
+        Send sync updates to all clients.
+
+        Each client receives a single sync update message merged from all given updates
+        except the ones it has sent itself.
+        Clients which have not sent any of the updates share the same message.
+
+        Arguments:
+            pending: sync updates together with the connection they came from.
+        """
+        # the number of frames sent without merging
+        frames = sum(
+            len(self.clients) - (client in self.clients) for client, _ in pending
+        )
+
+        senders = set(client for client, _ in pending)
+        recipients = [client for client in self.clients if client not in senders]
+
+        sent = 0
+
+        if recipients:
+            message = self._merge_pending(pending)
+            self.send(recipients, message)
+            sent += len(recipients)
+
+        for sender in senders & self.clients:
+            updates = [
+                (client, update) for client, update in pending if client is not sender
+            ]
+            if updates:
+                self.send((sender,), self._merge_pending(updates))
+                sent += 1
+
+        self.stats["frames_sent"] += sent
+        self.stats["frames_saved"] += frames - sent
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(
+                f"broadcasted {len(pending)} merged updates in {sent} instead of {frames} frames"
+            )
+
+    def _merge_pending(self, pending: list[tuple[ServerConnection, bytes]]) -> bytes:
+        """
+        Merge pending sync updates into a single sync update message.
+
+        Arguments:
+            pending: sync updates together with the connection they came from.
+
+        Returns:
+            the encoded sync update message.
+        """
+        if len(pending) == 1:
+            update = pending[0][1]
+        else:
+            update = self._crdt(merge_updates, *(update for _, update in pending))
+
+        message, _ = YMessage.SYNC_UPDATE.encode(update)
+        return message
+
+    async def process_awareness(self, state: bytes, client: ServerConnection):
+        """
+        Process an awareness message payload `state` from `client`.
+
+        The awareness update is applied to [`awareness`][elva.server.Room.awareness],
+        and only the latest states of changed clients are broadcasted, see [`flush_awareness`][elva.server.Room.flush_awareness].
+
+        Arguments:
+            state: payload of the received awareness message from `client`.
+            client: connection from which the awareness message came.
         """
-        self.clients.remove(client)
-        self.log.info(f"removed connection {id(client)}")
+        try:
+            self.awareness.apply_awareness_update(state, client)
+        except (ValueError, IndexError):
+            self.log.debug(f"ignored invalid awareness update from {id(client)}")
 
-    def broadcast(self, data: bytes, client: ServerConnection):
+    def _on_awareness_update(self, topic: str, args: tuple[dict[str, Any], Any]):
         """
-        Broadcast `data` to all clients except `client`.
+        Hook called on changes of [`awareness`][elva.server.Room.awareness].
+
+        The changed client IDs are broadcasted right away or at the end of the current [`awareness_interval`][elva.server.Room.awareness_interval].
 
         Arguments:
-            data: data to send.
-            client: connection from which `data` came and thus to exclude from broadcasting.
+            topic: the kind of awareness event.
+            args: the changed client IDs and the origin of the change, a connection for received updates.
         """
-        # copy current state of clients and remove calling client
-        clients = self.clients.copy()
-        clients.remove(client)
+        if topic != "update":
+            return
 
-        if clients:
-            # broadcast to all other clients
-            # TODO: set raise_exceptions=True and catch with ExceptionGroup
-            broadcast(clients, data)
-            client_ids = set(id(client) for client in clients)
-            self.log.debug(f"broadcasted {data} from {id(client)} to {client_ids}")
+        changes, origin = args
+        client = None if isinstance(origin, str) else origin
 
-    async def process(self, data: bytes, client: ServerConnection):
+        if client in self.clients:
+            self._awareness_clients.setdefault(client, set()).update(
+                changes["added"] + changes["updated"]
+            )
+
+        self.stats["awareness_changes"] += 1
+        for client_id in changes["added"] + changes["updated"] + changes["removed"]:
+            self._awareness_pending[client_id] = client
+
+        if self.awareness_interval is None:
+            self.flush_awareness()
+        elif not self._awareness_flush_scheduled:
+            self._awareness_flush_scheduled = True
+            self._task_group.start_soon(self._flush_awareness_after_interval)
+
+    async def _flush_awareness_after_interval(self):
         """
-        Process incoming messages from `client`.
+        Hook flushing the pending awareness changes at the end of the current interval.
+        """
+        try:
+            await anyio.sleep(self.awareness_interval)
+        finally:
+            self._awareness_flush_scheduled = False
 
-        If `persistent = False`, just call [`broadcast(data, client)`][elva.server.Room.broadcast].
+        self.flush_awareness()
 
-        If `persistent = True`, `data` is assumed to be a Y message and tried to be decomposed.
-        On successful decomposition, actions are taken according to the [Yjs protocol spec](https://github.com/yjs/y-protocols/blob/master/PROTOCOL.md).
+    def flush_awareness(self):
+        """
+        Broadcast the latest states of all clients changed since the last call.
 
-        Arguments:
-            data: data received from `client`.
-            client: connection from which `data` was received.
+        Each connection receives a single awareness message for all changed clients except the ones it has sent itself.
         """
-        if self.persistent:
-            # properly dispatch message
-            try:
-                message_type, payload, _ = YMessage.infer_and_decode(data)
-            except ValueError:
-                return
+        if not self._awareness_pending:
+            return
+
+        pending = self._awareness_pending
+        self._awareness_pending = dict()
+
+        origins = set(pending.values())
+        recipients = [client for client in self.clients if client not in origins]
+
+        if recipients:
+            self.send(recipients, self._encode_awareness(list(pending)))
+            self.stats["awareness_frames"] += len(recipients)
+
+        for origin in origins & self.clients:
+            client_ids = [
+                client_id
+                for client_id, client in pending.items()
+                if client is not origin
+            ]
+            if client_ids:
+                self.send((origin,), self._encode_awareness(client_ids))
+                self.stats["awareness_frames"] += 1
+
+    def _encode_awareness(self, client_ids: list[int]) -> bytes:
+        """
+        Encode an awareness message holding the latest states of the given clients.
 
-            match message_type:
-                case YMessage.SYNC_STEP1:
-                    await self.process_sync_step1(payload, client)
-                case YMessage.SYNC_STEP2 | YMessage.SYNC_UPDATE:
-                    await self.process_sync_update(payload, client)
-                case YMessage.AWARENESS:
-                    await self.process_awareness(payload, client)
-        else:
-            # simply forward incoming messages to all other clients
-            self.broadcast(data, client)
+        Arguments:
+            client_ids: the awareness client IDs to include.
 
-    async def process_sync_step1(self, state: bytes, client: ServerConnection):
+        Returns:
+            the encoded awareness message.
         """
-        Process a sync step 1 payload `state` from `client`.
+        update = self.awareness.encode_awareness_update(client_ids)
+        message, _ = YMessage.AWARENESS.encode(update)
+        return message
 
-        Answer it with a sync step 2.
-        Also, start a reactive cross-sync by answering with a sync step 1 additionally.
+    def _publish_update(self, update: bytes):
+        """
+        Publish a sync update received from a client to the rooms of other servers.
 
         Arguments:
-            state: payload of the received sync step 1 message from `client`.
-            client: connection from which the sync step 1 message came.
+            update: the applied sync update.
         """
-        # answer with sync step 2
-        update = self.ydoc.get_update(state)
-        message, _ = YMessage.SYNC_STEP2.encode(update)
-        await client.send(message)
+        if self.bus is not None:
+            message, _ = YMessage.SYNC_UPDATE.encode(update)
+            self.bus.publish(self.identifier, message)
 
-        # reactive cross sync
-        state = self.ydoc.get_state()
+    def _publish_state(self):
+        """
+        Publish the state vector of [`ydoc`][elva.server.Room.ydoc] for catching up with the rooms of other servers.
+        """
+        state = self._crdt(self.ydoc.get_state)
         message, _ = YMessage.SYNC_STEP1.encode(state)
-        await client.send(message)
+        self.bus.publish(self.identifier, message)
 
-    async def process_sync_update(self, update: bytes, client: ServerConnection):
+    async def _receive_replicated(self, recv: MemoryObjectReceiveStream):
         """
-        Process a sync update message payload `update` from `client`.
-
-        Apply the update to the internal [`ydoc`][elva.server.Room.ydoc] instance and broadcast the same update to all other clients than `client`.
+        Hook processing the messages published by the rooms of other servers.
 
         Arguments:
-            update: payload of the received sync update message from `client`.
-            client: connection from which the sync update message came.
+            recv: stream of messages published under [`identifier`][elva.server.Room.identifier].
+        """
+        async with recv:
+            async for message in recv:
+                if message is None:
+                    # messages might have been lost, so catch up again
+                    self._publish_state()
+                else:
+                    self.process_replicated(message)
+
+    def process_replicated(self, message: bytes):
         """
-        if update != b"\x00\x00":
-            self.ydoc.apply_update(update)
+        Process a message published by the room of another server.
 
-            # reencode sync update message and selectively broadcast
-            # to all other clients
-            message, _ = YMessage.SYNC_UPDATE.encode(update)
-            self.broadcast(message, client)
+        A sync step 1 is answered with a cross-sync message holding the own state vector and the update missing in the state vector received.
+        The update in a cross-sync message is applied and the other room's missing update is published as sync step 2.
+        Sync updates and sync step 2 messages are applied and broadcasted to all clients if they changed the state of [`ydoc`][elva.server.Room.ydoc].
 
-    async def process_awareness(self, state: bytes, client: ServerConnection):
+        Messages from other rooms are never published again, so they do not circulate between servers.
+
+        Arguments:
+            message: the message received from the bus.
         """
-        Process an awareness message payload `state` from `client`.
+        try:
+            message_type, start, end = ElvaMessage.peek(message)
+        except ValueError:
+            return
+
+        payload = message[start:end]
+
+        match message_type:
+            case ElvaMessage.SYNC_STEP1:
+                try:
+                    update = self._crdt(self.ydoc.get_update, payload)
+                except ValueError:
+                    self.log.debug("ignored invalid replicated state")
+                    return
+
+                state = self._crdt(self.ydoc.get_state)
+                step1, _ = YMessage.SYNC_STEP1.encode(state)
+                step2, _ = YMessage.SYNC_STEP2.encode(update)
+                cross, _ = ElvaMessage.SYNC_CROSS.encode(step1 + step2)
+                self.bus.publish(self.identifier, cross)
+            case ElvaMessage.SYNC_CROSS:
+                try:
+                    _, state_start, state_end = YMessage.peek(payload)
+                    _, update_start, update_end = YMessage.peek(payload[state_end:])
+                except ValueError:
+                    return
+
+                self._apply_replicated(
+                    payload[state_end + update_start : state_end + update_end]
+                )
+
+                try:
+                    update = self._crdt(
+                        self.ydoc.get_update, payload[state_start:state_end]
+                    )
+                except ValueError:
+                    self.log.debug("ignored invalid replicated state")
+                    return
+
+                if update != EMPTY_UPDATE:
+                    step2, _ = YMessage.SYNC_STEP2.encode(update)
+                    self.bus.publish(self.identifier, step2)
+            case ElvaMessage.SYNC_STEP2 | ElvaMessage.SYNC_UPDATE:
+                self._apply_replicated(payload)
+
+    def _apply_replicated(self, update: bytes):
+        """
+        Apply a sync update from the room of another server and broadcast it to all clients.
+
+        Updates already contained in [`ydoc`][elva.server.Room.ydoc] and invalid updates are not broadcasted.
+
+        Arguments:
+            update: the sync update to apply.
         """
-        message, _ = YMessage.AWARENESS.encode(state)
-        self.broadcast(message, client)
+        if update == EMPTY_UPDATE:
+            return
+
+        state = self._crdt(self.ydoc.get_state)
+        try:
+            self._apply_update(update)
+        except ValueError:
+            self.log.debug("ignored invalid replicated update")
+            return
+
+        if self._crdt(self.ydoc.get_state) != state:
+            self.stats["updates_replicated"] += 1
+            self._broadcast_updates([(None, update)])
 
 
 WebsocketServerState = create_component_state("WebsocketServerState", ("SERVING",))
@@ -339,7 +1455,7 @@ class WebsocketServer(Component):
     """hostname or IP address to be published at."""
 
     port: int
-    """port to listen on."""
+    """port to listen on, set to the actually bound port once serving if given as `0`."""
 
     persistent: bool
     """flag whether to save Y Document updates persistently."""
@@ -353,6 +1469,78 @@ class WebsocketServer(Component):
     rooms: dict[str, Room]
     """mapping of connection handlers to their corresponding identifiers."""
 
+    idle_timeout: None | float
+    """seconds after which a room without connections is evicted from memory."""
+
+    max_rooms: None | int
+    """maximum number of rooms held in memory."""
+
+    max_memory: None | int
+    """maximum estimated number of bytes spent on Y Documents of rooms held in memory."""
+
+    volatile_eviction: Literal["refuse", "spill"]
+    """policy for evicting rooms holding their content only in volatile memory."""
+
+    store_class: type[Store]
+    """class of the store saving each room to its own file."""
+
+    store_options: dict
+    """mapping of keyword arguments passed to the store of each room."""
+
+    database: None | ShardedSQLiteDatabase
+    """database component shared by all rooms, or `None` if each room is saved to its own file."""
+
+    broadcast_window: None | float
+    """seconds for which each room collects and merges sync updates before broadcasting them, or `None` to broadcast them immediately."""
+
+    batch_ingest: bool
+    """flag whether each room processes all queued messages at once."""
+
+    max_room_syncs: None | int
+    """maximum number of connections synchronizing with a single room at the same time."""
+
+    max_sync_queue: int
+    """maximum number of connections waiting for synchronization before new connections are refused."""
+
+    retry_after: int
+    """seconds after which refused connections are advised to retry."""
+
+    sync_timeout: float
+    """seconds a new connection may occupy a synchronization slot before sending its first message."""
+
+    bus: None | Bus
+    """bus component replicating rooms to other servers, or `None` if rooms are not replicated."""
+
+    max_lag: None | float
+    """seconds after which a connection falling behind the broadcasts of its room is closed."""
+
+    awareness_interval: None | float
+    """seconds for which each room collects awareness changes before broadcasting them, or `None` to broadcast them immediately."""
+
+    _sync_limiter: None | anyio.CapacityLimiter
+    """limiter of connections loading a room and synchronizing at the same time, or `None` if unlimited."""
+
+    stats: Counter
+    """counters of room `evictions`, `reloads` and `spills`, and of `refusals` of connections."""
+
+    _evicting: dict[str, anyio.Event]
+    """mapping of identifiers of rooms currently being evicted to events set on completion."""
+
+    _evicted: set[str]
+    """identifiers of rooms which have been evicted and not been reloaded yet."""
+
+    _loading: dict[str, anyio.Event]
+    """mapping of identifiers of rooms currently being loaded to events set on completion."""
+
+    _spilled: set[str]
+    """identifiers of rooms held in volatile memory which have been spilled to disk."""
+
+    _spill_dir: None | TemporaryDirectory
+    """temporary directory holding spilled rooms, removed with this server instance."""
+
+    _budget_lock: anyio.Lock
+    """lock serializing the enforcement of the room cache budget."""
+
     def __init__(
         self,
         host: str,
@@ -360,19 +1548,79 @@ class WebsocketServer(Component):
         persistent: bool = False,
         path: None | Path = None,
         process_request: None | Callable = None,
+        idle_timeout: None | float = None,
+        max_rooms: None | int = None,
+        max_memory: None | int = None,
+        volatile_eviction: Literal["refuse", "spill"] = "refuse",
+        store_options: None | dict = None,
+        shards: None | int = None,
+        store_class: type[Store] = SQLiteStore,
+        broadcast_window: None | float = None,
+        batch_ingest: bool = False,
+        max_syncs: None | int = None,
+        max_room_syncs: None | int = None,
+        max_sync_queue: int = 100,
+        retry_after: int = 1,
+        sync_timeout: float = SYNC_TIMEOUT,
+        bus: None | Bus = None,
+        max_lag: None | float = 30,
+        awareness_interval: None | float = None,
     ):
         """
         Arguments:
             host: hostname or IP address to be published at.
-            port: port to listen on.
+            port: port to listen on. If `0`, the operating system chooses a free port.
             persistent: flag whether to save Y Document updates persistently.
             path: path where to store Y Document contents on disk.
             process_request: callable checking the HTTP request headers on new connections.
+            idle_timeout: seconds after which a room without connections is evicted from memory. If `None`, rooms are kept forever.
+            max_rooms: maximum number of rooms held in memory. If `None`, the number of rooms is unlimited.
+            max_memory: maximum estimated number of bytes spent on Y Documents of rooms held in memory. If `None`, the memory is unlimited.
+            volatile_eviction: policy for evicting rooms holding their content only in volatile memory. With `"refuse"`, these rooms are never evicted. With `"spill"`, their content is written to a temporary file and read back on reload.
+            store_options: mapping of keyword arguments passed to the store of each room.
+            shards: number of shared databases under `path` to save all rooms in, see [`ShardedSQLiteDatabase`][elva.store.ShardedSQLiteDatabase]. If `None`, each room is saved to its own file.
+            store_class: class of the store saving each room to its own file, e.g. [`SQLiteStore`][elva.store.SQLiteStore] or [`LogStore`][elva.store.LogStore].
+            broadcast_window: seconds for which each room collects and merges sync updates before broadcasting them, see [`Room`][elva.server.Room]. If `None`, they are broadcasted immediately.
+            batch_ingest: flag whether each room processes all queued messages at once, see [`Room`][elva.server.Room].
+            max_syncs: maximum number of connections loading a room and synchronizing at the same time. If `None`, the number is unlimited.
+            max_room_syncs: maximum number of connections synchronizing with a single room at the same time. If `None`, the number is unlimited.
+            max_sync_queue: maximum number of connections waiting for synchronization, on the whole server or per room, before new connections are refused with HTTP status 503 (service unavailable).
+            retry_after: seconds after which refused connections are advised to retry.
+            sync_timeout: seconds a new connection may occupy a synchronization slot before sending its first message.
+            bus: bus component replicating rooms to other servers connected to it, see [`Room`][elva.server.Room]. It is started with this server.
+            max_lag: seconds after which a connection falling behind the broadcasts of its room is closed, see [`Room.send`][elva.server.Room.send]. If `None`, it is waited for indefinitely.
+            awareness_interval: seconds for which each room collects awareness changes before broadcasting them, see [`Room`][elva.server.Room]. If `None`, they are broadcasted immediately.
         """
         self.host = host
         self.port = port
         self.persistent = persistent
         self.path = path
+        self.idle_timeout = idle_timeout
+        self.max_rooms = max_rooms
+        self.max_memory = max_memory
+
+        if volatile_eviction not in ("refuse", "spill"):
+            raise ValueError(f"unknown volatile eviction policy '{volatile_eviction}'")
+        self.volatile_eviction = volatile_eviction
+        self.store_class = store_class
+        self.store_options = store_options or dict()
+        self.broadcast_window = broadcast_window
+        self.batch_ingest = batch_ingest
+        self.max_room_syncs = max_room_syncs
+        self.max_sync_queue = max_sync_queue
+        self.retry_after = retry_after
+        self.sync_timeout = sync_timeout
+
+        if bus is not None and not persistent:
+            raise ValueError("replicating rooms requires them to be persistent")
+        self.bus = bus
+        self.max_lag = max_lag
+        self.awareness_interval = awareness_interval
+
+        if max_syncs is not None:
+            self._sync_limiter = anyio.CapacityLimiter(max_syncs)
+        else:
+            self._sync_limiter = None
 
         if path is not None:
             # check whether `path` is writable, OS-agnostic
@@ -390,20 +1638,51 @@ class WebsocketServer(Component):
             except PermissionError:
                 raise PermissionError(f"'{path}' is not writable") from None
 
-        if process_request is None:
-            self.process_request = self.check_path
+        if persistent and path is not None and shards is not None:
+            if store_class is not SQLiteStore:
+                raise ValueError("shared databases are supported for SQLite only")
+
+            # the shared writer takes over batching, but not compaction
+            database_options = {
+                key: value
+                for key, value in self.store_options.items()
+                if key in ("max_batch_size", "max_batch_latency", "pragmas")
+            }
+            self.database = ShardedSQLiteDatabase(path, shards, **database_options)
         else:
-            self.process_request = RequestProcessor(
-                self.check_path, process_request
-            ).process_request
+            self.database = None
+
+        funcs = [self.check_path, self.check_admission]
+        if process_request is not None:
+            funcs.append(process_request)
+        self.process_request = RequestProcessor(*funcs).process_request
 
         self.rooms = dict()
+        self.stats = Counter()
+        self._evicting = dict()
+        self._evicted = set()
+        self._loading = dict()
+        self._spilled = set()
+        self._spill_dir = None
+        self._budget_lock = anyio.Lock()
 
     @property
     def states(self) -> WebsocketServerState:
         """The states this component can have."""
         return WebsocketServerState
 
+    async def before(self):
+        """
+        Hook running before the `RUNNING` state is set.
+
+        Used to start the shared database and the bus.
+        """
+        if self.database is not None:
+            await self._task_group.start(self.database.start)
+
+        if self.bus is not None:
+            await self._task_group.start(self.bus.start)
+
     async def run(self):
         """
         Hook handling incoming connections and messages.
@@ -414,18 +1693,27 @@ class WebsocketServer(Component):
             self.port,
             process_request=self.process_request,
             logger=logging.getLogger(f"{self.log.name}.ServerConnection"),
-        ):
+        ) as server:
+            if self.port == 0:
+                # report the port chosen by the operating system
+                self.port = server.sockets[0].getsockname()[1]
+
             self._change_state(self.states.NONE, self.states.SERVING)
 
             if self.persistent:
                 if self.path is None:
                     location = "volatile memory"
+                elif self.database is not None:
+                    location = f"{self.database.shards} shards in {self.path}"
                 else:
                     location = self.path
                 self.log.info(f"storing content in {location}")
             else:
                 self.log.info("broadcast only and no content will be stored")
 
+            if self.idle_timeout is not None:
+                self._task_group.start_soon(self._evict_idle_rooms)
+
             # keep the server active indefinitely
             await anyio.sleep_forever()
 
@@ -438,7 +1726,8 @@ class WebsocketServer(Component):
         self._change_state(self.states.SERVING, self.states.NONE)
 
         async with anyio.create_task_group() as tg:
-            for identifier in self.rooms:
+            # copy as rooms might get evicted in the meantime
+            for identifier in self.rooms.copy():
                 tg.start_soon(self.wait_for_room_closed, identifier)
 
     async def wait_for_room_closed(self, identifier: str):
@@ -448,12 +1737,156 @@ class WebsocketServer(Component):
         Arguments:
             identifier: the identifier to which the room belongs.
         """
+        # the room is stopped and dropped by an eviction already
+        evicted = self._evicting.get(identifier)
+        if evicted is not None:
+            await evicted.wait()
+            return
+
         room = self.rooms[identifier]
         sub = room.subscribe()
         while room.states.ACTIVE in room.state:
             await sub.receive()
         room.unsubscribe(sub)
 
+    async def _evict_idle_rooms(self):
+        """
+        Hook periodically evicting rooms without connections for longer than [`idle_timeout`][elva.server.WebsocketServer.idle_timeout].
+
+        Rooms are checked every half of the idle timeout, so a room gets evicted
+        between one and one and a half times the idle timeout after its last
+        connection has been removed.
+        """
+        while True:
+            await anyio.sleep(self.idle_timeout / 2)
+
+            now = time.monotonic()
+            for identifier, room in self.rooms.copy().items():
+                if (
+                    room.idle_since is not None
+                    and now - room.idle_since >= self.idle_timeout
+                ):
+                    await self.evict_room(identifier)
+
+    async def evict_room(self, identifier: str) -> bool:
+        """
+        Stop a room without connections and drop it from memory.
+
+        The store of the room gets flushed and closed, thereby releasing the file handle.
+        On the next connection, the room is reloaded from disk by [`get_room`][elva.server.WebsocketServer.get_room].
+
+        Rooms holding their content only in volatile memory are evicted according
+        to [`volatile_eviction`][elva.server.WebsocketServer.volatile_eviction].
+
+        Arguments:
+            identifier: the identifier to which the room belongs.
+
+        Returns:
+            `True` if the room has been evicted, else `False`.
+        """
+        room = self.rooms.get(identifier)
+
+        if room is None or room.clients or room.joining or identifier in self._evicting:
+            return False
+
+        spill = not room.evictable
+        if spill and self.volatile_eviction == "refuse":
+            return False
+
+        # the room is still loading its contents
+        if identifier in self._loading:
+            return False
+
+        self._evicting[identifier] = evicted = anyio.Event()
+
+        try:
+            # shield the shutdown so that the store is flushed completely
+            with anyio.CancelScope(shield=True):
+                if room.states.ACTIVE in room.state:
+                    sub = room.subscribe()
+                    await room.stop()
+                    while room.states.ACTIVE in room.state:
+                        await sub.receive()
+                    room.unsubscribe(sub)
+
+                if spill:
+                    await self._spill(room)
+        finally:
+            del self.rooms[identifier]
+            del self._evicting[identifier]
+            evicted.set()
+
+        if room.persistent:
+            self._evicted.add(identifier)
+
+        self.stats["evictions"] += 1
+        self.log.info(f"evicted room {identifier}")
+
+        return True
+
+    async def _spill(self, room: Room):
+        """
+        Hook writing the content of a room held in volatile memory to a temporary file.
+
+        Arguments:
+            room: the stopped room to spill to disk.
+        """
+        if self._spill_dir is None:
+            self._spill_dir = TemporaryDirectory(prefix="elva-spill-")
+
+        path = (
+            Path(self._spill_dir.name) / f"{room.identifier}{self.store_class.suffix}"
+        )
+
+        # the store appends the whole YDoc content on start
+        async with self.store_class(
+            room.ydoc, room.identifier, path, **self.store_options
+        ):
+            pass
+
+        self._spilled.add(room.identifier)
+        self.stats["spills"] += 1
+        self.log.info(f"spilled room {room.identifier} to {path}")
+
+    def _exceeds_budget(self) -> bool:
+        """
+        Check whether the rooms held in memory exceed the room cache budget.
+
+        Returns:
+            `True` if either the maximum number of rooms or the maximum memory is exceeded, else `False`.
+        """
+        if self.max_rooms is not None and len(self.rooms) > self.max_rooms:
+            return True
+
+        if self.max_memory is not None:
+            size = sum(room.size for room in self.rooms.values())
+            if size > self.max_memory:
+                return True
+
+        return False
+
+    async def _enforce_budget(self):
+        """
+        Hook evicting the least recently used rooms without connections while the room cache budget is exceeded.
+        """
+        if self.max_rooms is None and self.max_memory is None:
+            return
+
+        async with self._budget_lock:
+            idle_rooms = sorted(
+                (room for room in self.rooms.values() if room.idle_since is not None),
+                key=lambda room: room.idle_since,
+            )
+
+            for room in idle_rooms:
+                if not self._exceeds_budget():
+                    break
+
+                await self.evict_room(room.identifier)
+
+            if self._exceeds_budget():
+                self.log.warning("room cache budget exceeded by rooms in use")
+
     def check_path(
         self, websocket: ServerConnection, request: Request
     ) -> None | Response:
@@ -485,30 +1918,108 @@ class WebsocketServer(Component):
                 reason_phrase=reason,
             )
 
+    def check_admission(
+        self, websocket: ServerConnection, request: Request
+    ) -> None | Response:
+        """
+        Check if a request can be admitted without exceeding the synchronization queue.
+
+        This function is a request processing callable and automatically passed to the inner [`serve`][websockets.asyncio.server.serve] function.
+
+        Arguments:
+            websocket: connection object.
+            request: HTTP request header object.
+
+        Returns:
+            `None` if the request is admitted, else a [`Response`][websockets.http11.Response] with HTTP status 503 (service unavailable) and a `Retry-After` header.
+        """
+        limiters = [self._sync_limiter]
+
+        room = self.rooms.get(request.path[1:])
+        if room is not None:
+            limiters.append(room.sync_limiter)
+
+        for limiter in limiters:
+            if (
+                limiter is not None
+                and limiter.available_tokens == 0
+                and limiter.statistics().tasks_waiting >= self.max_sync_queue
+            ):
+                self.stats["refusals"] += 1
+                return Response(
+                    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                    headers=Headers({"Retry-After": str(self.retry_after)}),
+                    reason_phrase="Too many connections synchronizing",
+                )
+
     async def get_room(self, identifier: str) -> Room:
         """
         Get or create a [`Room`][elva.server.Room] via its corresponding `identifier`.
 
+        Evicted rooms are created anew and thereby reloaded from disk transparently.
+
+        A room is loaded only once: concurrent calls for the same `identifier` wait for the first one to finish loading.
+        Rooms with different identifiers are loaded concurrently.
+
         Arguments:
             identifier: string identifiying the underlying Y Document.
 
         Returns:
             room to the given `identifier`.
         """
+        # wait for the room to be written to disk before reading it again
+        while identifier in self._evicting:
+            await self._evicting[identifier].wait()
+
+        # wait for another connection loading the room
+        if identifier in self._loading:
+            await self._loading[identifier].wait()
+
         # try to get the room for `identifier`, else create a new one
         try:
             room = self.rooms[identifier]
         except KeyError:
+            if identifier in self._spilled:
+                # read the content back from the temporary spill file
+                path = Path(self._spill_dir.name)
+                database = None
+            else:
+                path = self.path
+                database = self.database
+
             room = Room(
                 identifier,
                 persistent=self.persistent,
-                path=self.path,
+                path=path,
+                store_options=self.store_options,
+                database=database,
+                store_class=self.store_class,
+                broadcast_window=self.broadcast_window,
+                batch_ingest=self.batch_ingest,
+                max_syncs=self.max_room_syncs,
+                bus=self.bus,
+                max_lag=self.max_lag,
+                awareness_interval=self.awareness_interval,
             )
             self.rooms[identifier] = room
 
-        # make sure the room is `ACTIVE`
+            if identifier in self._evicted:
+                self._evicted.remove(identifier)
+                self.stats["reloads"] += 1
+                self.log.info(f"reloading evicted room {identifier}")
+
+        # make sure the room is `ACTIVE`, i.e. its contents have been loaded
         if room.states.ACTIVE not in room.state:
-            await self._task_group.start(room.start)
+            self._loading[identifier] = loaded = anyio.Event()
+
+            try:
+                await self._task_group.start(room.start)
+            finally:
+                del self._loading[identifier]
+                loaded.set()
+
+            room.estimate_size()
+            self._task_group.start_soon(self._enforce_budget)
 
         return room
 
@@ -525,14 +2036,196 @@ class WebsocketServer(Component):
         """
         # use the connection path as identifier with leading `/` removed
         identifier = websocket.request.path[1:]
-        room = await self.get_room(identifier)
 
-        room.add(websocket)
+        room = None
 
         try:
+            # limit the number of connections loading a room and synchronizing
+            # at the same time; the slots are released after the first message,
+            # i.e. the sync step 1, has been processed
+            async with AsyncExitStack() as admission:
+                if self._sync_limiter is not None:
+                    await admission.enter_async_context(self._sync_limiter)
+
+                joining = await self.get_room(identifier)
+
+                # keep the room from being evicted while waiting for a slot
+                joining.reserve()
+                try:
+                    if joining.sync_limiter is not None:
+                        await admission.enter_async_context(joining.sync_limiter)
+
+                    joining.add(websocket)
+                finally:
+                    joining.release()
+
+                room = joining
+
+                # do not let an idle connection hold the slots
+                data = None
+                with anyio.move_on_after(self.sync_timeout):
+                    data = await websocket.recv()
+
+                if data is not None:
+                    await room.ingest(data, websocket, wait=True)
+                else:
+                    self.log.info(
+                        f"connection {id(websocket)} sent no message "
+                        f"within {self.sync_timeout} seconds"
+                    )
+
             async for data in websocket:
-                await room.process(data, websocket)
+                await room.ingest(data, websocket)
         except ConnectionClosed:
             self.log.info(f"closed connection {id(websocket)}")
         finally:
-            room.remove(websocket)
+            if room is not None:
+                room.remove(websocket)
+
+                if not room.clients:
+                    room.estimate_size()
+                    self._task_group.start_soon(self._enforce_budget)
+
+
+class WebsocketRouter(Component):
+    """
+    Front component redirecting connections to the worker serving the requested room.
+
+    Each room identifier is mapped to exactly one worker by a [`HashRing`][elva.server.HashRing],
+    so that the Y Document and the store of a room live in a single process.
+    Clients are redirected with HTTP status 307 (temporary redirect) to the port of the worker,
+    which requires them to follow redirects.
+    """
+
+    host: str
+    """hostname or IP address to be published at."""
+
+    port: int
+    """port to listen on."""
+
+    workers: list[int]
+    """ports the workers listen on."""
+
+    ring: HashRing
+    """consistent hash ring mapping room identifiers to indices of [`workers`][elva.server.WebsocketRouter.workers]."""
+
+    unavailable: set[int]
+    """indices of workers currently not accepting connections, e.g. while being restarted."""
+
+    retry_after: int
+    """seconds after which connections to unavailable workers are advised to retry."""
+
+    stats: Counter
+    """counters of `redirects` and `refusals` of connections."""
+
+    worker_stats: dict[int, Counter]
+    """mapping of worker indices to counters of `redirects` and `refusals` of connections to them."""
+
+    # the identifier is checked the same way as in the workers
+    check_path = WebsocketServer.check_path
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        workers: list[int],
+        retry_after: int = 1,
+    ):
+        """
+        Arguments:
+            host: hostname or IP address to be published at.
+            port: port to listen on.
+            workers: ports the workers listen on.
+            retry_after: seconds after which connections to unavailable workers are advised to retry.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.ring = HashRing(range(len(workers)))
+        self.unavailable = set()
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self.worker_stats = {index: Counter() for index in range(len(workers))}
+
+    def get_worker(self, identifier: str) -> int:
+        """
+        Get the worker serving a room.
+
+        Arguments:
+            identifier: the identifier of the room.
+
+        Returns:
+            the index of the worker in [`workers`][elva.server.WebsocketRouter.workers].
+        """
+        return self.ring.get_node(identifier)
+
+    def redirect(
+        self, websocket: ServerConnection, request: Request
+    ) -> None | Response:
+        """
+        Redirect a request to the worker serving the requested room.
+
+        This function is a request processing callable and automatically passed to the inner [`serve`][websockets.asyncio.server.serve] function.
+
+        Arguments:
+            websocket: connection object.
+            request: HTTP request header object.
+
+        Returns:
+            a [`Response`][websockets.http11.Response] with HTTP status 307 (temporary redirect) to the worker,
+            or with HTTP status 503 (service unavailable) and a `Retry-After` header if the worker is unavailable.
+        """
+        index = self.get_worker(request.path[1:])
+
+        if index in self.unavailable:
+            self.stats["refusals"] += 1
+            self.worker_stats[index]["refusals"] += 1
+            return Response(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers=Headers({"Retry-After": str(self.retry_after)}),
+                reason_phrase="Worker is restarting",
+            )
+
+        # keep the host name the client used to connect
+        host = request.headers.get("Host")
+        hostname = urlsplit(f"//{host}").hostname if host else None
+        if hostname is None:
+            hostname = self.host
+        if ":" in hostname:
+            hostname = f"[{hostname}]"
+
+        self.stats["redirects"] += 1
+        self.worker_stats[index]["redirects"] += 1
+        return Response(
+            status_code=HTTPStatus.TEMPORARY_REDIRECT,
+            headers=Headers(
+                {"Location": f"ws://{hostname}:{self.workers[index]}{request.path}"}
+            ),
+            reason_phrase="Temporary Redirect",
+        )
+
+    async def run(self):
+        """
+        Hook redirecting incoming connections.
+        """
+        process_request = RequestProcessor(self.check_path, self.redirect)
+
+        async with serve(
+            self.handle,
+            self.host,
+            self.port,
+            process_request=process_request.process_request,
+            logger=logging.getLogger(f"{self.log.name}.ServerConnection"),
+        ):
+            self.log.info(f"routing connections to {len(self.workers)} workers")
+
+            await anyio.sleep_forever()
+
+    async def handle(self, websocket: ServerConnection):
+        """
+        Close a connection, which is never reached as all requests are answered by [`redirect`][elva.server.WebsocketRouter.redirect].
+
+        Arguments:
+            websocket: the opened connection.
+        """
+        await websocket.close()
@@ -2,44 +2,182 @@
 Module holding store components.
 """
 
+import hashlib
+import json
+import mmap
+import os
+import pathlib
 import sqlite3
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict, deque
+from io import FileIO
+from typing import BinaryIO, Iterator, Literal
 
 import sqlite_anyio as sqlite
 from anyio import (
     CancelScope,
+    Event,
     Lock,
     Path,
     WouldBlock,
     create_memory_object_stream,
+    move_on_after,
+    to_thread,
 )
 from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
-from pycrdt import Doc, Subscription, TransactionEvent
+from pycrdt import Doc, Subscription, TransactionEvent, get_state, merge_updates
 from sqlite_anyio.sqlite import Connection, Cursor
 
 from elva.component import Component, create_component_state
-from elva.protocol import EMPTY_UPDATE
+from elva.core import FILE_SUFFIX
+from elva.protocol import EMPTY_UPDATE, STATE_ZERO, Message, read_var_uint
 
 # TODO: check performance
 
 
-def get_metadata(path: str | Path) -> dict:
+CHUNK_SIZE = 1024
+"""Number of rows fetched at once when reading updates in chunks."""
+
+STATE_KEY = "yupdates_state"
+"""Metadata key of the state vector of the updates in an ELVA SQLite database."""
+
+ROWS_KEY = "yupdates_rows"
+"""Metadata key of the number of rows in the `yupdates` table."""
+
+BYTES_KEY = "yupdates_bytes"
+"""Metadata key of the total size in bytes of the updates in the `yupdates` table."""
+
+STATISTICS_KEYS = (STATE_KEY, ROWS_KEY, BYTES_KEY)
+"""Metadata keys reserved for statistics about the `yupdates` table."""
+
+SYNCED_STATE_KEY = "provider_synced_state"
+"""Metadata key reserved for the synced state vectors saved by a [`WebsocketProvider`][elva.provider.WebsocketProvider]."""
+
+RESERVED_KEYS = STATISTICS_KEYS + (SYNCED_STATE_KEY,)
+"""Metadata keys reserved for ELVA, which are no parameters and are kept on replacing the metadata."""
+
+STATISTICS_PLACEHOLDERS = ", ".join("?" * len(STATISTICS_KEYS))
+"""SQL parameter placeholders for the keys in [`STATISTICS_KEYS`][elva.store.STATISTICS_KEYS]."""
+
+RESERVED_PLACEHOLDERS = ", ".join("?" * len(RESERVED_KEYS))
+"""SQL parameter placeholders for the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS]."""
+
+
+PRAGMAS = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "cache_size": int,
+    "mmap_size": int,
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+"""
+Mapping of tunable SQLite pragmas to either their valid values or their value type.
+
+See the [SQLite pragma documentation](https://www.sqlite.org/pragma.html) for reference.
+"""
+
+
+def get_pragmas(config: dict) -> dict:
+    """
+    Pick the SQLite pragmas from a configuration mapping.
+
+    Arguments:
+        config: mapping of configuration parameters to their values.
+
+    Returns:
+        mapping of pragma names to their values, forming a store tuning profile.
+    """
+    return {
+        name: config[name]
+        for name in PRAGMAS
+        if name in config and config[name] is not None
+    }
+
+
+def get_pragma_statements(pragmas: None | dict) -> list[str]:
+    """
+    Validate pragmas and compose the SQL statements setting them.
+
+    Arguments:
+        pragmas: mapping of pragma names to their values.
+
+    Raises:
+        ValueError: if a pragma name or value is not supported.
+
+    Returns:
+        list of `PRAGMA` statements.
+    """
+    statements = []
+
+    for name, value in (pragmas or dict()).items():
+        try:
+            valid = PRAGMAS[name]
+        except KeyError:
+            raise ValueError(f"unsupported pragma '{name}'") from None
+
+        # pragma values cannot be passed as SQL parameters,
+        # so we need to make sure they are safe to be included in the statement
+        if valid is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"value of pragma '{name}' needs to be an integer")
+        else:
+            value = str(value).upper()
+            if value not in valid:
+                raise ValueError(
+                    f"value of pragma '{name}' needs to be one of {', '.join(valid)}"
+                )
+
+        statements.append(f"PRAGMA {name} = {value}")
+
+    return statements
+
+
+def open_database(path: str | Path, pragmas: None | dict = None) -> sqlite3.Connection:
+    """
+    Connect to an ELVA SQLite database and apply the given pragmas.
+
+    Arguments:
+        path: path to the ELVA SQLite database.
+        pragmas: mapping of pragma names to their values.
+
+    Returns:
+        the connection to the ELVA SQLite database.
+    """
+    statements = get_pragma_statements(pragmas)
+
+    db = sqlite3.connect(path)
+
+    try:
+        for statement in statements:
+            db.execute(statement)
+    except sqlite3.Error:
+        db.close()
+        raise
+
+    return db
+
+
+def get_metadata(path: str | Path, pragmas: None | dict = None) -> dict:
     """
     Retrieve metadata from a given ELVA SQLite database.
 
     Arguments:
         path: path to the ELVA SQLite database.
+        pragmas: mapping of pragma names to their values.
 
     Raises:
         FileNotFoundError: if there is no file present.
         sqlite3.OperationalError: if there is no `metadata` table in the database.
 
     Returns:
-        mapping of metadata keys to values.
+        mapping of metadata keys to values, without the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
     """
     if not path.exists():
         raise FileNotFoundError("no such file or directory")
 
-    db = sqlite3.connect(path)
+    db = open_database(path, pragmas)
     cur = db.cursor()
 
     try:
@@ -49,32 +187,94 @@ def get_metadata(path: str | Path) -> dict:
         db.close()
         raise
     else:
-        res = dict(res.fetchall())
+        res = {key: value for key, value in res.fetchall() if key not in RESERVED_KEYS}
     finally:
         db.close()
 
     return res
 
 
-def set_metadata(path: str | Path, metadata: dict[str, str], replace: bool = False):
+def get_statistics(path: str | Path, pragmas: None | dict = None) -> dict:
+    """
+    Retrieve the persisted statistics about the updates in an ELVA SQLite database.
+
+    This does not read any updates and hence takes constant time.
+
+    Arguments:
+        path: path to the ELVA SQLite database.
+        pragmas: mapping of pragma names to their values.
+
+    Raises:
+        FileNotFoundError: if there is no file present.
+        sqlite3.OperationalError: if there is no `metadata` table in the database.
+
+    Returns:
+        mapping with the `state` vector of the updates, the number of `rows` and the total size in `bytes`.
+        Missing statistics are `None`.
+    """
+    if not path.exists():
+        raise FileNotFoundError("no such file or directory")
+
+    db = open_database(path, pragmas)
+
+    try:
+        res = db.execute(
+            f"SELECT * FROM metadata WHERE key IN ({STATISTICS_PLACEHOLDERS})",
+            STATISTICS_KEYS,
+        )
+        res = dict(res.fetchall())
+    finally:
+        db.close()
+
+    return _to_statistics(res)
+
+
+def _to_statistics(res: dict) -> dict:
+    """
+    Convert statistics metadata to a statistics mapping.
+
+    Arguments:
+        res: mapping of statistics metadata keys to their values.
+
+    Returns:
+        mapping with the `state` vector of the updates, the number of `rows` and the total size in `bytes`.
+    """
+    return dict(
+        state=res.get(STATE_KEY),
+        rows=res.get(ROWS_KEY),
+        bytes=res.get(BYTES_KEY),
+    )
+
+
+def set_metadata(
+    path: str | Path,
+    metadata: dict[str, str],
+    replace: bool = False,
+    pragmas: None | dict = None,
+):
     """
     Set `metadata` in an ELVA SQLite database at `path`.
 
     Arguments:
         path: path to the ELVA SQLite database.
         metadata: mapping of metadata keys to values.
-        replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`).
+        replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        pragmas: mapping of pragma names to their values.
     """
-    db = sqlite3.connect(path)
+    db = open_database(path, pragmas)
     cur = db.cursor()
 
     try:
-        if replace:
-            cur.execute("DROP TABLE IF EXISTS metadata")
-
         # ensure `metadata` table with `key` being primary, i.e. unique
         cur.execute("CREATE TABLE IF NOT EXISTS metadata(key PRIMARY KEY, value)")
 
+        if replace:
+            # keep the statistics as they describe the `yupdates` table
+            cur.execute(
+                f"DELETE FROM metadata WHERE key NOT IN ({RESERVED_PLACEHOLDERS})",
+                RESERVED_KEYS,
+            )
+
         for key, value in metadata.items():
             # check for each item separately
             try:
@@ -102,8 +302,18 @@ def set_metadata(path: str | Path, metadata: dict[str, str], replace: bool = Fal
         db.close()
 
 
-def get_updates(path):
-    db = sqlite3.connect(path)
+def get_updates(path: str | Path, pragmas: None | dict = None) -> list:
+    """
+    Read out the updates saved in an ELVA SQLite database.
+
+    Arguments:
+        path: path to the ELVA SQLite database.
+        pragmas: mapping of pragma names to their values.
+
+    Returns:
+        a list of rows holding the updates in the order they were written.
+    """
+    db = open_database(path, pragmas)
     cur = db.cursor()
 
     try:
@@ -117,332 +327,2560 @@ def get_updates(path):
         db.close()
 
 
-SQLiteStoreState = create_component_state("SQLiteStoreState")
-"""The states of the [`SQLiteStore`][elva.store.SQLiteStore] component."""
+def merge_rows(merged: None | bytes, rows: list[tuple]) -> bytes:
+    """
+    Merge the updates in a chunk of `yupdates` rows into an already merged update.
 
+    Arguments:
+        merged: the update merged from previous chunks or `None` for the first chunk.
+        rows: a non-empty list of rows with the update in the last column.
 
-class SQLiteStore(Component):
-    """
-    Store component saving Y updates in an ELVA SQLite database.
+    Returns:
+        the merged update.
     """
+    updates = [row[-1] for row in rows]
 
-    ydoc: Doc
-    """Instance of the synchronized Y Document."""
+    if merged is not None:
+        updates.insert(0, merged)
 
-    identifier: str
-    """Identifier of the synchronized Y Document."""
+    return merge_updates(*updates) if len(updates) > 1 else updates[0]
 
-    path: Path
-    """Path where to store the SQLite database."""
 
-    _lock: Lock
-    """Object for restricted resource management."""
+def encode_snapshot(update: bytes) -> bytes:
+    """
+    Encode the state of a Y Document with `update` applied.
 
-    _subscription: Subscription
-    """(while running) Object holding subscription information to changes in [`ydoc`][elva.store.SQLiteStore.ydoc]."""
+    Arguments:
+        update: the update to apply.
 
-    _stream_send: MemoryObjectSendStream
-    """(while running) Stream to send Y Document updates or flow control objects to."""
+    Returns:
+        the encoded state without the deleted contents held in `update`.
+    """
+    ydoc = Doc()
+    ydoc.apply_update(update)
+    return ydoc.get_update()
 
-    _stream_recv: MemoryObjectReceiveStream
-    """(while running) Stream to receive Y Document updates or flow control objects from."""
 
-    _db: Connection
-    """(while running) SQLite connection to the database file at [`path`][elva.store.SQLiteStore.path]."""
+def compact_updates(
+    path: str | Path, snapshot: bool = False, pragmas: None | dict = None
+) -> tuple[int, int]:
+    """
+    Replace the updates in an ELVA SQLite database by a single merged update.
 
-    _cursor: Cursor
-    """(while running) SQLite cursor operating on the [`_db`][elva.store.SQLiteStore._db] connection."""
+    All rows present in the `yupdates` table at the start of the compaction are
+    replaced within a single transaction, which locks out other writers.
+    Rows are read in chunks of [`CHUNK_SIZE`][elva.store.CHUNK_SIZE].
 
-    def __init__(self, ydoc: Doc, identifier: str | None, path: str):
-        """
-        Arguments:
-            ydoc: instance of the synchronized Y Document.
-            identifier: identifier of the synchronized Y Document. If `None`, it is tried to be retrieved from the `metadata` table in the SQLite database.
-            path: path where to store the SQLite database.
-        """
-        self.ydoc = ydoc
-        self.identifier = identifier
-        self.path = Path(path)
-        self._lock = Lock()
+    Arguments:
+        path: path to the ELVA SQLite database.
+        snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+        pragmas: mapping of pragma names to their values.
 
-    @property
-    def states(self) -> SQLiteStoreState:
-        """The states this component can have."""
-        return SQLiteStoreState
+    Returns:
+        a tuple of the number of compacted rows and the size of the resulting update in bytes.
+    """
+    db = open_database(path, pragmas)
 
-    async def get_metadata(self) -> dict:
-        """
-        Retrieve metadata from a given ELVA SQLite database.
+    try:
+        # acquire the write lock right away, so nothing gets appended in between
+        db.execute("BEGIN IMMEDIATE")
+        cur = db.execute("SELECT rowid, yupdate FROM yupdates ORDER BY rowid")
+
+        num_rows = 0
+        last_rowid = None
+        merged = None
+
+        while rows := cur.fetchmany(CHUNK_SIZE):
+            num_rows += len(rows)
+            last_rowid = rows[-1][0]
+            merged = merge_rows(merged, rows)
+
+        if num_rows > 1:
+            if snapshot:
+                merged = encode_snapshot(merged)
+
+            # keep the position of the compacted prefix by reusing the last row id
+            db.execute("DELETE FROM yupdates WHERE rowid <= ?", (last_rowid,))
+            db.execute(
+                "INSERT INTO yupdates(rowid, yupdate) VALUES (?, ?)",
+                (last_rowid, merged),
+            )
 
-        Returns:
-            mapping of metadata keys to values.
-        """
-        await self._cursor.execute("SELECT * FROM metadata")
-        res = await self._cursor.fetchall()
+            # the state vector does not change, but the size of the table does
+            db.execute("CREATE TABLE IF NOT EXISTS metadata(key PRIMARY KEY, value)")
+            db.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                ((ROWS_KEY, 1), (BYTES_KEY, len(merged))),
+            )
 
-        return dict(res)
+        db.commit()
+    finally:
+        db.close()
 
-    async def set_metadata(self, metadata: dict, replace: bool = False):
-        """
-        Set given metadata in a given ELVA SQLite database.
+    size = len(merged) if merged is not None else 0
 
-        Arguments:
-            metadata: mapping of metadata keys to values.
-            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`).
-        """
-        async with self._lock:
-            if replace:
-                await self._cursor.execute("DELETE FROM metadata")
+    return num_rows, size
 
-            for key, value in metadata.items():
-                # check for each item separately
-                try:
-                    await self._cursor.execute(
-                        "INSERT INTO metadata VALUES (?, ?)", (key, value)
-                    )
-                except sqlite3.IntegrityError:
-                    await self._cursor.execute(
-                        "UPDATE metadata SET value = ? WHERE key = ?", (value, key)
-                    )
 
-            await self._db.commit()
+SHARD_NAME = "rooms-{}.sqlite"
+"""Name of a shard file of a sharded ELVA SQLite database, formatted with the index of the shard."""
 
-        # ensure to update the identifier if given
-        self.identifier = metadata.get("identifier", None) or self.identifier
+SHARD_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metadata(identifier TEXT NOT NULL, key, value, PRIMARY KEY (identifier, key))",
+    "CREATE TABLE IF NOT EXISTS yupdates(identifier TEXT NOT NULL, yupdate BLOB)",
+    "CREATE INDEX IF NOT EXISTS yupdates_identifier ON yupdates(identifier)",
+)
+"""SQL statements ensuring the tables of a shard, keyed by the identifier of a Y Document."""
 
-    async def get_updates(self) -> list:
-        """
-        Read out the updates saved in the file.
+DETACH_TIMEOUT = 10
+"""Seconds a sharded database waits on cleanup for its attached stores to detach."""
 
-        Returns:
-            a list of updates in the order they were applied to the YDoc.
-        """
-        await self._cursor.execute("SELECT yupdate FROM yupdates")
-        updates = await self._cursor.fetchall()
 
-        if updates:
-            self.log.debug("read updates from file")
-        else:
-            self.log.debug("found no updates in file")
+def get_shard(identifier: str, shards: int) -> int:
+    """
+    Map the identifier of a Y Document to the index of its shard.
 
-        return updates
+    The mapping is stable across processes and platforms.
 
-    def _on_transaction_event(self, event: TransactionEvent):
-        """
-        Hook called on changes in [`ydoc`][elva.store.SQLiteStore.ydoc].
+    Arguments:
+        identifier: identifier of the Y Document.
+        shards: number of shards.
 
-        When called, the `event` data are written to the ELVA SQLite database.
+    Returns:
+        the index of the shard holding the Y Document.
+    """
+    digest = hashlib.blake2b(identifier.encode(), digest_size=8).digest()
+    return int.from_bytes(digest) % shards
 
-        Arguments:
-            event: object holding event information of changes in [`ydoc`][elva.store.SQLiteStore.ydoc].
-        """
-        self.log.debug(f"transaction event triggered with update {event.update}")
-        self._stream_send.send_nowait(event.update)
 
-    async def _ensure_metadata_table(self):
-        """
-        Hook called before the store sets its `RUNNING` state to ensure a table `metadata` exists.
-        """
-        async with self._lock:
-            await self._cursor.execute(
-                "CREATE TABLE IF NOT EXISTS metadata(key PRIMARY KEY, value)"
-            )
-            await self._db.commit()
+def get_shard_paths(path: str | Path, shards: int) -> list[pathlib.Path]:
+    """
+    Get the paths of the shard files of a sharded ELVA SQLite database.
 
-        self.log.debug("ensured metadata table")
+    Arguments:
+        path: directory holding the shard files.
+        shards: number of shards.
 
-    async def _ensure_identifier(self):
-        """
-        Hook called before the store sets its `started` signal to ensure the UUID of the YDoc contents is saved.
-        """
-        # a specific identifier was not given; try to get it from metadata
-        if self.identifier is None:
-            metadata = await self.get_metadata()
-            self.identifier = metadata.get("identifier", None)
-            return
+    Returns:
+        list of shard file paths ordered by shard index.
+    """
+    return [pathlib.Path(path) / SHARD_NAME.format(index) for index in range(shards)]
 
-        # a specific identifier was given; update the metadata
-        async with self._lock:
-            try:
-                # insert non-existing identifier
-                await self._cursor.execute(
-                    "INSERT INTO metadata VALUES (?, ?)",
-                    ["identifier", self.identifier],
-                )
-            except sqlite3.IntegrityError:  # UNIQUE constraint failed
-                # update existing identifier
-                await self._cursor.execute(
-                    "UPDATE metadata SET value = ? WHERE key = ?",
-                    [self.identifier, "identifier"],
-                )
-            finally:
-                await self._db.commit()
 
-        self.log.debug("ensured identifier")
+def check_shards(path: str | Path, shards: int):
+    """
+    Check that a sharded ELVA SQLite database can be opened with the given number of shards.
 
-    async def _ensure_update_table(self):
-        """
-        Hook called before the store sets its `started` signal to ensure a table `yupdates` exists.
-        """
-        async with self._lock:
-            await self._cursor.execute(
-                "CREATE TABLE IF NOT EXISTS yupdates(yupdate BLOB)"
-            )
-            await self._db.commit()
+    Since identifiers are mapped to shards by their hash, the number of shards
+    cannot change once shard files exist.
 
-        self.log.debug("ensured update table")
+    Arguments:
+        path: directory holding the shard files.
+        shards: number of shards.
 
-    async def _merge(self):
-        """
-        Hook to read in and apply updates from the ELVA SQLite database and             write divergent history updates to file.
-        """
-        # get updates stored in file
-        updates = await self.get_updates()
+    Raises:
+        ValueError: if `shards` is not positive or differs from the number of existing shard files.
+    """
+    if shards < 1:
+        raise ValueError("number of shards needs to be positive")
+
+    existing = len(list(pathlib.Path(path).glob(SHARD_NAME.format("*"))))
+
+    if existing and existing != shards:
+        raise ValueError(f"'{path}' holds {existing} shards instead of {shards}")
+
+
+def _fetch_merged(cur: sqlite3.Cursor) -> None | bytes:
+    """
+    Merge the updates in the rows of an executed query chunk by chunk.
+
+    Arguments:
+        cur: cursor of a query selecting rows with the update in the last column.
+
+    Returns:
+        the merged update or `None` if there are no rows.
+    """
+    merged = None
+
+    while rows := cur.fetchmany(CHUNK_SIZE):
+        merged = merge_rows(merged, rows)
+
+    return merged
+
+
+def export_rooms(
+    path: str | Path, target: str | Path, pragmas: None | dict = None
+) -> list[str]:
+    """
+    Write the Y Documents in a sharded ELVA SQLite database to ELVA data files.
+
+    Each Y Document is written as a single merged update to `<identifier>.y` in `target`
+    together with its metadata, except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+    Existing data files get the update appended, so their contents are merged.
+
+    Arguments:
+        path: directory holding the shard files.
+        target: directory to write the ELVA data files to.
+        pragmas: mapping of pragma names to their values.
+
+    Returns:
+        list of identifiers of the exported Y Documents.
+    """
+    target = pathlib.Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+
+    identifiers = []
+
+    for shard in sorted(pathlib.Path(path).glob(SHARD_NAME.format("*"))):
+        db = open_database(shard, pragmas)
+
+        try:
+            res = db.execute(
+                "SELECT identifier FROM yupdates UNION SELECT identifier FROM metadata"
+            )
+
+            for (identifier,) in res.fetchall():
+                update = _fetch_merged(
+                    db.execute(
+                        "SELECT yupdate FROM yupdates WHERE identifier = ? ORDER BY rowid",
+                        (identifier,),
+                    )
+                )
+                metadata = {
+                    key: value
+                    for key, value in db.execute(
+                        "SELECT key, value FROM metadata WHERE identifier = ?",
+                        (identifier,),
+                    ).fetchall()
+                    if key not in RESERVED_KEYS
+                }
+                metadata["identifier"] = identifier
+
+                file = target / f"{identifier}{FILE_SUFFIX}"
+                set_metadata(file, metadata, pragmas=pragmas)
+
+                if update is not None:
+                    out = open_database(file, pragmas)
+                    try:
+                        out.execute("CREATE TABLE IF NOT EXISTS yupdates(yupdate BLOB)")
+                        out.execute("INSERT INTO yupdates VALUES (?)", (update,))
+                        out.commit()
+                    finally:
+                        out.close()
+
+                identifiers.append(identifier)
+        finally:
+            db.close()
+
+    return identifiers
+
+
+def import_rooms(
+    source: str | Path, path: str | Path, shards: int, pragmas: None | dict = None
+) -> list[str]:
+    """
+    Write the Y Documents in ELVA data files to a sharded ELVA SQLite database.
+
+    The Y Document of each `*.y` file in `source` is written as a single merged update
+    to the shard of its identifier, which is taken from the file's metadata or,
+    if absent, from the file name.
+
+    Arguments:
+        source: directory holding the ELVA data files.
+        path: directory holding the shard files.
+        shards: number of shards.
+        pragmas: mapping of pragma names to their values.
+
+    Raises:
+        ValueError: if the number of shards differs from the number of existing shard files.
+
+    Returns:
+        list of identifiers of the imported Y Documents.
+    """
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    check_shards(path, shards)
+
+    dbs = []
+    identifiers = []
+
+    try:
+        for shard in get_shard_paths(path, shards):
+            db = open_database(shard, pragmas)
+            dbs.append(db)
+
+            for statement in SHARD_SCHEMA:
+                db.execute(statement)
+
+        for file in sorted(pathlib.Path(source).glob(f"*{FILE_SUFFIX}")):
+            metadata = get_metadata(file, pragmas)
+            identifier = metadata.pop("identifier", None) or file.stem
+
+            src = open_database(file, pragmas)
+            try:
+                update = _fetch_merged(src.execute("SELECT yupdate FROM yupdates"))
+            finally:
+                src.close()
+
+            db = dbs[get_shard(identifier, shards)]
+
+            if update is not None:
+                db.execute("INSERT INTO yupdates VALUES (?, ?)", (identifier, update))
+
+            db.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                [(identifier, key, value) for key, value in metadata.items()],
+            )
+
+            identifiers.append(identifier)
+
+        for db in dbs:
+            db.commit()
+    finally:
+        for db in dbs:
+            db.close()
+
+    return identifiers
+
+
+LOG_HEADER = b"ELVA-LOG\x01"
+"""Bytes at the start of an ELVA log file, identifying the format and its version."""
+
+
+class LogRecord(Message):
+    """
+    Record types of an ELVA log file.
+
+    A record is encoded like a Y message, i.e. the magic bytes of its type
+    are followed by its payload with the length prepended as variable unsigned integer.
+    """
+
+    UPDATE = (ord("Y"), ord("U"))
+    """Record holding a Y update."""
+
+    METADATA = (ord("Y"), ord("M"))
+    """Record holding the complete metadata as JSON object, superseding previous ones."""
+
+
+def read_log_records(
+    data: bytes | memoryview, offset: int = 0
+) -> Iterator[tuple[LogRecord, bytes, int]]:
+    """
+    Iterate over the complete records in the contents of an ELVA log file.
+
+    An incomplete record at the end of `data` is skipped.
+
+    Arguments:
+        data: the contents of an ELVA log file, e.g. a view on a memory-mapped file.
+        offset: the position in `data` of the first record.
+
+    Raises:
+        ValueError: if a record has an unknown type.
+
+    Yields:
+        tuples of the record type, the payload and the position in `data` after the record.
+    """
+    view = memoryview(data)
+    size = len(view)
+
+    while offset < size:
+        try:
+            mb1, mb1_len = read_var_uint(view, offset)
+            mb2, mb2_len = read_var_uint(view, offset + mb1_len)
+            length, length_len = read_var_uint(view, offset + mb1_len + mb2_len)
+        except IndexError:
+            # the record header has been cut off
+            return
+
+        start = offset + mb1_len + mb2_len + length_len
+        end = start + length
+
+        if end > size:
+            # the record payload has been cut off
+            return
+
+        try:
+            record = LogRecord((mb1, mb2))
+        except ValueError:
+            raise ValueError(
+                f"unknown record type {mb1}, {mb2} at position {offset}"
+            ) from None
+
+        yield record, bytes(view[start:end]), end
+
+        offset = end
+
+
+def get_log_metadata(path: str | Path) -> dict:
+    """
+    Retrieve metadata from a given ELVA log file.
+
+    Arguments:
+        path: path to the ELVA log file.
+
+    Raises:
+        FileNotFoundError: if there is no file present.
+        ValueError: if the file is not an ELVA log file or holds an unknown record type.
+
+    Returns:
+        mapping of metadata keys to values as of the last metadata record, without the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+    """
+    metadata = dict()
+
+    with open(path, "rb") as file:
+        if file.read(len(LOG_HEADER)) != LOG_HEADER:
+            raise ValueError(f"'{path}' is not an ELVA log file")
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for record, payload, _ in read_log_records(view, len(LOG_HEADER)):
+                    if record == LogRecord.METADATA:
+                        metadata = json.loads(payload)
+            finally:
+                view.release()
+
+    return {key: value for key, value in metadata.items() if key not in RESERVED_KEYS}
+
+
+MAX_BUFFER_BYTES = 64 * 1024 * 1024
+"""Default maximum number of bytes of updates a store holds in memory before spilling them to disk."""
+
+SPILL_SUFFIX = ".spill"
+"""Suffix appended to the path of a store's file to get the path of its spill file."""
+
+
+class UpdateBuffer:
+    """
+    Buffer of Y updates bounded by their size in bytes.
+
+    Putting an update never blocks or fails, so it is safe to be called from a Y Document observer.
+    When the updates held in memory exceed the size limit, they are merged into a single update.
+    If that still exceeds the limit, it is spilled to a side file as [`LogRecord.UPDATE`][elva.store.LogRecord.UPDATE].
+    Spilled updates are taken out first.
+
+    A spill file left over from a crash is picked up on creation, so its updates are not lost.
+    """
+
+    max_bytes: int
+    """Maximum number of bytes of updates held in memory."""
+
+    spill_path: None | pathlib.Path
+    """Path of the side file to spill updates to, or `None` for an anonymous temporary file."""
+
+    stats: Counter
+    """Counters of `coalesced` updates, `spills` and `spilled_bytes`."""
+
+    peak_bytes: int
+    """Maximum number of bytes of updates held in memory so far."""
+
+    _updates: deque[bytes]
+    """Updates held in memory, oldest first."""
+
+    _size: int
+    """Number of bytes of the updates held in memory."""
+
+    _spill: None | BinaryIO
+    """File object of the side file, opened on the first spill."""
+
+    _spill_offset: int
+    """Position of the next unread record in the side file."""
+
+    _spill_end: int
+    """Position after the last record in the side file."""
+
+    _spilled: int
+    """Number of unread records in the side file."""
+
+    _nonempty: Event
+    """Event set when an update is put into the empty buffer."""
+
+    def __init__(
+        self, max_bytes: int = MAX_BUFFER_BYTES, spill_path: None | str = None
+    ):
+        """
+        Arguments:
+            max_bytes: maximum number of bytes of updates held in memory.
+            spill_path: path of the side file to spill updates to. If `None`, an anonymous temporary file is used.
+        """
+        self.max_bytes = max_bytes
+        self.spill_path = pathlib.Path(spill_path) if spill_path is not None else None
+        self.stats = Counter()
+        self.peak_bytes = 0
+
+        self._updates = deque()
+        self._size = 0
+        self._spill = None
+        self._spill_offset = 0
+        self._spill_end = 0
+        self._spilled = 0
+        self._nonempty = Event()
+
+        if self.spill_path is not None and self.spill_path.exists():
+            self._recover()
+
+    @property
+    def depth(self) -> int:
+        """Number of buffered updates, in memory and spilled."""
+        return len(self._updates) + self._spilled
+
+    @property
+    def size(self) -> int:
+        """Number of bytes of the updates held in memory."""
+        return self._size
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Number of bytes of unread records in the side file."""
+        return self._spill_end - self._spill_offset
+
+    def statistics(self) -> dict:
+        """
+        Get the metrics of this buffer.
+
+        Returns:
+            mapping of the buffer `depth`, the `bytes` held in memory, their `peak_bytes`, the unread `spilled_bytes` on disk and the counters in [`stats`][elva.store.UpdateBuffer.stats].
+        """
+        return {
+            "depth": self.depth,
+            "bytes": self.size,
+            "peak_bytes": self.peak_bytes,
+            "coalesced": self.stats["coalesced"],
+            "spills": self.stats["spills"],
+            "spilled_bytes": self.spilled_bytes,
+        }
+
+    def put(self, update: bytes):
+        """
+        Add an update to the buffer, coalescing and spilling the buffered updates if they exceed the size limit.
+
+        Arguments:
+            update: the update to add.
+        """
+        self._updates.append(update)
+        self._size += len(update)
+        self.peak_bytes = max(self.peak_bytes, self._size)
+
+        if self._size > self.max_bytes:
+            self._coalesce()
+
+            if self._size > self.max_bytes:
+                self._spill_updates()
+
+        self._nonempty.set()
+
+    def get_nowait(self) -> bytes:
+        """
+        Take the oldest update out of the buffer.
+
+        Raises:
+            WouldBlock: if the buffer is empty.
+
+        Returns:
+            the oldest update.
+        """
+        if self._spilled:
+            return self._read_spilled()
+
+        try:
+            update = self._updates.popleft()
+        except IndexError:
+            if self._nonempty.is_set():
+                self._nonempty = Event()
+            raise WouldBlock from None
+
+        self._size -= len(update)
+        return update
+
+    async def get(self) -> bytes:
+        """
+        Take the oldest update out of the buffer, waiting for one if the buffer is empty.
+
+        Returns:
+            the oldest update.
+        """
+        while True:
+            try:
+                return self.get_nowait()
+            except WouldBlock:
+                await self._nonempty.wait()
+
+    def read_spilled(self) -> Iterator[bytes]:
+        """
+        Iterate over the unread spilled updates without taking them out of the buffer.
+
+        Yields:
+            the spilled updates, oldest first.
+        """
+        if not self._spilled:
+            return
+
+        self._spill.seek(self._spill_offset)
+        data = self._spill.read(self._spill_end - self._spill_offset)
+
+        for _, payload, _ in read_log_records(data):
+            yield payload
+
+    def close(self):
+        """
+        Close the side file and remove it if all spilled updates have been taken out.
+        """
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+        if self.spill_path is not None and not self._spilled:
+            self.spill_path.unlink(missing_ok=True)
+
+    def _coalesce(self):
+        """
+        Merge all updates held in memory into a single one.
+        """
+        if len(self._updates) < 2:
+            return
+
+        self.stats["coalesced"] += len(self._updates)
+
+        update = merge_updates(*self._updates)
+        self._updates.clear()
+        self._updates.append(update)
+        self._size = len(update)
+
+    def _spill_updates(self):
+        """
+        Append the updates held in memory to the side file.
+        """
+        if self._spill is None:
+            self._open_spill()
+
+        data = b"".join(LogRecord.UPDATE.encode(update)[0] for update in self._updates)
+
+        self._spill.seek(self._spill_end)
+        self._spill.write(data)
+        self._spill.flush()
+
+        self._spill_end += len(data)
+        self._spilled += len(self._updates)
+        self.stats["spills"] += 1
+        self.stats["spilled_bytes"] += len(data)
+
+        self._updates.clear()
+        self._size = 0
+
+    def _read_spilled(self) -> bytes:
+        """
+        Read the oldest unread record from the side file.
+
+        Returns:
+            the update in the record.
+        """
+        # the record type has two single-byte magic bytes,
+        # followed by the length of at most 10 bytes
+        self._spill.seek(self._spill_offset + 2)
+        length, length_len = read_var_uint(self._spill.read(10))
+
+        start = self._spill_offset + 2 + length_len
+        self._spill.seek(start)
+        update = self._spill.read(length)
+
+        self._spill_offset = start + length
+        self._spilled -= 1
+
+        if not self._spilled:
+            # start over to keep the side file small
+            self._spill.truncate(0)
+            self._spill_offset = 0
+            self._spill_end = 0
+
+        return update
+
+    def _open_spill(self):
+        """
+        Open the side file for reading and writing.
+        """
+        if self.spill_path is None:
+            self._spill = tempfile.TemporaryFile(prefix="elva-spill-")
+        else:
+            self._spill = open(self.spill_path, "w+b")
+
+    def _recover(self):
+        """
+        Pick up the records in a spill file left over from a crash.
+        """
+        self._spill = open(self.spill_path, "r+b")
+        data = self._spill.read()
+
+        for _, _, end in read_log_records(data):
+            self._spilled += 1
+            self._spill_end = end
+
+        # cut off an incomplete record
+        self._spill.truncate(self._spill_end)
+
+        if self._spilled:
+            self._nonempty.set()
+
+
+StoreState = create_component_state("StoreState")
+"""The states of the [`Store`][elva.store.Store] component."""
+
+
+class Store(Component, ABC):
+    """
+    Base class of store components saving the updates of a Y Document.
+
+    On start, a store loads the saved updates into the Y Document and appends the divergent contents of it.
+    While running, changes in the Y Document are buffered and appended in batches.
+    On stop, the remaining buffered updates are appended before the store closes.
+
+    Subclasses implement the storage specific methods [`load`][elva.store.Store.load],
+    [`append`][elva.store.Store.append], [`compact`][elva.store.Store.compact],
+    [`get_metadata`][elva.store.Store.get_metadata] and [`set_metadata`][elva.store.Store.set_metadata].
+    """
+
+    suffix: str = FILE_SUFFIX
+    """File name suffix of the files written by this store."""
+
+    ydoc: Doc
+    """Instance of the synchronized Y Document."""
+
+    identifier: None | str
+    """Identifier of the synchronized Y Document."""
+
+    max_batch_size: int
+    """Maximum number of updates written in a single transaction."""
+
+    max_batch_latency: float
+    """Maximum number of seconds to wait for further updates before writing a batch."""
+
+    merge_batch: bool
+    """Flag whether to merge a batch of updates into a single one before writing."""
+
+    compact_rows: None | int
+    """Number of stored updates above which the store compacts them."""
+
+    compact_bytes: None | int
+    """Number of bytes of stored updates above which the store compacts them."""
+
+    max_buffer_bytes: int
+    """Maximum number of bytes of updates held in memory before they are spilled to disk."""
+
+    buffer: UpdateBuffer
+    """(while running) Buffer of the updates waiting to be written."""
+
+    _lock: Lock
+    """Object for restricted resource management."""
+
+    _subscription: Subscription
+    """(while running) Object holding subscription information to changes in [`ydoc`][elva.store.Store.ydoc]."""
+
+    _num_rows: int
+    """(while running) Number of stored updates."""
+
+    _num_bytes: int
+    """(while running) Number of bytes of all stored updates."""
+
+    def __init__(
+        self,
+        ydoc: Doc,
+        identifier: None | str,
+        max_batch_size: int = 1,
+        max_batch_latency: float = 0,
+        merge_batch: bool = False,
+        compact_rows: None | int = None,
+        compact_bytes: None | int = None,
+        max_buffer_bytes: int = MAX_BUFFER_BYTES,
+    ):
+        """
+        Updates are written in batches of up to `max_batch_size` updates.
+        A batch consists of all updates buffered at the time of writing.
+        With `max_batch_latency` greater than zero, the store additionally waits
+        up to that many seconds for the batch to fill up.
+
+        When writing falls behind, the buffered updates are merged and spilled to disk
+        once they exceed `max_buffer_bytes`, see [`UpdateBuffer`][elva.store.UpdateBuffer].
+
+        Arguments:
+            ydoc: instance of the synchronized Y Document.
+            identifier: identifier of the synchronized Y Document. If `None`, it is tried to be retrieved from the stored metadata.
+            max_batch_size: maximum number of updates written in a single transaction.
+            max_batch_latency: maximum number of seconds to wait for further updates before writing a batch.
+            merge_batch: flag whether to merge a batch of updates into a single one before writing.
+            compact_rows: number of stored updates above which the store compacts them while running. If `None`, the number of updates does not trigger a compaction.
+            compact_bytes: number of bytes of stored updates above which the store compacts them while running. If `None`, the size does not trigger a compaction.
+            max_buffer_bytes: maximum number of bytes of updates held in memory before they are spilled to disk.
+        """
+        self.ydoc = ydoc
+        self.identifier = identifier
+        self.max_batch_size = max_batch_size
+        self.max_batch_latency = max_batch_latency
+        self.merge_batch = merge_batch
+        self.compact_rows = compact_rows
+        self.compact_bytes = compact_bytes
+        self.max_buffer_bytes = max_buffer_bytes
+
+        self._lock = Lock()
+        self._num_rows = 0
+        self._num_bytes = 0
+
+    @property
+    def states(self) -> StoreState:
+        """The states this component can have."""
+        return StoreState
+
+    @property
+    def spill_path(self) -> None | str:
+        """Path of the file the buffer spills updates to, or `None` for an anonymous temporary file."""
+        return None
+
+    @classmethod
+    def get_options(cls, config: dict) -> dict:
+        """
+        Pick the keyword arguments specific to this store from a configuration mapping.
+
+        Arguments:
+            config: mapping of configuration parameters to their values.
+
+        Returns:
+            mapping of keyword arguments to their values.
+        """
+        return dict()
+
+    @classmethod
+    def read_metadata(cls, path: str | Path, **options: dict) -> dict:
+        """
+        Retrieve the metadata from a file written by this store without starting it.
+
+        Stores not writing a file of their own do not support this.
+
+        Arguments:
+            path: path of the file written by this store.
+            options: keyword arguments as picked by [`get_options`][elva.store.Store.get_options].
+
+        Raises:
+            NotImplementedError: if this store does not write a file of its own.
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        raise NotImplementedError(f"{cls.__name__} does not write a file of its own")
+
+    @abstractmethod
+    async def load(self) -> None | bytes:
+        """
+        Read the stored updates and merge them into a single update.
+
+        It sets the number and size of the stored updates as well.
+
+        Returns:
+            the merged update or `None` if there are no stored updates.
+        """
+
+    @abstractmethod
+    async def append(self, updates: list[bytes]):
+        """
+        Store `updates` after the already stored ones.
+
+        Arguments:
+            updates: the updates to store.
+        """
+
+    @abstractmethod
+    async def compact(self, snapshot: bool = False):
+        """
+        Replace all updates stored so far by a single merged update.
+
+        Arguments:
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+        """
+
+    @abstractmethod
+    async def get_metadata(self) -> dict:
+        """
+        Retrieve the stored metadata.
+
+        Returns:
+            mapping of metadata keys to values.
+        """
+
+    @abstractmethod
+    async def set_metadata(self, metadata: dict, replace: bool = False):
+        """
+        Set given metadata.
+
+        Arguments:
+            metadata: mapping of metadata keys to values.
+            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+
+    def _on_transaction_event(self, event: TransactionEvent):
+        """
+        Hook called on changes in [`ydoc`][elva.store.Store.ydoc].
+
+        When called, the `event` data are put into the buffer.
+
+        Arguments:
+            event: object holding event information of changes in [`ydoc`][elva.store.Store.ydoc].
+        """
+        self.log.debug(f"transaction event triggered with update {event.update}")
+
+        spills = self.buffer.stats["spills"]
+        self.buffer.put(event.update)
+
+        if self.buffer.stats["spills"] > spills:
+            self.log.warning(
+                f"spilled buffered updates to disk, {self.buffer.spilled_bytes} bytes pending"
+            )
+
+    async def _open(self):
+        """
+        Hook opening the storage before the stored updates are loaded.
+        """
+
+    async def _close(self):
+        """
+        Hook closing the storage after the remaining updates have been appended.
+        """
+
+    async def _ensure_identifier(self):
+        """
+        Hook retrieving the identifier from the stored metadata if not given, or saving it otherwise.
+        """
+        metadata = await self.get_metadata()
+
+        if self.identifier is None:
+            self.identifier = metadata.get("identifier", None)
+        elif metadata.get("identifier") != self.identifier:
+            await self.set_metadata({"identifier": self.identifier})
+
+        self.log.debug("ensured identifier")
+
+    async def _merge(self):
+        """
+        Hook to load and apply the stored updates and to append divergent history updates.
+        """
+        update = await self.load()
+        state = get_state(update) if update is not None else STATE_ZERO
+
+        # the given ydoc might not be empty;
+        # we append the resulting update as otherwise
+        # histories would not be restored correctly and callbacks not triggered,
+        # even when sequential updates from this history branch are applied
+        divergent_update = self.ydoc.get_update(state=state)
+
+        if update is not None:
+            self.ydoc.apply_update(update)
+            self.log.debug("applied stored updates")
+
+        if divergent_update != EMPTY_UPDATE:
+            # shield the write so content won't get lost
+            with CancelScope(shield=True):
+                await self._write(divergent_update)
+
+            self.log.debug("appended divergent history update")
+
+    async def _write(self, update: bytes):
+        """
+        Hook appending a single `update`.
+
+        Arguments:
+            update: the update to append.
+        """
+        await self._write_batch([update])
+
+    async def _write_batch(self, updates: list[bytes]):
+        """
+        Hook appending `updates` at once.
+
+        If [`merge_batch`][elva.store.Store.merge_batch] is set, the updates are merged into one before.
+
+        Arguments:
+            updates: the updates to append.
+        """
+        if self.merge_batch and len(updates) > 1:
+            updates = [merge_updates(*updates)]
+
+        await self.append(updates)
+
+    def _get_written_state(self) -> None | bytes:
+        """
+        Get the state vector of the stored updates after writing the updates taken from the buffer.
+
+        This is the state of [`ydoc`][elva.store.Store.ydoc] as long as no updates are left in the buffer,
+        since every change in `ydoc` is put into the buffer right away.
+
+        Returns:
+            the state vector of the stored updates, or `None` if it is unknown.
+        """
+        if hasattr(self, "buffer") and self.buffer.depth > 0:
+            return None
+
+        return self.ydoc.get_state()
+
+    def _needs_compaction(self) -> bool:
+        """
+        Check whether the stored updates exceed the compaction thresholds.
+
+        Returns:
+            `True` if either [`compact_rows`][elva.store.Store.compact_rows] or [`compact_bytes`][elva.store.Store.compact_bytes] is exceeded, else `False`.
+        """
+        if self._num_rows <= 1:
+            return False
+
+        if self.compact_rows is not None and self._num_rows > self.compact_rows:
+            return True
+
+        if self.compact_bytes is not None and self._num_bytes > self.compact_bytes:
+            return True
+
+        return False
+
+    async def _collect_batch(self, batch: list[bytes]):
+        """
+        Hook adding further updates from the internal buffer to `batch`.
+
+        It takes all updates already buffered and waits for more
+        up to [`max_batch_latency`][elva.store.Store.max_batch_latency] seconds,
+        until the batch holds [`max_batch_size`][elva.store.Store.max_batch_size] updates.
+
+        Arguments:
+            batch: the list of updates to extend in-place.
+        """
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.buffer.get_nowait())
+            except WouldBlock:
+                break
+
+        if self.max_batch_latency > 0:
+            with move_on_after(self.max_batch_latency):
+                while len(batch) < self.max_batch_size:
+                    batch.append(await self.buffer.get())
+
+    async def before(self):
+        """
+        Hook executed before the component sets its `RUNNING` state.
+
+        The storage is opened and the stored updates are loaded.
+        Updates spilled but not written before a crash are applied as well.
+        Also, the component subscribes to changes in [`ydoc`][elva.store.Store.ydoc].
+        """
+        await self._open()
+        await self._merge()
+        await self._ensure_identifier()
+
+        # initialize buffer
+        self.buffer = UpdateBuffer(self.max_buffer_bytes, self.spill_path)
+        self.log.debug("instantiated buffer")
+
+        if self.buffer.depth:
+            # they get written by the run loop
+            for update in self.buffer.read_spilled():
+                self.ydoc.apply_update(update)
+
+            self.log.warning(f"recovered {self.buffer.depth} spilled updates")
+
+        # start watching for updates on the YDoc
+        self._subscription = self.ydoc.observe(self._on_transaction_event)
+        self.log.debug("subscribed to YDoc updates")
+
+    async def run(self):
+        """
+        Hook appending updates from the internal buffer.
+        """
+        self.log.debug("listening for updates")
+
+        while True:
+            update = await self.buffer.get()
+            self.log.debug(f"received update {update}")
+
+            batch = [update]
+
+            try:
+                await self._collect_batch(batch)
+            finally:
+                with CancelScope(shield=True):
+                    # writing needs to be shielded from cancellation,
+                    # but is required to return quickly;
+                    # updates already collected are written also on cancellation
+                    await self._write_batch(batch)
+
+                    if self._needs_compaction():
+                        await self.compact()
+
+    async def cleanup(self):
+        """
+        Hook cancelling subscription to changes, appending the remaining updates and closing the storage.
+        """
+        if hasattr(self, "_subscription"):
+            # unsubscribe from YDoc updates, otherwise transactions will fail
+            self.ydoc.unobserve(self._subscription)
+            del self._subscription
+            self.log.debug("unsubscribed from YDoc updates")
+
+        if hasattr(self, "buffer"):
+            # drain the buffer and write the remaining updates in chunks
+            while self.buffer.depth:
+                updates = []
+                while len(updates) < CHUNK_SIZE:
+                    try:
+                        updates.append(self.buffer.get_nowait())
+                    except WouldBlock:
+                        break
+
+                await self._write_batch(updates)
+
+            self.log.debug("drained buffer")
+
+            # remove buffer
+            self.buffer.close()
+            del self.buffer
+            self.log.debug("deleted buffer")
+
+        # now we can close the storage
+        await self._close()
+
+
+SQLiteStoreState = create_component_state("SQLiteStoreState")
+"""The states of the [`SQLiteStore`][elva.store.SQLiteStore] component."""
+
+
+class SQLiteStore(Store):
+    """
+    Store component saving Y updates in an ELVA SQLite database.
+    """
+
+    path: Path
+    """Path where to store the SQLite database."""
+
+    pragmas: dict
+    """Mapping of SQLite pragma names to their values applied on connecting."""
+
+    _db: Connection
+    """(while running) SQLite connection to the database file at [`path`][elva.store.SQLiteStore.path]."""
+
+    _cursor: Cursor
+    """(while running) SQLite cursor operating on the [`_db`][elva.store.SQLiteStore._db] connection."""
+
+    def __init__(
+        self,
+        ydoc: Doc,
+        identifier: str | None,
+        path: str,
+        max_batch_size: int = 1,
+        max_batch_latency: float = 0,
+        merge_batch: bool = False,
+        pragmas: None | dict = None,
+        compact_rows: None | int = None,
+        compact_bytes: None | int = None,
+        max_buffer_bytes: int = MAX_BUFFER_BYTES,
+    ):
+        """
+        Updates are written in batches, i.e. group commits, of up to `max_batch_size` updates.
+        A batch consists of all updates buffered at the time of writing.
+        With `max_batch_latency` greater than zero, the store additionally waits
+        up to that many seconds for the batch to fill up.
+
+        Arguments:
+            ydoc: instance of the synchronized Y Document.
+            identifier: identifier of the synchronized Y Document. If `None`, it is tried to be retrieved from the `metadata` table in the SQLite database.
+            path: path where to store the SQLite database.
+            max_batch_size: maximum number of updates written in a single transaction.
+            max_batch_latency: maximum number of seconds to wait for further updates before writing a batch.
+            merge_batch: flag whether to merge a batch of updates into a single one before writing.
+            pragmas: mapping of SQLite pragma names to their values applied on connecting, see [`PRAGMAS`][elva.store.PRAGMAS].
+            compact_rows: number of rows in the `yupdates` table above which the store compacts them while running. If `None`, the row count does not trigger a compaction.
+            compact_bytes: number of bytes in the `yupdates` table above which the store compacts them while running. If `None`, the size does not trigger a compaction.
+            max_buffer_bytes: maximum number of bytes of updates held in memory before they are spilled to `<path>.spill`.
+        """
+        super().__init__(
+            ydoc,
+            identifier,
+            max_batch_size=max_batch_size,
+            max_batch_latency=max_batch_latency,
+            merge_batch=merge_batch,
+            compact_rows=compact_rows,
+            compact_bytes=compact_bytes,
+            max_buffer_bytes=max_buffer_bytes,
+        )
+        self.path = Path(path)
+
+        # validate early
+        get_pragma_statements(pragmas)
+        self.pragmas = pragmas or dict()
+
+    @property
+    def states(self) -> SQLiteStoreState:
+        """The states this component can have."""
+        return SQLiteStoreState
+
+    @property
+    def spill_path(self) -> str:
+        """Path of the file the buffer spills updates to, next to the SQLite database."""
+        return f"{self.path}{SPILL_SUFFIX}"
+
+    @classmethod
+    def get_options(cls, config: dict) -> dict:
+        """
+        Pick the SQLite pragmas from a configuration mapping.
+
+        Arguments:
+            config: mapping of configuration parameters to their values.
+
+        Returns:
+            mapping with the `pragmas` keyword argument if any pragmas are set.
+        """
+        pragmas = get_pragmas(config)
+        return dict(pragmas=pragmas) if pragmas else dict()
+
+    @classmethod
+    def read_metadata(
+        cls, path: str | Path, pragmas: None | dict = None, **options: dict
+    ) -> dict:
+        """
+        Retrieve the metadata from an ELVA SQLite database, see [`get_metadata`][elva.store.get_metadata].
+
+        Arguments:
+            path: path to the ELVA SQLite database.
+            pragmas: mapping of pragma names to their values.
+            options: further keyword arguments as picked by [`get_options`][elva.store.SQLiteStore.get_options].
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        return get_metadata(pathlib.Path(path), pragmas)
+
+    async def get_metadata(self) -> dict:
+        """
+        Retrieve metadata from a given ELVA SQLite database.
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`STATISTICS_KEYS`][elva.store.STATISTICS_KEYS].
+        """
+        # the cursor is shared with the writes of updates
+        async with self._lock:
+            await self._cursor.execute("SELECT * FROM metadata")
+            res = await self._cursor.fetchall()
+
+        return {key: value for key, value in res if key not in STATISTICS_KEYS}
+
+    async def get_statistics(self) -> dict:
+        """
+        Retrieve the persisted statistics about the updates in the ELVA SQLite database.
+
+        Returns:
+            mapping with the `state` vector of the updates, the number of `rows` and the total size in `bytes`.
+            Missing statistics are `None`.
+        """
+        async with self._lock:
+            await self._cursor.execute(
+                f"SELECT * FROM metadata WHERE key IN ({STATISTICS_PLACEHOLDERS})",
+                STATISTICS_KEYS,
+            )
+            res = await self._cursor.fetchall()
+
+        return _to_statistics(dict(res))
+
+    async def set_metadata(self, metadata: dict, replace: bool = False):
+        """
+        Set given metadata in a given ELVA SQLite database.
+
+        Arguments:
+            metadata: mapping of metadata keys to values.
+            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        async with self._lock:
+            if replace:
+                # keep the statistics as they describe the `yupdates` table
+                await self._cursor.execute(
+                    f"DELETE FROM metadata WHERE key NOT IN ({RESERVED_PLACEHOLDERS})",
+                    RESERVED_KEYS,
+                )
+
+            for key, value in metadata.items():
+                # check for each item separately
+                try:
+                    await self._cursor.execute(
+                        "INSERT INTO metadata VALUES (?, ?)", (key, value)
+                    )
+                except sqlite3.IntegrityError:
+                    await self._cursor.execute(
+                        "UPDATE metadata SET value = ? WHERE key = ?", (value, key)
+                    )
+
+            await self._db.commit()
+
+        # ensure to update the identifier if given
+        self.identifier = metadata.get("identifier", None) or self.identifier
+
+    async def get_updates(self) -> list:
+        """
+        Read out the updates saved in the file.
+
+        Returns:
+            a list of updates in the order they were applied to the YDoc.
+        """
+        await self._cursor.execute("SELECT yupdate FROM yupdates")
+        updates = await self._cursor.fetchall()
+
+        if updates:
+            self.log.debug("read updates from file")
+        else:
+            self.log.debug("found no updates in file")
+
+        return updates
+
+    async def _ensure_metadata_table(self):
+        """
+        Hook called before the store sets its `RUNNING` state to ensure a table `metadata` exists.
+        """
+        async with self._lock:
+            await self._cursor.execute(
+                "CREATE TABLE IF NOT EXISTS metadata(key PRIMARY KEY, value)"
+            )
+            await self._db.commit()
+
+        self.log.debug("ensured metadata table")
+
+    async def _ensure_identifier(self):
+        """
+        Hook called before the store sets its `started` signal to ensure the UUID of the YDoc contents is saved.
+        """
+        # a specific identifier was not given; try to get it from metadata
+        if self.identifier is None:
+            metadata = await self.get_metadata()
+            self.identifier = metadata.get("identifier", None)
+            return
+
+        # a specific identifier was given; update the metadata
+        async with self._lock:
+            try:
+                # insert non-existing identifier
+                await self._cursor.execute(
+                    "INSERT INTO metadata VALUES (?, ?)",
+                    ["identifier", self.identifier],
+                )
+            except sqlite3.IntegrityError:  # UNIQUE constraint failed
+                # update existing identifier
+                await self._cursor.execute(
+                    "UPDATE metadata SET value = ? WHERE key = ?",
+                    [self.identifier, "identifier"],
+                )
+            finally:
+                await self._db.commit()
+
+        self.log.debug("ensured identifier")
+
+    async def _ensure_update_table(self):
+        """
+        Hook called before the store sets its `started` signal to ensure a table `yupdates` exists.
+        """
+        async with self._lock:
+            await self._cursor.execute(
+                "CREATE TABLE IF NOT EXISTS yupdates(yupdate BLOB)"
+            )
+            await self._db.commit()
+
+        self.log.debug("ensured update table")
+
+    async def load(self) -> None | bytes:
+        """
+        Read the updates from the ELVA SQLite database in chunks and merge them into a single update.
+
+        Only [`CHUNK_SIZE`][elva.store.CHUNK_SIZE] rows are held in memory at once.
+        The event loop is released while fetching each chunk, so other tasks get to run in between.
+
+        Returns:
+            the merged update or `None` if there are no updates in the file.
+        """
+        await self._cursor.execute("SELECT yupdate FROM yupdates")
+
+        self._num_rows = 0
+        self._num_bytes = 0
+        merged = None
+
+        while rows := await self._cursor.fetchmany(CHUNK_SIZE):
+            self._num_rows += len(rows)
+            self._num_bytes += sum(len(update) for update, *_ in rows)
+            merged = merge_rows(merged, rows)
+
+        return merged
+
+    async def _merge(self):
+        """
+        Hook to read in and apply updates from the ELVA SQLite database and write divergent history updates to file.
+        """
+        statistics = await self.get_statistics()
+
+        # get updates stored in file as a single update
+        update = await self.load()
+
+        # the persisted statistics can only be relied on
+        # when they have been kept up to date with the rows read
+        consistent = (
+            statistics["rows"] == self._num_rows
+            and statistics["bytes"] == self._num_bytes
+            and statistics["state"] is not None
+        )
 
         # the given ydoc might not be empty;
         # we append the resulting update to file as otherwise
         # histories would not be restored correctly and callbacks not triggered,
         # even when sequential updates from this history branch are applied
-        temp = Doc()
+        if consistent:
+            state = statistics["state"]
+        elif update is not None:
+            state = get_state(update)
+        else:
+            state = STATE_ZERO
+
+        # get divergent update before we apply updates from file to `self.ydoc`
+        divergent_update = self.ydoc.get_update(state=state)
+
+        # apply updates at once
+        if update is not None:
+            self.ydoc.apply_update(update)
+            self.log.debug("applied updates from file")
+        else:
+            self.log.debug("found no updates in file")
+
+        # append a non-empty update to a divergent history branch to file as well
+        if divergent_update != EMPTY_UPDATE:
+            # shield the write so content won't get lost
+            with CancelScope(shield=True):
+                await self._write(divergent_update)
+
+            self.log.debug("appended divergent history update to file")
+        elif not consistent:
+            # the YDoc holds exactly the file contents now
+            async with self._lock:
+                await self._write_statistics(self.ydoc.get_state())
+                await self._db.commit()
+
+            self.log.debug("updated statistics")
+
+    async def _open(self):
+        """
+        Hook connecting to the database and ensuring the ELVA SQLite database scheme.
+        """
+        await self._connect_database()
+        await self._ensure_metadata_table()
+        await self._ensure_update_table()
+
+        self.log.info("initialized database")
+
+    async def _close(self):
+        """
+        Hook closing the database.
+        """
+        await self._disconnect_database()
+
+    async def _connect_database(self):
+        """
+        Hook connecting to the data base path and applying the pragmas.
+        """
+        self._db = await sqlite.connect(self.path)
+        self._cursor = await self._db.cursor()
+        self.log.debug(f"connected to database {self.path}")
+
+        for statement in get_pragma_statements(self.pragmas):
+            await self._cursor.execute(statement)
+            self.log.debug(f"executed '{statement}'")
+
+    async def _disconnect_database(self):
+        """
+        Hook closing the database connection if initialized.
+        """
+        if hasattr(self, "_db"):
+            await self._db.close()
+            self.log.debug("closed database")
+
+            # cleanup closed resources
+            del self._db
+
+        if hasattr(self, "_cursor"):
+            # cleanup closed resources
+            del self._cursor
+
+    async def append(self, updates: list[bytes]):
+        """
+        Write `updates` to the `yupdates` ELVA SQLite database table in a single transaction.
+
+        The statistics in the `metadata` table are updated within the same transaction.
+
+        Arguments:
+            updates: the updates to write to the ELVA SQLite database file.
+        """
+        # get the state before awaiting anything, so that it matches the file contents
+        state = self._get_written_state()
+
+        async with self._lock:
+            await self._cursor.executemany(
+                "INSERT INTO yupdates VALUES (?)",
+                [(update,) for update in updates],
+            )
+
+            self._num_rows += len(updates)
+            self._num_bytes += sum(len(update) for update in updates)
+            await self._write_statistics(state)
+
+            await self._db.commit()
+
+        self.log.debug(f"wrote {len(updates)} updates to file {self.path}")
+
+    async def _write_statistics(self, state: None | bytes):
+        """
+        Hook writing the statistics about the `yupdates` table to the `metadata` table.
+
+        It needs to be called with the lock being held and is committed with the surrounding transaction.
+
+        Arguments:
+            state: the state vector of the file contents or `None` to keep the persisted one.
+        """
+        values = [(ROWS_KEY, self._num_rows), (BYTES_KEY, self._num_bytes)]
+
+        if state is not None:
+            values.append((STATE_KEY, state))
+
+        await self._cursor.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)", values
+        )
+
+    async def compact(self, snapshot: bool = False):
+        """
+        Replace all updates written so far by a single merged update.
+
+        The compaction runs with [`compact_updates`][elva.store.compact_updates] in a worker thread
+        while holding the lock, so no updates are written in the meantime.
+
+        Arguments:
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+        """
+        async with self._lock:
+            num_rows, size = await to_thread.run_sync(
+                compact_updates, self.path, snapshot, self.pragmas
+            )
+
+        if num_rows > 1:
+            self._num_rows = 1
+            self._num_bytes = size
+
+        self.log.info(f"compacted {num_rows} updates into {size} bytes")
+
+
+LogStoreState = create_component_state("LogStoreState")
+"""The states of the [`LogStore`][elva.store.LogStore] component."""
+
+
+class LogStore(Store):
+    """
+    Store component saving Y updates in an append-only ELVA log file.
+
+    The file consists of [`LOG_HEADER`][elva.store.LOG_HEADER] followed by [`LogRecord`][elva.store.LogRecord]s.
+    Each batch of updates is appended with a single write call.
+    On start, the file is memory-mapped and replayed.
+    An incomplete record at its end, e.g. from a crash while writing, is cut off.
+    """
+
+    suffix: str = ".ylog"
+    """File name suffix of the files written by this store."""
+
+    path: Path
+    """Path of the log file."""
+
+    fsync: Literal["always", "interval", "never"]
+    """Policy when to flush written records to disk."""
+
+    fsync_interval: float
+    """Minimum number of seconds between two flushes with the `interval` policy."""
+
+    _file: FileIO
+    """(while running) Unbuffered file object appending to the log file."""
+
+    _metadata: dict
+    """(while running) Mapping of metadata keys to values as of the last metadata record."""
+
+    _synced_at: float
+    """Monotonic time of the last flush to disk."""
+
+    def __init__(
+        self,
+        ydoc: Doc,
+        identifier: None | str,
+        path: str,
+        max_batch_size: int = 1,
+        max_batch_latency: float = 0,
+        merge_batch: bool = False,
+        fsync: Literal["always", "interval", "never"] = "always",
+        fsync_interval: float = 1,
+        compact_rows: None | int = None,
+        compact_bytes: None | int = None,
+        max_buffer_bytes: int = MAX_BUFFER_BYTES,
+    ):
+        """
+        With `fsync = "always"`, every write is flushed to disk before the store continues.
+        With `fsync = "interval"`, a write is flushed when the last flush was at least `fsync_interval` seconds ago.
+        With `fsync = "never"`, flushing is left to the operating system entirely.
+        Except for `"never"`, the file is flushed on closing as well.
+
+        Arguments:
+            ydoc: instance of the synchronized Y Document.
+            identifier: identifier of the synchronized Y Document. If `None`, it is tried to be retrieved from the metadata in the log file.
+            path: path of the log file.
+            max_batch_size: maximum number of updates written at once.
+            max_batch_latency: maximum number of seconds to wait for further updates before writing a batch.
+            merge_batch: flag whether to merge a batch of updates into a single one before writing.
+            fsync: policy when to flush written records to disk.
+            fsync_interval: minimum number of seconds between two flushes with the `interval` policy.
+            compact_rows: number of update records above which the store compacts them while running. If `None`, the number of records does not trigger a compaction.
+            compact_bytes: number of bytes of updates above which the store compacts them while running. If `None`, the size does not trigger a compaction.
+            max_buffer_bytes: maximum number of bytes of updates held in memory before they are spilled to `<path>.spill`.
+        """
+        super().__init__(
+            ydoc,
+            identifier,
+            max_batch_size=max_batch_size,
+            max_batch_latency=max_batch_latency,
+            merge_batch=merge_batch,
+            compact_rows=compact_rows,
+            compact_bytes=compact_bytes,
+            max_buffer_bytes=max_buffer_bytes,
+        )
+        self.path = Path(path)
+
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"unknown fsync policy '{fsync}'")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._metadata = dict()
+        self._synced_at = time.monotonic()
+
+    @property
+    def states(self) -> LogStoreState:
+        """The states this component can have."""
+        return LogStoreState
+
+    @property
+    def spill_path(self) -> str:
+        """Path of the file the buffer spills updates to, next to the log file."""
+        return f"{self.path}{SPILL_SUFFIX}"
+
+    @classmethod
+    def get_options(cls, config: dict) -> dict:
+        """
+        Pick the fsync policy from a configuration mapping.
+
+        Arguments:
+            config: mapping of configuration parameters to their values.
+
+        Returns:
+            mapping of the `fsync` and `fsync_interval` keyword arguments which are set.
+        """
+        return {
+            key: config[key]
+            for key in ("fsync", "fsync_interval")
+            if config.get(key) is not None
+        }
+
+    @classmethod
+    def read_metadata(cls, path: str | Path, **options: dict) -> dict:
+        """
+        Retrieve the metadata from an ELVA log file, see [`get_log_metadata`][elva.store.get_log_metadata].
+
+        Arguments:
+            path: path to the ELVA log file.
+            options: keyword arguments as picked by [`get_options`][elva.store.LogStore.get_options].
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        return get_log_metadata(path)
+
+    async def get_metadata(self) -> dict:
+        """
+        Retrieve the metadata as of the last metadata record.
+
+        Returns:
+            mapping of metadata keys to values.
+        """
+        return dict(self._metadata)
+
+    async def set_metadata(self, metadata: dict, replace: bool = False):
+        """
+        Append a metadata record.
+
+        Arguments:
+            metadata: mapping of metadata keys to values.
+            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        if replace:
+            reserved = {
+                key: value
+                for key, value in self._metadata.items()
+                if key in RESERVED_KEYS
+            }
+            metadata = reserved | metadata
+        else:
+            metadata = self._metadata | metadata
+
+        data, _ = LogRecord.METADATA.encode(json.dumps(metadata).encode())
+
+        async with self._lock:
+            await self._write_data(data)
+            self._metadata = metadata
+
+        # ensure to update the identifier if given
+        self.identifier = metadata.get("identifier", None) or self.identifier
+
+    async def _open(self):
+        """
+        Hook opening the log file for appending, initializing it if it is new.
+        """
+        await self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = await to_thread.run_sync(self._open_file)
+        self.log.debug(f"opened log file {self.path}")
+
+    def _open_file(self) -> FileIO:
+        """
+        Open the log file for appending and write the header to a new file.
+
+        Returns:
+            the unbuffered file object.
+        """
+        file = open(self.path, "ab", buffering=0)
+
+        # in append mode, the position is at the end of the file
+        if file.tell() == 0:
+            file.write(LOG_HEADER)
+
+        return file
+
+    async def _close(self):
+        """
+        Hook flushing and closing the log file.
+        """
+        if hasattr(self, "_file"):
+            if self.fsync != "never":
+                await self._sync()
+
+            self._file.close()
+            del self._file
+            self.log.debug("closed log file")
+
+    async def load(self) -> None | bytes:
+        """
+        Replay the memory-mapped log file in a worker thread.
+
+        Updates are merged in chunks of [`CHUNK_SIZE`][elva.store.CHUNK_SIZE].
+        The metadata are set from the last metadata record.
+
+        Returns:
+            the merged update or `None` if there are no update records.
+        """
+        return await to_thread.run_sync(self._replay)
+
+    def _replay(self) -> None | bytes:
+        """
+        Read the records in the log file and cut off an incomplete record at its end.
+
+        Raises:
+            ValueError: if the file is not an ELVA log file or holds an unknown record type.
+
+        Returns:
+            the merged update or `None` if there are no update records.
+        """
+        self._num_rows = 0
+        self._num_bytes = 0
+        merged = None
+        rows = []
+
+        with open(self.path, "r+b") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[: len(LOG_HEADER)] != LOG_HEADER:
+                    raise ValueError(f"'{self.path}' is not an ELVA log file")
+
+                end = len(LOG_HEADER)
+                size = len(mm)
+
+                view = memoryview(mm)
+                try:
+                    for record, payload, end in read_log_records(view, end):
+                        match record:
+                            case LogRecord.UPDATE:
+                                self._num_rows += 1
+                                self._num_bytes += len(payload)
+                                rows.append((payload,))
+
+                                if len(rows) == CHUNK_SIZE:
+                                    merged = merge_rows(merged, rows)
+                                    rows = []
+                            case LogRecord.METADATA:
+                                self._metadata = json.loads(payload)
+                finally:
+                    view.release()
+
+            if end < size:
+                file.truncate(end)
+                self.log.warning(f"cut off {size - end} bytes of an incomplete record")
+
+        if rows:
+            merged = merge_rows(merged, rows)
+
+        return merged
+
+    async def append(self, updates: list[bytes]):
+        """
+        Append `updates` as records to the log file with a single write call.
+
+        Arguments:
+            updates: the updates to append.
+        """
+        data = b"".join(LogRecord.UPDATE.encode(update)[0] for update in updates)
+
+        async with self._lock:
+            await self._write_data(data)
+
+            self._num_rows += len(updates)
+            self._num_bytes += sum(len(update) for update in updates)
+
+        self.log.debug(f"appended {len(updates)} updates to file {self.path}")
+
+    async def _write_data(self, data: bytes):
+        """
+        Hook writing encoded records to the log file and flushing them according to the fsync policy.
+
+        It needs to be called with the lock being held.
+
+        Arguments:
+            data: the encoded records.
+        """
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view) :]
+
+        if self.fsync == "always" or (
+            self.fsync == "interval"
+            and time.monotonic() - self._synced_at >= self.fsync_interval
+        ):
+            await self._sync()
+
+    async def _sync(self):
+        """
+        Hook flushing the log file to disk in a worker thread.
+        """
+        await to_thread.run_sync(os.fsync, self._file.fileno())
+        self._synced_at = time.monotonic()
+
+    async def compact(self, snapshot: bool = False):
+        """
+        Replace all update records written so far by a single one.
+
+        A compacted copy of the log file is written and flushed in a worker thread
+        and replaces the log file atomically, while holding the lock.
+
+        Arguments:
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+        """
+        async with self._lock:
+            num_rows, size = await to_thread.run_sync(self._compact, snapshot)
+
+        self.log.info(f"compacted {num_rows} updates into {size} bytes")
+
+    def _compact(self, snapshot: bool) -> tuple[int, int]:
+        """
+        Write a compacted copy of the log file and replace the log file with it.
+
+        Arguments:
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+
+        Returns:
+            a tuple of the number of compacted records and the size of the resulting update in bytes.
+        """
+        merged = self._replay()
+        num_rows = self._num_rows
+
+        if num_rows <= 1:
+            return num_rows, self._num_bytes
+
+        if snapshot:
+            merged = encode_snapshot(merged)
+
+        records = [LOG_HEADER, LogRecord.UPDATE.encode(merged)[0]]
+        if self._metadata:
+            records.append(
+                LogRecord.METADATA.encode(json.dumps(self._metadata).encode())[0]
+            )
+
+        path = os.fspath(self.path)
+        compacted = f"{path}.compact"
+
+        with open(compacted, "wb") as file:
+            file.write(b"".join(records))
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._file.close()
+        os.replace(compacted, path)
+        self._file = open(path, "ab", buffering=0)
+
+        self._num_rows = 1
+        self._num_bytes = len(merged)
+
+        return num_rows, len(merged)
+
+
+ShardedSQLiteDatabaseState = create_component_state("ShardedSQLiteDatabaseState")
+"""The states of the [`ShardedSQLiteDatabase`][elva.store.ShardedSQLiteDatabase] component."""
+
+
+class ShardedSQLiteDatabase(Component):
+    """
+    Component saving the Y updates of many Y Documents in a fixed number of shared SQLite databases.
+
+    Each Y Document is assigned to a shard by its identifier.
+    One connection per shard is kept open and a single writer task writes
+    the buffered updates of all Y Documents in one transaction per shard.
+    """
+
+    path: Path
+    """Directory holding the shard files."""
+
+    shards: int
+    """Number of shards."""
+
+    max_batch_size: int
+    """Maximum number of updates written by the writer task at once."""
+
+    max_batch_latency: float
+    """Maximum number of seconds to wait for further updates before writing a batch."""
+
+    pragmas: dict
+    """Mapping of SQLite pragma names to their values applied on connecting."""
+
+    _dbs: list[Connection]
+    """(while running) SQLite connections to the shard files, ordered by shard index."""
+
+    _cursors: list[Cursor]
+    """(while running) SQLite cursors operating on the connections in [`_dbs`][elva.store.ShardedSQLiteDatabase._dbs]."""
+
+    _locks: list[Lock]
+    """Objects for restricted resource management, one per shard."""
+
+    _stream_send: MemoryObjectSendStream
+    """(while running) Stream to send identifiers, Y Document updates and statistics to."""
+
+    _stream_recv: MemoryObjectReceiveStream
+    """(while running) Stream to receive identifiers, Y Document updates and statistics from."""
+
+    _appended: int
+    """Number of updates appended so far."""
 
-        for update, *_ in updates:
-            temp.apply_update(update)
+    _written: int
+    """Number of appended updates written so far."""
 
-        # get divergent update before we apply updates from file to `self.ydoc`
-        divergent_update = self.ydoc.get_update(state=temp.get_state())
+    _writing: bool
+    """Flag whether the writer task is running."""
 
-        # cleanup unused resources
-        del temp
+    _stores: int
+    """Number of attached stores."""
 
-        # apply updates
-        for update, *_ in updates:
-            self.ydoc.apply_update(update)
+    _progress: Event
+    """Event set on written updates and detached stores, replaced afterwards."""
 
-        if updates:
-            self.log.debug("applied updates from file")
+    def __init__(
+        self,
+        path: str,
+        shards: int = 1,
+        max_batch_size: int = 1024,
+        max_batch_latency: float = 0,
+        pragmas: None | dict = None,
+    ):
+        """
+        Arguments:
+            path: directory holding the shard files.
+            shards: number of shards. It cannot be changed once the shard files exist.
+            max_batch_size: maximum number of updates written by the writer task at once.
+            max_batch_latency: maximum number of seconds to wait for further updates before writing a batch.
+            pragmas: mapping of SQLite pragma names to their values applied on connecting, see [`PRAGMAS`][elva.store.PRAGMAS].
+        """
+        self.path = Path(path)
 
-        # append a non-empty update to a divergent history branch to file as well
-        if divergent_update != EMPTY_UPDATE:
-            # shield the write so content won't get lost
-            with CancelScope(shield=True):
-                await self._write(divergent_update)
+        # validate early
+        check_shards(path, shards)
+        self.shards = shards
 
-            self.log.debug("appended divergent history update to file")
+        self.max_batch_size = max_batch_size
+        self.max_batch_latency = max_batch_latency
+
+        get_pragma_statements(pragmas)
+        self.pragmas = pragmas or dict()
+
+        self._locks = [Lock() for _ in range(shards)]
+        self._appended = 0
+        self._written = 0
+        self._writing = False
+        self._stores = 0
+        self._progress = Event()
 
-    async def _initialize(self):
+    @property
+    def states(self) -> ShardedSQLiteDatabaseState:
+        """The states this component can have."""
+        return ShardedSQLiteDatabaseState
+
+    def get_shard(self, identifier: str) -> int:
         """
-        Hook initializing the database, i.e. ensuring the presence of connection and the ELVA SQL database scheme.
+        Get the index of the shard holding a Y Document.
+
+        Arguments:
+            identifier: identifier of the Y Document.
+
+        Returns:
+            the index of the shard.
         """
-        # connect
-        await self._connect_database()
+        return get_shard(identifier, self.shards)
 
-        # ensure tables and identifier
-        await self._ensure_metadata_table()
-        await self._ensure_identifier()
-        await self._ensure_update_table()
+    async def append(
+        self, identifier: str, update: bytes, statistics: None | dict = None
+    ):
+        """
+        Put an update into the buffer of the writer task, waiting for free space if it is full.
 
-        # merge updates from file with the contents from the given YDoc
-        await self._merge()
+        Arguments:
+            identifier: identifier of the Y Document the update belongs to.
+            update: the update to write.
+            statistics: mapping of keys in [`STATISTICS_KEYS`][elva.store.STATISTICS_KEYS] to their values after writing `update`, written in the same transaction.
+        """
+        await self._stream_send.send((identifier, update, statistics))
+        self._appended += 1
 
-        self.log.info("initialized database")
+        # the cleanup takes over from the stopped writer task
+        if not self._writing:
+            self._notify()
 
-    async def _connect_database(self):
+    async def flush(self):
         """
-        Hook connecting to the data base path.
+        Wait until all updates appended so far have been written.
+
+        It returns early when the writer task stops, as the remaining
+        updates are written on cleanup.
         """
-        self._db = await sqlite.connect(self.path)
-        self._cursor = await self._db.cursor()
-        self.log.debug(f"connected to database {self.path}")
+        target = self._appended
 
-    async def _disconnect_database(self):
+        while self._writing and self._written < target:
+            await self._progress.wait()
+
+    def attach(self):
         """
-        Hook closing the database connection if initialized.
+        Register a store appending updates.
+
+        On cleanup, the database waits for all attached stores to detach before writing the remaining updates.
         """
-        if hasattr(self, "_db"):
-            await self._db.close()
-            self.log.debug("closed database")
+        self._stores += 1
 
-            # cleanup closed resources
-            del self._db
+    def detach(self):
+        """
+        Unregister a store appending updates.
+        """
+        self._stores -= 1
+        self._notify()
 
-        if hasattr(self, "_cursor"):
-            # cleanup closed resources
-            del self._cursor
+    def _notify(self):
+        """
+        Wake up all tasks waiting for progress.
+        """
+        self._progress.set()
+        self._progress = Event()
 
-    async def _write(self, update: bytes):
+    async def read(self, identifier: str) -> tuple[None | bytes, int, int]:
         """
-        Hook writing `update` to the `yupdates` ELVA SQLite database table.
+        Read the updates of a Y Document in chunks and merge them into a single update.
+
+        Only [`CHUNK_SIZE`][elva.store.CHUNK_SIZE] rows are held in memory at once.
+        The event loop is released while fetching each chunk, so other tasks get to run in between.
 
         Arguments:
-            update: the update to write to the ELVA SQLite database file.
+            identifier: identifier of the Y Document.
+
+        Returns:
+            a tuple of the merged update or `None` if there are no updates, the number of updates and their size in bytes.
         """
-        async with self._lock:
-            await self._cursor.execute(
-                "INSERT INTO yupdates VALUES (?)",
-                [update],
+        index = self.get_shard(identifier)
+        cursor = self._cursors[index]
+
+        async with self._locks[index]:
+            await cursor.execute(
+                "SELECT yupdate FROM yupdates WHERE identifier = ? ORDER BY rowid",
+                (identifier,),
             )
-            await self._db.commit()
 
-        self.log.debug(f"wrote update {update} to file {self.path}")
+            num_rows = 0
+            num_bytes = 0
+            merged = None
+            while rows := await cursor.fetchmany(CHUNK_SIZE):
+                num_rows += len(rows)
+                num_bytes += sum(len(update) for update, *_ in rows)
+                merged = merge_rows(merged, rows)
+
+        return merged, num_rows, num_bytes
+
+    async def get_metadata(self, identifier: str) -> dict:
+        """
+        Retrieve the metadata of a Y Document.
+
+        Arguments:
+            identifier: identifier of the Y Document.
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`STATISTICS_KEYS`][elva.store.STATISTICS_KEYS].
+        """
+        index = self.get_shard(identifier)
+        cursor = self._cursors[index]
+
+        async with self._locks[index]:
+            await cursor.execute(
+                "SELECT key, value FROM metadata WHERE identifier = ?", (identifier,)
+            )
+            res = await cursor.fetchall()
+
+        return {key: value for key, value in res if key not in STATISTICS_KEYS}
+
+    async def get_statistics(self, identifier: str) -> dict:
+        """
+        Retrieve the persisted statistics about the updates of a Y Document.
+
+        Arguments:
+            identifier: identifier of the Y Document.
+
+        Returns:
+            mapping with the `state` vector of the updates, the number of `rows` and the total size in `bytes`.
+            Missing statistics are `None`.
+        """
+        index = self.get_shard(identifier)
+        cursor = self._cursors[index]
+
+        async with self._locks[index]:
+            await cursor.execute(
+                f"SELECT key, value FROM metadata WHERE identifier = ? AND key IN ({STATISTICS_PLACEHOLDERS})",
+                (identifier, *STATISTICS_KEYS),
+            )
+            res = await cursor.fetchall()
+
+        return _to_statistics(dict(res))
+
+    async def set_metadata(
+        self, identifier: str, metadata: dict, replace: bool = False
+    ):
+        """
+        Set the metadata of a Y Document.
+
+        Arguments:
+            identifier: identifier of the Y Document.
+            metadata: mapping of metadata keys to values.
+            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        index = self.get_shard(identifier)
+        cursor = self._cursors[index]
+
+        async with self._locks[index]:
+            if replace:
+                await cursor.execute(
+                    f"DELETE FROM metadata WHERE identifier = ? AND key NOT IN ({RESERVED_PLACEHOLDERS})",
+                    (identifier, *RESERVED_KEYS),
+                )
+
+            await cursor.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                [(identifier, key, value) for key, value in metadata.items()],
+            )
+            await self._dbs[index].commit()
+
+    async def compact(self, identifier: str, snapshot: bool = False) -> tuple[int, int]:
+        """
+        Replace all updates of a Y Document written so far by a single merged update.
+
+        Arguments:
+            identifier: identifier of the Y Document.
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+
+        Returns:
+            a tuple of the number of compacted updates and the size of the resulting update in bytes.
+        """
+        index = self.get_shard(identifier)
+        cursor = self._cursors[index]
+
+        async with self._locks[index]:
+            await cursor.execute(
+                "SELECT rowid, yupdate FROM yupdates WHERE identifier = ? ORDER BY rowid",
+                (identifier,),
+            )
+
+            num_rows = 0
+            last_rowid = None
+            merged = None
+
+            while rows := await cursor.fetchmany(CHUNK_SIZE):
+                num_rows += len(rows)
+                last_rowid = rows[-1][0]
+                merged = await to_thread.run_sync(merge_rows, merged, rows)
+
+            if num_rows > 1:
+                if snapshot:
+                    merged = await to_thread.run_sync(encode_snapshot, merged)
+
+                await cursor.execute(
+                    "DELETE FROM yupdates WHERE identifier = ? AND rowid <= ?",
+                    (identifier, last_rowid),
+                )
+                await cursor.execute(
+                    "INSERT INTO yupdates(rowid, identifier, yupdate) VALUES (?, ?, ?)",
+                    (last_rowid, identifier, merged),
+                )
+
+                # the state vector does not change, but the size of the updates does
+                await cursor.executemany(
+                    "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                    ((identifier, ROWS_KEY, 1), (identifier, BYTES_KEY, len(merged))),
+                )
+                await self._dbs[index].commit()
+
+        size = len(merged) if merged is not None else 0
+        self.log.info(f"compacted {num_rows} updates of {identifier} into {size} bytes")
+
+        return num_rows, size
+
+    async def _write_batch(self, batch: list[tuple[str, bytes, None | dict]]):
+        """
+        Hook writing a batch of updates in a single transaction per shard.
+
+        The latest statistics of each Y Document are written within the same transaction.
+
+        Arguments:
+            batch: list of identifiers, updates and statistics to write.
+        """
+        rows = defaultdict(list)
+        statistics = defaultdict(dict)
+        for identifier, update, update_statistics in batch:
+            index = self.get_shard(identifier)
+            rows[index].append((identifier, update))
+
+            if update_statistics is not None:
+                statistics[index].setdefault(identifier, dict()).update(
+                    update_statistics
+                )
+
+        for index, shard_rows in rows.items():
+            values = [
+                (identifier, key, value)
+                for identifier, values in statistics[index].items()
+                for key, value in values.items()
+            ]
+
+            async with self._locks[index]:
+                await self._cursors[index].executemany(
+                    "INSERT INTO yupdates VALUES (?, ?)", shard_rows
+                )
+                await self._cursors[index].executemany(
+                    "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", values
+                )
+                await self._dbs[index].commit()
+
+        self._written += len(batch)
+        self._notify()
+
+        self.log.debug(f"wrote {len(batch)} updates to {len(rows)} shards")
+
+    async def _collect_batch(self, batch: list[tuple[str, bytes, None | dict]]):
+        """
+        Hook adding further updates from the internal buffer to `batch`.
+
+        Arguments:
+            batch: the list of identifiers, updates and statistics to extend in-place.
+        """
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._stream_recv.receive_nowait())
+            except WouldBlock:
+                break
+
+        if self.max_batch_latency > 0:
+            with move_on_after(self.max_batch_latency):
+                while len(batch) < self.max_batch_size:
+                    batch.append(await self._stream_recv.receive())
 
     async def before(self):
         """
         Hook executed before the component sets its `RUNNING` state.
 
-        The ELVA SQLite database is being initialized and read.
-        Also, the component subscribes to changes in [`ydoc`][elva.store.SQLiteStore.ydoc].
+        The shard files are connected to and their tables ensured.
         """
-        # initialize tables and table content
-        await self._initialize()
+        await self.path.mkdir(parents=True, exist_ok=True)
+        check_shards(self.path, self.shards)
+
+        self._dbs = []
+        self._cursors = []
+
+        for path in get_shard_paths(self.path, self.shards):
+            db = await sqlite.connect(path)
+            self._dbs.append(db)
+
+            cursor = await db.cursor()
+            self._cursors.append(cursor)
+
+            for statement in get_pragma_statements(self.pragmas):
+                await cursor.execute(statement)
+
+            for statement in SHARD_SCHEMA:
+                await cursor.execute(statement)
+
+            await db.commit()
+
+        self.log.info(f"connected to {self.shards} shards in {self.path}")
 
-        # initialize streams
         self._stream_send, self._stream_recv = create_memory_object_stream(
             max_buffer_size=65536
         )
-        self.log.debug("instantiated buffer")
-
-        # start watching for updates on the YDoc
-        self._subscription = self.ydoc.observe(self._on_transaction_event)
-        self.log.debug("subscribed to YDoc updates")
+        self._writing = True
 
     async def run(self):
         """
-        Hook writing updates from the internal buffer to file.
+        Hook writing updates from the internal buffer to the shards.
         """
-        self.log.debug("listening for updates")
+        try:
+            async for update in self._stream_recv:
+                batch = [update]
 
-        async for update in self._stream_recv:
-            self.log.debug(f"received update {update}")
+                try:
+                    await self._collect_batch(batch)
+                finally:
+                    with CancelScope(shield=True):
+                        await self._write_batch(batch)
+        finally:
+            self._writing = False
+            self._notify()
 
-            with CancelScope(shield=True):
-                # writing needs to be shielded from cancellation,
-                # but is required to return quickly
-                await self._write(update)
+    async def cleanup(self):
+        """
+        Hook writing the remaining updates and closing the shard connections.
+
+        It waits for all attached stores to detach first, as they might append updates until then,
+        but at most [`DETACH_TIMEOUT`][elva.store.DETACH_TIMEOUT] seconds.
+        """
+        if hasattr(self, "_stream_recv"):
+            with move_on_after(DETACH_TIMEOUT) as scope:
+                while True:
+                    # make room for stores waiting to append
+                    batch = []
+                    while True:
+                        try:
+                            batch.append(self._stream_recv.receive_nowait())
+                        except WouldBlock:
+                            break
+
+                    if batch:
+                        await self._write_batch(batch)
+                    elif self._stores > 0:
+                        await self._progress.wait()
+                    else:
+                        break
+
+            if scope.cancelled_caught:
+                self.log.warning(
+                    f"closing shards with {self._stores} stores still attached"
+                )
+
+            del self._stream_send, self._stream_recv
+
+        if hasattr(self, "_dbs"):
+            for db in self._dbs:
+                await db.close()
+
+            del self._dbs, self._cursors
+
+        self.log.info("closed shards")
+
+
+ShardedSQLiteStoreState = create_component_state("ShardedSQLiteStoreState")
+"""The states of the [`ShardedSQLiteStore`][elva.store.ShardedSQLiteStore] component."""
+
+
+class ShardedSQLiteStore(Store):
+    """
+    Store component saving Y updates in a shared [`ShardedSQLiteDatabase`][elva.store.ShardedSQLiteDatabase].
+
+    Updates are buffered in an [`UpdateBuffer`][elva.store.UpdateBuffer] like in the other stores
+    and handed over to the database, which takes care of batching them across Y Documents.
+    """
+
+    database: ShardedSQLiteDatabase
+    """Running database component the updates are written to."""
+
+    _attached: bool
+    """Flag whether this store is attached to the [`database`][elva.store.ShardedSQLiteStore.database]."""
+
+    def __init__(self, ydoc: Doc, identifier: str, database: ShardedSQLiteDatabase):
+        """
+        Arguments:
+            ydoc: instance of the synchronized Y Document.
+            identifier: identifier of the synchronized Y Document.
+            database: running database component the updates are written to.
+        """
+        super().__init__(ydoc, identifier)
+        self.database = database
+        self._attached = False
+
+    @property
+    def states(self) -> ShardedSQLiteStoreState:
+        """The states this component can have."""
+        return ShardedSQLiteStoreState
+
+    async def get_metadata(self) -> dict:
+        """
+        Retrieve the metadata of the Y Document.
+
+        Returns:
+            mapping of metadata keys to values, without the keys in [`STATISTICS_KEYS`][elva.store.STATISTICS_KEYS].
+        """
+        return await self.database.get_metadata(self.identifier)
+
+    async def get_statistics(self) -> dict:
+        """
+        Retrieve the persisted statistics about the updates of the Y Document.
+
+        Returns:
+            mapping with the `state` vector of the updates, the number of `rows` and the total size in `bytes`.
+            Missing statistics are `None`.
+        """
+        return await self.database.get_statistics(self.identifier)
+
+    async def set_metadata(self, metadata: dict, replace: bool = False):
+        """
+        Set the metadata of the Y Document.
+
+        Arguments:
+            metadata: mapping of metadata keys to values.
+            replace: flag whether to just insert or update keys (`False`) or to delete absent keys as well (`True`), except the keys in [`RESERVED_KEYS`][elva.store.RESERVED_KEYS].
+        """
+        await self.database.set_metadata(self.identifier, metadata, replace=replace)
+
+    async def load(self) -> None | bytes:
+        """
+        Read the updates of the Y Document from the database and merge them into a single update.
+
+        Returns:
+            the merged update or `None` if there are no updates.
+        """
+        merged, self._num_rows, self._num_bytes = await self.database.read(
+            self.identifier
+        )
+        return merged
+
+    async def append(self, updates: list[bytes]):
+        """
+        Put `updates` into the buffer of the database.
+
+        Each update carries the statistics after writing it,
+        so that the database updates them within the same transaction.
+
+        Arguments:
+            updates: the updates to write.
+        """
+        # get the state before awaiting anything, so that it matches the written updates
+        state = self._get_written_state()
+
+        # keep a compaction from changing the statistics in between
+        async with self._lock:
+            for index, update in enumerate(updates):
+                self._num_rows += 1
+                self._num_bytes += len(update)
+
+                statistics = {ROWS_KEY: self._num_rows, BYTES_KEY: self._num_bytes}
+                if state is not None and index == len(updates) - 1:
+                    statistics[STATE_KEY] = state
+
+                await self.database.append(self.identifier, update, statistics)
+
+    async def compact(self, snapshot: bool = False):
+        """
+        Replace all updates of the Y Document written so far by a single merged update.
+
+        Arguments:
+            snapshot: flag whether to write the encoded state of a Y Document with all updates applied instead of the merged updates.
+        """
+        async with self._lock:
+            await self.database.flush()
+            num_rows, size = await self.database.compact(
+                self.identifier, snapshot=snapshot
+            )
+
+            if num_rows > 1:
+                self._num_rows = 1
+                self._num_bytes = size
+
+    async def _ensure_identifier(self):
+        """
+        Hook doing nothing, as the identifier is the key of the Y Document in the database.
+        """
+
+    async def before(self):
+        """
+        Hook executed before the component sets its `RUNNING` state.
+
+        The store attaches to the [`database`][elva.store.ShardedSQLiteStore.database] and sets up like the other stores.
+        """
+        self.database.attach()
+        self._attached = True
+
+        try:
+            await super().before()
+        except BaseException:
+            # the database waits for this store otherwise
+            self._detach()
+            raise
 
     async def cleanup(self):
         """
-        Hook cancelling subscription to changes and closing the database.
+        Hook handing over the remaining updates and waiting for them to be written.
         """
-        if hasattr(self, "_subscription"):
-            # unsubscribe from YDoc updates, otherwise transactions will fail
-            self.ydoc.unobserve(self._subscription)
-            del self._subscription
-            self.log.debug("unsubscribed from YDoc updates")
+        await super().cleanup()
 
-        if hasattr(self, "_stream_recv"):
-            # drain the buffer and write the remaining updates to file
-            while True:
-                try:
-                    update = self._stream_recv.receive_nowait()
-                    await self._write(update)
-                except WouldBlock:
-                    break
+        await self.database.flush()
+        self._detach()
 
-            self.log.debug("drained buffer")
+    def _detach(self):
+        """
+        Unregister this store from the database once.
+        """
+        if self._attached:
+            self._attached = False
+            self.database.detach()
 
-            # remove buffer
-            del self._stream_send, self._stream_recv
-            self.log.debug("deleted buffer")
 
-        # now we can close the file
-        await self._disconnect_database()
+STORES = {
+    "sqlite": SQLiteStore,
+    "log": LogStore,
+}
+"""Mapping of names to store classes saving a Y Document to a file."""
+
+
+def get_store_class(config: dict) -> type[Store]:
+    """
+    Pick the store class from a configuration mapping.
+
+    Arguments:
+        config: mapping of configuration parameters to their values.
+
+    Raises:
+        ValueError: if the configured store is unknown.
+
+    Returns:
+        the class named by the `store` key, [`SQLiteStore`][elva.store.SQLiteStore] if absent.
+    """
+    name = config.get("store") or "sqlite"
+
+    try:
+        return STORES[name]
+    except KeyError:
+        raise ValueError(
+            f"unknown store '{name}', needs to be one of {', '.join(STORES)}"
+        ) from None
@@ -0,0 +1,177 @@
+import anyio
+import pytest
+from anyio.streams.buffered import BufferedByteReceiveStream
+
+import elva.bus
+from elva.bus import (
+    Bus,
+    BusBroker,
+    BusFrame,
+    UnixSocketBus,
+    encode_frame,
+    receive_frame,
+)
+
+## ANYIO PYTEST PLUGIN
+pytestmark = pytest.mark.anyio
+
+
+async def test_frame_roundtrip():
+    send, recv = anyio.create_memory_object_stream(max_buffer_size=10)
+
+    message = b"x" * 300
+    send.send_nowait(encode_frame(BusFrame.PUBLISH, "topic", message))
+    send.send_nowait(encode_frame(BusFrame.JOIN, "other"))
+    send.close()
+
+    stream = BufferedByteReceiveStream(recv)
+    assert await receive_frame(stream) == (BusFrame.PUBLISH, "topic", message)
+    assert await receive_frame(stream) == (BusFrame.JOIN, "other", b"")
+
+
+def test_incomplete_bus():
+    class IncompleteBus(Bus):
+        def publish(self, topic, message):
+            pass
+
+    # missing methods are detected on instantiation
+    with pytest.raises(TypeError):
+        IncompleteBus()
+
+
+async def test_unix_socket_bus(tmp_path):
+    path = tmp_path / "bus.sock"
+
+    async with (
+        BusBroker(path),
+        UnixSocketBus(path) as bus_a,
+        UnixSocketBus(path) as bus_b,
+        UnixSocketBus(path) as bus_c,
+    ):
+        recv_a = await bus_a.join("foo")
+        recv_b = await bus_b.join("foo")
+        recv_c = await bus_c.join("bar")
+
+        # wait for the joins to reach the broker
+        with anyio.fail_after(1):
+            while True:
+                bus_a.publish("foo", b"ping")
+                if await recv_b.receive() == b"ping":
+                    break
+
+        bus_b.publish("foo", b"hello")
+        bus_b.publish("bar", b"world")
+
+        with anyio.fail_after(1):
+            assert await recv_a.receive() == b"hello"
+            assert await recv_c.receive() == b"world"
+
+        # messages are not echoed back to the publishing bus
+        with pytest.raises(anyio.WouldBlock):
+            recv_b.receive_nowait()
+
+        # left topics close the stream
+        await bus_a.leave("foo")
+        with pytest.raises(anyio.EndOfStream):
+            while True:
+                await recv_a.receive()
+
+
+async def test_unix_socket_bus_overflow(tmp_path, monkeypatch):
+    monkeypatch.setattr(elva.bus, "OUTBOX_SIZE", 4)
+    monkeypatch.setattr(elva.bus, "TOPIC_QUEUE_SIZE", 4)
+    path = tmp_path / "bus.sock"
+
+    async with UnixSocketBus(path) as bus_a:
+        recv_a = await bus_a.join("foo")
+
+        # frames exceeding the outbox are dropped while there is no broker
+        for _ in range(10):
+            bus_a.publish("foo", b"lost")
+
+        async with BusBroker(path), UnixSocketBus(path) as bus_b:
+            # the room catches up after reconnecting
+            with anyio.fail_after(5):
+                assert await recv_a.receive() is None
+
+            recv_b = await bus_b.join("foo")
+
+            with anyio.fail_after(1):
+                while True:
+                    bus_a.publish("foo", b"ping")
+                    if await recv_b.receive() == b"ping":
+                        break
+
+            # messages exceeding the stream of a lagging room are dropped
+            with anyio.fail_after(1):
+                for index in range(10):
+                    bus_b.publish("foo", str(index).encode())
+                    await anyio.sleep(1e-2)
+
+                messages = [await recv_a.receive() for _ in range(5)]
+
+            # the room catches up once it receives again
+            assert messages[:4] == [b"0", b"1", b"2", b"3"]
+            assert messages[4] is None
+
+
+async def test_unix_socket_bus_unsent_frame(tmp_path):
+    bus = UnixSocketBus(tmp_path / "bus.sock")
+    bus.publish("foo", b"hello")
+
+    class BrokenStream:
+        async def send(self, data):
+            raise anyio.BrokenResourceError
+
+    class RecordingStream:
+        def __init__(self):
+            self.sent = list()
+
+        async def send(self, data):
+            self.sent.append(data)
+
+    await bus._send(BrokenStream())
+
+    # the frame failing to be sent is sent on the next connection
+    stream = RecordingStream()
+    with anyio.move_on_after(0.1):
+        await bus._send(stream)
+
+    assert stream.sent == [encode_frame(BusFrame.PUBLISH, "foo", b"hello")]
+
+
+async def test_bus_broker_lagging_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(elva.bus, "OUTBOX_SIZE", 16)
+    path = tmp_path / "bus.sock"
+
+    async with (
+        BusBroker(path) as broker,
+        UnixSocketBus(path) as bus_a,
+        UnixSocketBus(path) as bus_b,
+    ):
+        # a connection never receiving any frame
+        stuck = await anyio.connect_unix(path)
+        await stuck.send(encode_frame(BusFrame.JOIN, "foo"))
+
+        recv_a = await bus_a.join("foo")
+
+        with anyio.fail_after(1):
+            while len(broker._topics.get("foo", ())) < 2:
+                await anyio.sleep(1e-3)
+
+        # the other connections are served without delay
+        message = b"x" * 2**16
+        with anyio.fail_after(5):
+            for _ in range(100):
+                bus_b.publish("foo", message)
+                assert await recv_a.receive() == message
+
+        # the lagging connection has been closed
+        assert len(broker._topics["foo"]) == 1
+
+        with anyio.fail_after(5):
+            with pytest.raises((anyio.EndOfStream, anyio.BrokenResourceError)):
+                while True:
+                    await stuck.receive()
+
+        await stuck.aclose()
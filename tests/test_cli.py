@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -229,6 +230,90 @@ def test_read_data_file(tmp_path, capfd, metadata, expected, warn):
         assert captured.err == ""
 
 
+def test_read_data_file_pragmas(tmp_path, capfd, monkeypatch):
+    data_file_path = _cli.get_data_file_path(tmp_path / "test")
+    metadata = {"foo": "bar"}
+    _store.set_metadata(data_file_path, metadata)
+
+    # record the pragmas the database is opened with
+    opened = list()
+    open_database = _store.open_database
+
+    def record_open_database(path, pragmas=None):
+        opened.append(pragmas)
+        return open_database(path, pragmas)
+
+    monkeypatch.setattr(_store, "open_database", record_open_database)
+
+    # the configured pragmas are applied on reading
+    config = {"journal_mode": "WAL", "cache_size": -4000}
+    assert _cli.read_data_file(data_file_path, config) == metadata
+    assert opened == [{"journal_mode": "WAL", "cache_size": -4000}]
+    assert capfd.readouterr().err == ""
+
+    # invalid pragmas are reported
+    assert _cli.read_data_file(data_file_path, {"journal_mode": "FOO"}) == dict()
+    assert capfd.readouterr().err != ""
+
+
+def test_read_data_file_log_store(tmp_path, capfd):
+    data_file_path = _cli.get_data_file_path(tmp_path / "test", _store.LogStore.suffix)
+    assert data_file_path.name == "test.ylog"
+
+    # write a log file with a metadata record
+    metadata = {"foo": "bar", "baz": 42}
+    record, _ = _store.LogRecord.METADATA.encode(json.dumps(metadata).encode())
+    data_file_path.write_bytes(_store.LOG_HEADER + record)
+
+    # the file is read by the configured store
+    assert _cli.read_data_file(data_file_path, {"store": "log"}) == metadata
+    assert capfd.readouterr().err == ""
+
+    # the file is no SQLite database
+    assert _cli.read_data_file(data_file_path) == dict()
+    assert capfd.readouterr().err != ""
+
+
+def test_merge_configs_log_store(runner, tmp_path):
+    # ensure app dir is in `tmp_path`
+    tmp_path_str = str(tmp_path)
+    env = {
+        # Unix, POSIX
+        "HOME": tmp_path_str,
+        "XDG_CONFIG_HOME": tmp_path_str,
+        # Windows
+        "APPDATA": tmp_path_str,
+        "LOCALAPPDATA": tmp_path_str,
+    }
+
+    cwd = tmp_path / RUN_PATH
+    cwd.mkdir()
+    os.chdir(cwd)
+
+    # configure the log store
+    with (cwd / _cli.CONFIG_NAME).open(mode="wb") as file:
+        tomli_w.dump({"store": "log"}, file)
+
+    record, _ = _store.LogRecord.METADATA.encode(json.dumps(DATA_FILE).encode())
+    (cwd / "data.ylog").write_bytes(_store.LOG_HEADER + record)
+
+    @click.command
+    @composed_configs_dubbed_data_file
+    @click.pass_context
+    def merge_configs_manually(ctx, *args, **kwargs):
+        # the data file path has the suffix of the store and its metadata are read
+        config = _cli.merge_configs(ctx)
+        assert config["file"] == cwd / "data.ylog"
+        assert config["render"] == cwd / "data"
+        assert config["log"] == cwd / "data.log"
+        assert config["dubbed"] == "data_file"
+
+    for params in (["data"], ["data.y"], ["data.ylog"]):
+        runner.invoke(
+            merge_configs_manually, args=params, env=env, standalone_mode=False
+        )
+
+
 #
 # SETUP FOR `test_read_config_files`
 #
@@ -0,0 +1,75 @@
+import pytest
+from click.testing import CliRunner
+from pycrdt import Doc, Text
+
+from elva.main import elva
+from elva.store import SQLiteStore, get_updates
+
+pytestmark = pytest.mark.anyio
+
+
+async def write_data_file(path, content):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, None, path):
+        for char in content:
+            text += char
+
+
+async def test_compact(tmp_path):
+    directory = tmp_path / "documents"
+    directory.mkdir()
+
+    files = [directory / "a.y", directory / "b.y", tmp_path / "c.y"]
+    for file in files:
+        await write_data_file(file, "foo")
+        assert len(get_updates(file)) == 3
+
+    # not an ELVA data file
+    (directory / "d.y").write_text("no database")
+
+    runner = CliRunner()
+    result = runner.invoke(elva, ["compact", str(directory), str(files[-1])])
+    assert result.exit_code == 0
+
+    for file in files:
+        assert len(get_updates(file)) == 1
+        assert f"{file}: compacted 3 updates" in result.stdout
+
+    assert "Ignoring" in result.stderr
+
+
+async def test_convert(tmp_path):
+    files = tmp_path / "files"
+    files.mkdir()
+
+    for identifier in ("foo-document", "bar-document"):
+        await write_data_file(files / f"{identifier}.y", identifier)
+
+    runner = CliRunner()
+
+    shards = tmp_path / "shards"
+    result = runner.invoke(
+        elva, ["convert", "--to", "shards", "--shards", "2", str(files), str(shards)]
+    )
+    assert result.exit_code == 0
+    assert "converted 2 documents" in result.stdout
+
+    # the number of shards cannot change
+    result = runner.invoke(
+        elva, ["convert", "--to", "shards", "--shards", "3", str(files), str(shards)]
+    )
+    assert result.exit_code != 0
+
+    exported = tmp_path / "exported"
+    result = runner.invoke(
+        elva, ["convert", "--to", "files", str(shards), str(exported)]
+    )
+    assert result.exit_code == 0
+
+    for identifier in ("foo-document", "bar-document"):
+        ydoc = Doc()
+        ydoc["text"] = text = Text()
+        async with SQLiteStore(ydoc, None, exported / f"{identifier}.y"):
+            assert str(text) == identifier
@@ -206,3 +206,49 @@ def test_infer_and_decode_exception(protocol, protocol_name):
     exc_msg = exc.args[0]
     assert f"{MSG[0]}, {MSG[1]}" in exc_msg
     assert protocol_name in exc_msg
+
+
+@pytest.mark.parametrize(
+    "message_type",
+    ElvaMessage.get_types(),
+)
+def test_peek(message_type):
+    """Locate the payload of a message for all message types in the ElvaMessage protocol."""
+    MSG = b"payload"
+
+    MessageType = getattr(ElvaMessage, message_type)
+
+    msg, _ = MessageType.encode(MSG)
+    msg_type, start, end = ElvaMessage.peek(msg)
+
+    assert msg_type == MessageType
+    assert msg[start:end] == MSG
+    assert end == len(msg)
+
+
+@pytest.mark.parametrize(
+    ("protocol", "protocol_name"),
+    (("y", "YMessage"), ("elva", "ElvaMessage")),
+)
+def test_peek_exception(protocol, protocol_name):
+    """Raise an exception on an undefined message type or an incomplete message."""
+    Message = get_protocol_class(protocol)
+
+    # undefined message type
+    MSG = b"??\x00"
+
+    with pytest.raises(ValueError) as excinfo:
+        Message.peek(MSG)
+
+    exc_msg = excinfo.value.args[0]
+    assert f"{MSG[0]}, {MSG[1]}" in exc_msg
+    assert protocol_name in exc_msg
+
+    # truncated messages
+    msg, _ = Message.SYNC_UPDATE.encode(b"payload")
+
+    for truncated in (msg[:1], msg[:2], msg[:-1]):
+        with pytest.raises(ValueError) as excinfo:
+            Message.peek(truncated)
+
+        assert protocol_name in excinfo.value.args[0]
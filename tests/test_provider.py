@@ -5,12 +5,16 @@ import anyio
 import pytest
 from pycrdt import Doc, Text
 from websockets.asyncio.server import basic_auth
+from websockets.datastructures import Headers
 from websockets.exceptions import InvalidStatus
+from websockets.http11 import Response
 
+import elva.provider
 from elva.auth import DummyAuth, basic_authorization_header
 from elva.log import LOGGER_NAME
-from elva.provider import WebsocketProvider
+from elva.provider import WebsocketProvider, get_retry_after
 from elva.server import WebsocketServer
+from elva.store import SYNCED_STATE_KEY, SQLiteStore, get_metadata
 
 
 @pytest.fixture(scope="module")
@@ -507,3 +511,345 @@ async def test_auth(free_tcp_port):
             assert "additional_headers" in provider.options
             headers = provider.options["additional_headers"]
             assert "Authorization" in headers
+
+
+async def test_awareness_interval(free_tcp_port):
+    """Local awareness changes within an interval are sent as a single message."""
+    ydoc = Doc()
+    identifier = get_identifier()
+    interval = 0.2
+
+    async with (
+        WebsocketServer(LOCALHOST, free_tcp_port, persistent=True) as server,
+        WebsocketProvider(
+            ydoc,
+            identifier,
+            LOCALHOST,
+            port=free_tcp_port,
+            safe=False,
+            awareness_interval=interval,
+        ) as provider,
+    ):
+        sub = provider.subscribe()
+        while provider.states.CONNECTED not in provider.state:
+            await sub.receive()
+
+        # let the interval of the message sent on connecting pass
+        await anyio.sleep(2 * interval)
+        sent = provider.stats["awareness_sent"]
+
+        # the first change is sent right away, the following ones at the end of the interval
+        for index in range(10):
+            provider.awareness.set_local_state({"cursor": index})
+        assert provider.stats["awareness_sent"] == sent + 1
+        assert provider.stats["awareness_coalesced"] == 8
+
+        room = server.rooms[identifier]
+        client_id = provider.awareness.client_id
+        with anyio.fail_after(1):
+            while room.awareness.client_states.get(client_id) != {"cursor": 9}:
+                await anyio.sleep(1e-3)
+        assert provider.stats["awareness_sent"] == sent + 2
+
+        # a disconnect is sent right away
+        provider.awareness.set_local_state({"cursor": 10})
+        provider.awareness.set_local_state(None)
+        assert provider.stats["awareness_sent"] == sent + 3
+
+        with anyio.fail_after(1):
+            while client_id in room.awareness.client_states:
+                await anyio.sleep(1e-3)
+
+
+async def test_batch_window(free_tcp_port):
+    """Updates queued within the batch window are merged and only the latest awareness message is sent."""
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+    identifier = get_identifier()
+
+    async with (
+        WebsocketServer(LOCALHOST, free_tcp_port, persistent=True) as server,
+        WebsocketProvider(
+            ydoc,
+            identifier,
+            LOCALHOST,
+            port=free_tcp_port,
+            safe=False,
+            awareness_interval=None,
+            batch_window=0.1,
+        ) as provider,
+    ):
+        sub = provider.subscribe()
+        while provider.states.CONNECTED not in provider.state:
+            await sub.receive()
+
+        # let the messages sent on connecting pass
+        await anyio.sleep(0.3)
+        sent = provider.stats["frames_sent"]
+
+        for index in range(50):
+            text += "x"
+            provider.awareness.set_local_state({"cursor": index})
+
+        room = server.rooms[identifier]
+        client_id = provider.awareness.client_id
+        with anyio.fail_after(1):
+            while not (
+                str(room.ydoc.get("text", type=Text)) == "x" * 50
+                and room.awareness.client_states.get(client_id) == {"cursor": 49}
+            ):
+                await anyio.sleep(1e-3)
+
+        # one sync update and one awareness message
+        assert provider.stats["frames_sent"] == sent + 2
+        assert provider.stats["frames_saved"] >= 98
+
+
+async def test_reconnect_sends_diff(free_tcp_port, tmp_path):
+    """On reconnect, only the changes since the state synced with the server are sent proactively."""
+    ydoc = Doc()
+    ydoc["text"] = text = Text("x" * 10000)
+    identifier = get_identifier()
+
+    provider = WebsocketProvider(
+        ydoc, identifier, LOCALHOST, port=free_tcp_port, safe=False
+    )
+    server = WebsocketServer(LOCALHOST, free_tcp_port, persistent=True, path=tmp_path)
+
+    sub_server = server.subscribe()
+
+    async with provider:
+        sub = provider.subscribe()
+
+        async with anyio.create_task_group() as tg:
+            await tg.start(server.start)
+
+            while provider.states.CONNECTED not in provider.state:
+                await sub.receive()
+
+            # the first connection sends the whole document
+            while provider.uri not in provider.synced_states:
+                await anyio.sleep(1e-3)
+            sent = provider.stats["sync_bytes_sent"]
+            assert sent > 10000
+
+            room = server.rooms[identifier]
+            while not ydoc_updates_are_empty(ydoc, room.ydoc):
+                await anyio.sleep(1e-3)
+
+            await server.stop()
+            while server.state != server.states.NONE:
+                await sub_server.receive()
+
+            # edit while disconnected
+            while provider.states.CONNECTED in provider.state:
+                await sub.receive()
+            text += "y"
+
+            await tg.start(server.start)
+            while provider.states.CONNECTED not in provider.state:
+                await sub.receive()
+
+            room = server.rooms[identifier]
+            while not ydoc_updates_are_empty(ydoc, room.ydoc):
+                await anyio.sleep(1e-3)
+
+            # the 10000 characters have not been sent again
+            assert provider.stats["sync_bytes_sent"] - sent < 1000
+            assert str(room.ydoc.get("text", type=Text)) == str(text)
+
+            await server.stop()
+
+
+async def test_broadcast_reconnect_sends_all(free_tcp_port):
+    """Servers not answering sync step 1 messages get the whole document on reconnect."""
+    ydoc_a = Doc()
+    ydoc_a["text"] = text = Text("x" * 10000)
+    identifier = get_identifier()
+
+    provider_a = WebsocketProvider(
+        ydoc_a, identifier, LOCALHOST, port=free_tcp_port, safe=False
+    )
+    sub = provider_a.subscribe()
+
+    async with WebsocketServer(LOCALHOST, free_tcp_port, persistent=False):
+        async with anyio.create_task_group() as tg:
+            await tg.start(provider_a.start)
+            while provider_a.states.CONNECTED not in provider_a.state:
+                await sub.receive()
+
+            # sync step 1 and sync step 2 have been sent
+            while provider_a.stats["frames_sent"] < 2:
+                await anyio.sleep(1e-3)
+
+            await provider_a.stop()
+            while provider_a.state != provider_a.states.NONE:
+                await sub.receive()
+
+            # the server does not hold the document, so it is unknown to a new client
+            text += "y"
+            ydoc_b = Doc()
+            ydoc_b["text"] = text_b = Text()
+
+            async with WebsocketProvider(
+                ydoc_b, identifier, LOCALHOST, port=free_tcp_port, safe=False
+            ):
+                await tg.start(provider_a.start)
+
+                with anyio.fail_after(5):
+                    while str(text_b) != str(text):
+                        await anyio.sleep(1e-3)
+
+            assert provider_a.synced_states == dict()
+            assert provider_a.stats["sync_bytes_sent"] > 2 * 10000
+
+            await provider_a.stop()
+
+
+async def test_store_synced_state(free_tcp_port, tmp_path):
+    """The synced state is saved in the store, so that a restarted provider sends only the changes made offline."""
+    identifier = get_identifier()
+    file = tmp_path / "doc.y"
+
+    async def sync(ydoc, provider):
+        sub = provider.subscribe()
+        while provider.states.CONNECTED not in provider.state:
+            await sub.receive()
+
+        room = server.rooms[identifier]
+        while not ydoc_updates_are_empty(ydoc, room.ydoc):
+            await anyio.sleep(1e-3)
+        while provider.synced_states.get(provider.uri) != ydoc.get_state():
+            await anyio.sleep(1e-3)
+
+    async with WebsocketServer(
+        LOCALHOST, free_tcp_port, persistent=True, path=tmp_path / "server"
+    ) as server:
+        ydoc = Doc()
+        ydoc["text"] = Text("x" * 10000)
+
+        async with SQLiteStore(ydoc, identifier, file) as store:
+            provider = WebsocketProvider(
+                ydoc, identifier, LOCALHOST, port=free_tcp_port, safe=False, store=store
+            )
+            async with provider:
+                await sync(ydoc, provider)
+
+        # edit offline and restart
+        ydoc = Doc()
+        ydoc["text"] = text = Text()
+
+        async with SQLiteStore(ydoc, identifier, file) as store:
+            text += "y"
+
+            provider = WebsocketProvider(
+                ydoc, identifier, LOCALHOST, port=free_tcp_port, safe=False, store=store
+            )
+            async with provider:
+                await sync(ydoc, provider)
+
+                # the 10000 characters have not been sent again
+                assert provider.stats["sync_bytes_sent"] < 1000
+
+                room = server.rooms[identifier]
+                assert str(room.ydoc.get("text", type=Text)) == "x" * 10000 + "y"
+
+
+async def test_store_synced_state_writes(free_tcp_port, tmp_path):
+    """The synced state is saved once after the first sync and on stopping, not with every message."""
+    identifier = get_identifier()
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with (
+        WebsocketServer(LOCALHOST, free_tcp_port, persistent=True) as server,
+        SQLiteStore(ydoc, identifier, tmp_path / "doc.y") as store,
+    ):
+        writes = list()
+        set_metadata = store.set_metadata
+
+        async def count_writes(metadata, replace=False):
+            writes.append(metadata)
+            await set_metadata(metadata, replace=replace)
+
+        store.set_metadata = count_writes
+
+        async with WebsocketProvider(
+            ydoc, identifier, LOCALHOST, port=free_tcp_port, safe=False, store=store
+        ) as provider:
+            for char in "synced state":
+                text += char
+
+                room = None
+                while room is None or not ydoc_updates_are_empty(ydoc, room.ydoc):
+                    await anyio.sleep(1e-3)
+                    room = server.rooms.get(identifier)
+
+            while provider.synced_states.get(provider.uri) != ydoc.get_state():
+                await anyio.sleep(1e-3)
+
+            assert len(writes) == 1
+
+        assert len(writes) == 2
+
+        # the synced state is no parameter of the data file
+        assert SYNCED_STATE_KEY in await store.get_metadata()
+        assert SYNCED_STATE_KEY not in get_metadata(tmp_path / "doc.y")
+
+
+class StartingStore(SQLiteStore):
+    """Store never finishing its start."""
+
+    async def before(self):
+        await anyio.sleep_forever()
+
+
+@pytest.mark.parametrize("stop", (False, True))
+async def test_store_not_running(free_tcp_port, tmp_path, monkeypatch, stop):
+    """A store not getting to run does not hold up the sync."""
+    monkeypatch.setattr(elva.provider, "STORE_START_TIMEOUT", 60 if stop else 0.5)
+
+    identifier = get_identifier()
+    ydoc = Doc()
+    ydoc["text"] = Text("foo")
+    store = StartingStore(ydoc, identifier, tmp_path / "doc.y")
+
+    async with (
+        WebsocketServer(LOCALHOST, free_tcp_port, persistent=True) as server,
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(store.start)
+        while store.states.ACTIVE not in store.state:
+            await anyio.sleep(1e-3)
+
+        provider = WebsocketProvider(
+            ydoc, identifier, LOCALHOST, port=free_tcp_port, safe=False, store=store
+        )
+        async with provider:
+            if stop:
+                await store.stop()
+
+            with anyio.fail_after(2):
+                room = None
+                while room is None or not ydoc_updates_are_empty(ydoc, room.ydoc):
+                    await anyio.sleep(1e-3)
+                    room = server.rooms.get(identifier)
+
+        tg.cancel_scope.cancel()
+
+
+def test_get_retry_after():
+    """The `Retry-After` header of a refused handshake is respected."""
+    response = Response(503, "Service Unavailable", Headers({"Retry-After": "2"}))
+    assert get_retry_after(InvalidStatus(response)) == 2
+
+    # no header or an unsupported HTTP date
+    response = Response(503, "Service Unavailable", Headers())
+    assert get_retry_after(InvalidStatus(response)) is None
+
+    headers = Headers({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    response = Response(503, "Service Unavailable", headers)
+    assert get_retry_after(InvalidStatus(response)) is None
+
+    # other exceptions
+    assert get_retry_after(OSError()) is None
@@ -0,0 +1,15 @@
+from elva.retry import backoff
+
+
+def test_backoff():
+    """Reconnection delays are jittered and grow exponentially up to a limit."""
+    delays = backoff(initial_delay=1, max_delay=8, factor=2)
+
+    bounds = (1, 2, 4, 8, 8, 8)
+    for bound in bounds:
+        delay = next(delays)
+        assert 0 <= delay <= bound
+
+    # the delays are random
+    samples = set(next(backoff()) for _ in range(10))
+    assert len(samples) > 1
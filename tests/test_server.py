@@ -1,20 +1,34 @@
+import logging
 import sqlite3
 import uuid
+from collections import Counter
 from http import HTTPStatus
 
 import anyio
 import pytest
-from pycrdt import Doc, Text, TransactionEvent
+from pycrdt import Awareness, Doc, Text, TransactionEvent
 from websockets.asyncio.client import ClientConnection, connect
 from websockets.asyncio.server import ServerConnection, basic_auth
 from websockets.datastructures import Headers
-from websockets.exceptions import InvalidStatus
+from websockets.exceptions import ConnectionClosed, InvalidStatus
+from websockets.frames import CloseCode
 from websockets.http11 import Request, Response
 from websockets.protocol import State as ConnectionState
 
+import elva.server
+from elva.apps.server.app import WorkerPool
 from elva.auth import Auth, DummyAuth, basic_authorization_header
-from elva.protocol import YMessage
-from elva.server import RequestProcessor, WebsocketServer, free_tcp_port
+from elva.bus import BusBroker, UnixSocketBus
+from elva.protocol import ElvaMessage, YMessage
+from elva.server import (
+    HashRing,
+    RequestProcessor,
+    Room,
+    WebsocketRouter,
+    WebsocketServer,
+    free_tcp_port,
+)
+from elva.store import LogStore, SQLiteStore
 
 ## ANYIO PYTEST PLUGIN
 pytestmark = pytest.mark.anyio
@@ -485,3 +499,1094 @@ async def test_auth(free_tcp_port):
 
             await client.close()
             assert client.state == ConnectionState.CLOSED
+
+
+@pytest.mark.parametrize(
+    ("shards", "store_class"),
+    ((None, SQLiteStore), (2, SQLiteStore), (None, LogStore)),
+)
+async def test_idle_eviction(free_tcp_port, tmp_path, shards, store_class):
+    idle_timeout = 0.1
+
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        path=tmp_path,
+        idle_timeout=idle_timeout,
+        shards=shards,
+        store_class=store_class,
+    ) as websocket_server:
+        doc = Doc()
+        doc["text"] = text = Text()
+        identifier = doc.guid
+
+        uri = websocket_client_uri(
+            websocket_server.host, websocket_server.port, identifier
+        )
+        client = await connect_websocket_client(uri)
+
+        # send some content
+        text += "foo"
+        sync_update, _ = YMessage.SYNC_UPDATE.encode(doc.get_update())
+        await client.send(sync_update)
+
+        room = websocket_server.rooms[identifier]
+        while room.ydoc.get_state() != doc.get_state():
+            await anyio.sleep(1e-3)
+
+        # the room is kept while there are connections
+        await anyio.sleep(2 * idle_timeout)
+        assert identifier in websocket_server.rooms
+        assert websocket_server.stats["evictions"] == 0
+
+        # the room gets evicted after the connection has been closed
+        await client.close()
+        while identifier in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        assert websocket_server.stats["evictions"] == 1
+        assert websocket_server.stats["reloads"] == 0
+
+        # the store has been stopped
+        assert room.states.ACTIVE not in room.state
+        assert room.store.states.ACTIVE not in room.store.state
+
+        # the room is reloaded with its content on the next connection
+        client = await connect_websocket_client(uri)
+        while identifier not in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        assert websocket_server.stats["reloads"] == 1
+
+        room = websocket_server.rooms[identifier]
+        sub = room.subscribe()
+        while room.states.RUNNING not in room.state:
+            await sub.receive()
+        room.unsubscribe(sub)
+
+        assert room.ydoc.get_state() == doc.get_state()
+
+        await client.close()
+
+
+async def test_idle_eviction_volatile(free_tcp_port):
+    idle_timeout = 0.1
+
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        idle_timeout=idle_timeout,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(
+            websocket_server.host, websocket_server.port, identifier
+        )
+        client = await connect_websocket_client(uri)
+        await client.close()
+
+        # rooms held only in memory would lose their content, so they are kept
+        await anyio.sleep(4 * idle_timeout)
+        assert identifier in websocket_server.rooms
+        assert websocket_server.stats["evictions"] == 0
+
+
+async def wait_for_running(room):
+    sub = room.subscribe()
+    while room.states.RUNNING not in room.state:
+        await sub.receive()
+    room.unsubscribe(sub)
+
+
+async def test_room_cache_max_rooms(free_tcp_port, tmp_path):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        path=tmp_path,
+        max_rooms=1,
+    ) as websocket_server:
+        identifier_a, identifier_b = str(uuid.uuid4()), str(uuid.uuid4())
+
+        client_a = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, identifier_a)
+        )
+        client_b = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, identifier_b)
+        )
+        while identifier_b not in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        # both rooms are in use, so the budget is exceeded
+        assert len(websocket_server.rooms) == 2
+
+        # the least recently used room without connections gets evicted
+        await client_a.close()
+        while identifier_a in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        assert list(websocket_server.rooms) == [identifier_b]
+        assert websocket_server.stats["evictions"] == 1
+
+        await client_b.close()
+
+
+async def test_room_cache_joining_connection(free_tcp_port, tmp_path):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        path=tmp_path,
+        max_rooms=1,
+        max_room_syncs=1,
+    ) as websocket_server:
+        identifier_a, identifier_b = str(uuid.uuid4()), str(uuid.uuid4())
+
+        # occupy the only synchronization slot of a room without connections
+        room_a = await websocket_server.get_room(identifier_a)
+        await room_a.sync_limiter.acquire()
+
+        client = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, identifier_a)
+        )
+        while room_a.sync_limiter.statistics().tasks_waiting < 1:
+            await anyio.sleep(1e-3)
+
+        # the room with a connection waiting for a slot is not evicted
+        await websocket_server.get_room(identifier_b)
+        with anyio.fail_after(1):
+            while identifier_b in websocket_server.rooms:
+                await anyio.sleep(1e-3)
+
+        assert websocket_server.rooms[identifier_a] is room_a
+        assert room_a.states.RUNNING in room_a.state
+
+        # the connection joins the room once the slot is free
+        room_a.sync_limiter.release()
+
+        message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+        await client.send(message)
+
+        with anyio.fail_after(1):
+            message_type, _, _ = YMessage.infer_and_decode(await client.recv())
+        assert message_type == YMessage.SYNC_STEP2
+        assert len(room_a.clients) == 1
+
+        await client.close()
+
+        # the room becomes idle again
+        with anyio.fail_after(1):
+            while room_a.clients:
+                await anyio.sleep(1e-3)
+        assert room_a.joining == 0
+        assert room_a.idle_since is not None
+
+
+@pytest.mark.parametrize("policy", ("refuse", "spill"))
+async def test_room_cache_volatile_eviction(free_tcp_port, policy):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        max_memory=0,
+        volatile_eviction=policy,
+    ) as websocket_server:
+        doc = Doc()
+        doc["text"] = text = Text("foo")
+        identifier = doc.guid
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        client = await connect_websocket_client(uri)
+        sync_update, _ = YMessage.SYNC_UPDATE.encode(doc.get_update())
+        await client.send(sync_update)
+
+        while identifier not in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+        room = websocket_server.rooms[identifier]
+        while room.ydoc.get_state() != doc.get_state():
+            await anyio.sleep(1e-3)
+
+        await client.close()
+
+        if policy == "refuse":
+            # the content would get lost, so the room is kept
+            await anyio.sleep(0.1)
+            assert identifier in websocket_server.rooms
+            assert websocket_server.stats["evictions"] == 0
+            return
+
+        while identifier in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        assert websocket_server.stats["spills"] == 1
+
+        # the content is restored from the spill file
+        client = await connect_websocket_client(uri)
+        while identifier not in websocket_server.rooms:
+            await anyio.sleep(1e-3)
+
+        room = websocket_server.rooms[identifier]
+        await wait_for_running(room)
+        assert str(room.ydoc.get("text", type=Text)) == str(text)
+        assert websocket_server.stats["reloads"] == 1
+
+        await client.close()
+
+
+async def test_broadcast_window(free_tcp_port):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        broadcast_window=0.1,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        client_a = await connect_websocket_client(uri)
+        client_b = await connect_websocket_client(uri)
+        client_c = await connect_websocket_client(uri)
+
+        while (
+            identifier not in websocket_server.rooms
+            or len(websocket_server.rooms[identifier].clients) < 3
+        ):
+            await anyio.sleep(1e-3)
+
+        room = websocket_server.rooms[identifier]
+
+        # each of two clients types a few characters into its own document
+        updates = dict()
+        for client, chars in ((client_a, "abc"), (client_b, "xyz")):
+            doc = Doc()
+            doc["text"] = text = Text()
+            updates[client] = list()
+
+            def callback(event: TransactionEvent):
+                updates[client].append(event.update)
+
+            doc.observe(callback)
+            for char in chars:
+                text += char
+
+            for update in updates[client]:
+                message, _ = YMessage.SYNC_UPDATE.encode(update)
+                await client.send(message)
+
+        # every client receives a single merged message without its own updates
+        expected = {
+            client_a: updates[client_b],
+            client_b: updates[client_a],
+            client_c: updates[client_a] + updates[client_b],
+        }
+
+        for client, own_updates in expected.items():
+            message = await client.recv()
+            message_type, update, _ = YMessage.infer_and_decode(message)
+            assert message_type == YMessage.SYNC_UPDATE
+
+            doc = Doc()
+            doc["text"] = text = Text()
+            doc.apply_update(update)
+
+            reference = Doc()
+            reference["text"] = reference_text = Text()
+            for own_update in own_updates:
+                reference.apply_update(own_update)
+
+            # the order of clients in encoded state vectors might differ
+            assert reference.get_update(doc.get_state()) == b"\x00\x00"
+            assert doc.get_update(reference.get_state()) == b"\x00\x00"
+            assert str(text) == str(reference_text)
+
+            # nothing else has been sent
+            with anyio.move_on_after(0.2) as scope:
+                await client.recv()
+            assert scope.cancelled_caught
+
+        # without merging, each of the six updates would have been sent to two clients
+        assert room.stats["frames_sent"] == 3
+        assert room.stats["frames_saved"] == 9
+
+        for client in (client_a, client_b, client_c):
+            await client.close()
+
+
+async def test_batch_ingest(free_tcp_port):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        batch_ingest=True,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        client_a = await connect_websocket_client(uri)
+        client_b = await connect_websocket_client(uri)
+
+        while (
+            identifier not in websocket_server.rooms
+            or len(websocket_server.rooms[identifier].clients) < 2
+        ):
+            await anyio.sleep(1e-3)
+
+        room = websocket_server.rooms[identifier]
+        assert room.batch_ingest
+
+        # the server side of the connection of client A
+        (connection_a,) = (
+            connection
+            for connection in room.clients
+            if connection.remote_address == client_a.local_address
+        )
+
+        doc = Doc()
+        doc["text"] = text = Text()
+        updates = list()
+        doc.observe(lambda event: updates.append(event.update))
+        for char in "abc":
+            text += char
+
+        transactions = 0
+
+        def callback(event: TransactionEvent):
+            nonlocal transactions
+            transactions += 1
+
+        room.ydoc.observe(callback)
+
+        # process messages queued from client A at once
+        batch = [
+            (YMessage.SYNC_UPDATE.encode(update)[0], connection_a) for update in updates
+        ]
+        await room.process_batch(batch)
+
+        # all updates have been applied in a single transaction
+        assert transactions == 1
+        assert room.stats["updates_merged"] == 3
+        assert room.ydoc.get_state() == doc.get_state()
+
+        # client B receives a single message holding all updates
+        message = await client_b.recv()
+        message_type, update, _ = YMessage.infer_and_decode(message)
+        assert message_type == YMessage.SYNC_UPDATE
+
+        doc_b = Doc()
+        doc_b["text"] = text_b = Text()
+        doc_b.apply_update(update)
+        assert str(text_b) == "abc"
+
+        # messages sent over the connection are processed as well
+        text += "d"
+        message, _ = YMessage.SYNC_UPDATE.encode(updates[-1])
+        await client_a.send(message)
+
+        message = await client_b.recv()
+        assert message == YMessage.SYNC_UPDATE.encode(updates[-1])[0]
+        assert room.ydoc.get_state() == doc.get_state()
+
+        # client A does not get its own updates back
+        with anyio.move_on_after(0.2) as scope:
+            await client_a.recv()
+        assert scope.cancelled_caught
+
+        for client in (client_a, client_b):
+            await client.close()
+
+
+@pytest.mark.parametrize(
+    "message_type", (YMessage.SYNC_UPDATE, YMessage.SYNC_STEP1, YMessage.SYNC_STEP2)
+)
+async def test_batch_ingest_invalid_message(free_tcp_port, message_type):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        batch_ingest=True,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        doc = Doc()
+        doc["text"] = text = Text()
+        text += "foo"
+        update, _ = YMessage.SYNC_UPDATE.encode(doc.get_update())
+
+        # the malformed message is processed within the batch of a valid one
+        client_a = await connect_websocket_client(uri)
+        message, _ = message_type.encode(b"\x05\x07garbage")
+        await client_a.send(update)
+        await client_a.send(message)
+
+        # only the sending connection is closed
+        with anyio.fail_after(1):
+            with pytest.raises(ConnectionClosed) as excinfo:
+                while True:
+                    await client_a.recv()
+        assert excinfo.value.rcvd.code == CloseCode.INVALID_DATA
+
+        room = websocket_server.rooms[identifier]
+        assert room.stats["invalid_messages"] == 1
+        assert websocket_server.states.SERVING in websocket_server.state
+        assert room.states.RUNNING in room.state
+
+        # other clients still sync with the room
+        client_b = await connect_websocket_client(uri)
+        message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+        await client_b.send(message)
+
+        with anyio.fail_after(1):
+            message = await client_b.recv()
+
+        message_type, update, _ = YMessage.infer_and_decode(message)
+        assert message_type == YMessage.SYNC_STEP2
+
+        doc_b = Doc()
+        doc_b["text"] = text_b = Text()
+        doc_b.apply_update(update)
+        assert str(text_b) == "foo"
+
+        await client_b.close()
+
+
+async def test_sync_cache(free_tcp_port):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        async def sync(client: ClientConnection) -> bytes:
+            message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+            await client.send(message)
+
+            sync_step_2 = await client.recv()
+            await client.recv()  # reactive cross sync
+
+            return sync_step_2
+
+        client_a = await connect_websocket_client(uri)
+        client_b = await connect_websocket_client(uri)
+
+        # the first client makes the room compute the answer
+        sync_step_2_a = await sync(client_a)
+        room = websocket_server.rooms[identifier]
+        assert room.stats["sync_cache_misses"] == 1
+        assert room.stats["sync_cache_hits"] == 0
+
+        # the second client with the same state gets the cached answer
+        sync_step_2_b = await sync(client_b)
+        assert sync_step_2_b == sync_step_2_a
+        assert room.stats["sync_cache_misses"] == 1
+        assert room.stats["sync_cache_hits"] == 1
+
+        # an applied update invalidates the cache
+        doc = Doc()
+        doc["text"] = text = Text()
+        text += "foo"
+        message, _ = YMessage.SYNC_UPDATE.encode(doc.get_update())
+        await client_a.send(message)
+        await client_b.recv()
+
+        sync_step_2_b = await sync(client_b)
+        assert sync_step_2_b != sync_step_2_a
+        assert room.stats["sync_cache_misses"] == 2
+
+        _, update, _ = YMessage.infer_and_decode(sync_step_2_b)
+        doc_b = Doc()
+        doc_b["text"] = text_b = Text()
+        doc_b.apply_update(update)
+        assert str(text_b) == "foo"
+
+        for client in (client_a, client_b):
+            await client.close()
+
+
+async def test_admission_control(free_tcp_port):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        max_syncs=1,
+        max_sync_queue=1,
+        retry_after=3,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+        limiter = websocket_server._sync_limiter
+
+        async def sync(client: ClientConnection):
+            message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+            await client.send(message)
+
+            sync_step_2 = await client.recv()
+            message_type, _, _ = YMessage.infer_and_decode(sync_step_2)
+            assert message_type == YMessage.SYNC_STEP2
+
+            await client.recv()  # reactive cross sync
+
+        # the first client holds the only slot until it has sent its first message
+        client_a = await connect_websocket_client(uri)
+        while limiter.borrowed_tokens < 1:
+            await anyio.sleep(1e-3)
+
+        # the second client is queued
+        client_b = await connect_websocket_client(uri)
+        while limiter.statistics().tasks_waiting < 1:
+            await anyio.sleep(1e-3)
+
+        # the third client is refused with a retry hint
+        with pytest.raises(InvalidStatus) as excinfo:
+            await connect(uri)
+
+        response = excinfo.value.response
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "3"
+        assert websocket_server.stats["refusals"] == 1
+
+        # the queued client is admitted after the first one has synchronized
+        await sync(client_a)
+        await sync(client_b)
+        assert limiter.borrowed_tokens == 0
+
+        for client in (client_a, client_b):
+            await client.close()
+
+
+@pytest.mark.parametrize("batch_ingest", (False, True))
+async def test_admission_timeout(free_tcp_port, batch_ingest):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        batch_ingest=batch_ingest,
+        max_syncs=1,
+        sync_timeout=0.2,
+    ) as websocket_server:
+        limiter = websocket_server._sync_limiter
+
+        # an idle client holds the only slot
+        idle = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, str(uuid.uuid4()))
+        )
+        while limiter.borrowed_tokens < 1:
+            await anyio.sleep(1e-3)
+
+        # a client of another room gets the slot after the timeout
+        client = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, str(uuid.uuid4()))
+        )
+        message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+        await client.send(message)
+
+        with anyio.fail_after(1):
+            message_type, _, _ = YMessage.infer_and_decode(await client.recv())
+        assert message_type == YMessage.SYNC_STEP2
+
+        # the slot is released once the sync step 1 has been answered
+        await client.recv()  # reactive cross sync
+        with anyio.fail_after(1):
+            while limiter.borrowed_tokens > 0:
+                await anyio.sleep(1e-3)
+
+        for connection in (idle, client):
+            await connection.close()
+
+
+async def test_single_flight_room_loading(free_tcp_port, tmp_path):
+    identifier = str(uuid.uuid4())
+
+    # store some content
+    doc = Doc()
+    doc["text"] = text = Text()
+    text += "foo"
+    async with SQLiteStore(doc, identifier, tmp_path / f"{identifier}.y"):
+        pass
+
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        path=tmp_path,
+    ) as websocket_server:
+        rooms = list()
+
+        async def get_room():
+            rooms.append(await websocket_server.get_room(identifier))
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(10):
+                tg.start_soon(get_room)
+
+        # all calls got the same room with its contents loaded
+        room = rooms[0]
+        assert all(other is room for other in rooms)
+        assert room.ydoc.get_state() == doc.get_state()
+        assert not websocket_server._loading
+
+
+def test_crdt_statistics(monkeypatch, caplog):
+    room = Room(str(uuid.uuid4()), persistent=True)
+
+    doc = Doc()
+    doc["text"] = text = Text()
+    text += "foo"
+
+    room._apply_update(doc.get_update())
+    room.estimate_size()
+
+    assert room.stats["crdt_calls"] == 2
+    assert room.stats["crdt_seconds"] > 0
+
+    # slow calls are reported
+    monkeypatch.setattr(elva.server, "SLOW_CRDT_SECONDS", 0)
+    with caplog.at_level(logging.WARNING):
+        room.estimate_size()
+
+    assert "get_update blocked the event loop" in caplog.text
+
+
+def test_hash_ring():
+    identifiers = [str(uuid.uuid4()) for _ in range(1000)]
+
+    ring = HashRing(range(4))
+    nodes = {identifier: ring.get_node(identifier) for identifier in identifiers}
+
+    # identifiers are distributed among all nodes
+    counts = Counter(nodes.values())
+    assert set(counts) == set(range(4))
+    assert min(counts.values()) > 100
+
+    # a new node takes over identifiers only from other nodes
+    ring.add(4)
+    moved = [
+        identifier
+        for identifier in identifiers
+        if ring.get_node(identifier) != nodes[identifier]
+    ]
+    assert all(ring.get_node(identifier) == 4 for identifier in moved)
+    assert len(moved) < 400
+
+    # removing the node restores the mapping
+    ring.remove(4)
+    assert all(ring.get_node(identifier) == nodes[identifier] for identifier in nodes)
+
+    with pytest.raises(LookupError):
+        HashRing().get_node("some-identifier")
+
+
+async def test_websocket_router():
+    ports = [free_tcp_port(LOCALHOST) for _ in range(3)]
+    router_port, worker_ports = ports[0], ports[1:]
+
+    async with (
+        WebsocketServer(LOCALHOST, worker_ports[0]) as worker_a,
+        WebsocketServer(LOCALHOST, worker_ports[1]) as worker_b,
+        WebsocketRouter(LOCALHOST, router_port, worker_ports) as router,
+    ):
+        workers = (worker_a, worker_b)
+
+        for _ in range(4):
+            identifier = str(uuid.uuid4())
+            index = router.get_worker(identifier)
+
+            # the client is redirected to the worker serving the room
+            uri = websocket_client_uri(LOCALHOST, router_port, identifier)
+            client = await connect_websocket_client(uri)
+            assert client.remote_address[1] == worker_ports[index]
+
+            while identifier not in workers[index].rooms:
+                await anyio.sleep(1e-3)
+            assert identifier not in workers[1 - index].rooms
+
+            await client.close()
+
+        assert router.stats["redirects"] == 4
+
+        # connections to restarting workers are refused with a retry hint
+        router.unavailable.add(index)
+        with pytest.raises(InvalidStatus) as excinfo:
+            await connect(uri)
+
+        response = excinfo.value.response
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert "Retry-After" in response.headers
+        assert router.worker_stats[index]["refusals"] == 1
+
+        # invalid identifiers are rejected by the router already
+        with pytest.raises(InvalidStatus) as excinfo:
+            await connect(websocket_client_uri(LOCALHOST, router_port, "short"))
+        assert excinfo.value.response.status_code == HTTPStatus.FORBIDDEN
+
+
+async def test_websocket_server_port_zero():
+    async with WebsocketServer(LOCALHOST, 0) as server:
+        while server.states.SERVING not in server.state:
+            await anyio.sleep(1e-3)
+
+        # the port chosen by the operating system is published
+        assert server.port != 0
+
+        identifier = str(uuid.uuid4())
+        async with connect(websocket_client_uri(LOCALHOST, server.port, identifier)):
+            while identifier not in server.rooms:
+                await anyio.sleep(1e-3)
+
+
+async def test_worker_pool():
+    port = free_tcp_port(LOCALHOST)
+    pool = WorkerPool({"host": LOCALHOST, "workers": 2}, port)
+
+    async with pool:
+        # the workers report the ports they are listening on
+        ports = pool.router.workers
+        assert 0 not in ports
+        assert len(set(ports)) == 2
+
+        # a crashed worker is respawned and unavailable in the meantime
+        crashed = pool.processes[0]
+        crashed.kill()
+
+        with anyio.fail_after(10):
+            while pool.processes[0] is crashed:
+                await anyio.sleep(1e-2)
+
+            assert 0 in pool.router.unavailable
+
+            while 0 in pool.router.unavailable:
+                await anyio.sleep(1e-2)
+
+        assert pool.processes[0].is_alive()
+
+        for index in range(2):
+            identifier = next(
+                identifier
+                for identifier in (str(uuid.uuid4()) for _ in range(100))
+                if pool.router.get_worker(identifier) == index
+            )
+            client = await connect_websocket_client(
+                websocket_client_uri(LOCALHOST, port, identifier)
+            )
+            assert client.remote_address[1] == pool.router.workers[index]
+            await client.close()
+
+    assert not any(process.is_alive() for process in pool.processes)
+
+
+async def test_worker_pool_failing_start():
+    # workers fail to bind to an invalid address
+    pool = WorkerPool({"host": "256.0.0.1", "workers": 2}, free_tcp_port(LOCALHOST))
+
+    with pytest.RaisesGroup(RuntimeError, flatten_subgroups=True):
+        async with anyio.create_task_group() as tg:
+            await tg.start(pool.start)
+
+    assert not any(process.is_alive() for process in pool.processes)
+
+
+async def test_room_replication(free_tcp_port, tmp_path):
+    path = tmp_path / "bus.sock"
+    port_b = elva.server.free_tcp_port()
+
+    async with (
+        BusBroker(path),
+        WebsocketServer(
+            LOCALHOST, free_tcp_port, persistent=True, bus=UnixSocketBus(path)
+        ) as server_a,
+        WebsocketServer(
+            LOCALHOST, port_b, persistent=True, bus=UnixSocketBus(path)
+        ) as server_b,
+    ):
+        identifier = str(uuid.uuid4())
+
+        # write to the room on the first server before it exists on the second one
+        doc = Doc()
+        doc["text"] = text = Text()
+        text += "foo"
+        message, _ = YMessage.SYNC_UPDATE.encode(doc.get_update())
+
+        client_a = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+        )
+        await client_a.send(message)
+
+        # the room on the second server catches up on loading
+        client_b = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, port_b, identifier)
+        )
+
+        def contents(server: WebsocketServer) -> str:
+            room = server.rooms.get(identifier)
+            if room is None:
+                return ""
+            room_doc = Doc()
+            room_doc["text"] = room_text = Text()
+            room_doc.apply_update(room.ydoc.get_update())
+            return str(room_text)
+
+        with anyio.fail_after(2):
+            while contents(server_b) != "foo":
+                await anyio.sleep(1e-3)
+
+        # subsequent updates are replicated and broadcasted to the other server's clients
+        state = doc.get_state()
+        text += "bar"
+        message, _ = YMessage.SYNC_UPDATE.encode(doc.get_update(state))
+        await client_b.send(message)
+
+        with anyio.fail_after(2):
+            while True:
+                message_type, payload, _ = YMessage.infer_and_decode(
+                    await client_a.recv()
+                )
+                if message_type == YMessage.SYNC_UPDATE:
+                    break
+
+        assert payload == doc.get_update(state)
+        assert contents(server_a) == "foobar"
+        assert server_a.rooms[identifier].stats["updates_replicated"] == 1
+
+        for client in (client_a, client_b):
+            await client.close()
+
+
+async def test_room_replication_invalid_messages(free_tcp_port, tmp_path):
+    path = tmp_path / "bus.sock"
+
+    async with (
+        BusBroker(path),
+        WebsocketServer(
+            LOCALHOST, free_tcp_port, persistent=True, bus=UnixSocketBus(path)
+        ) as websocket_server,
+        UnixSocketBus(path) as bus,
+    ):
+        identifier = str(uuid.uuid4())
+        messages = await bus.join(identifier)
+
+        client = await connect_websocket_client(
+            websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+        )
+
+        # the room has joined the topic once it asks for the state of other rooms
+        with anyio.fail_after(2):
+            async for message in messages:
+                if message is not None:
+                    message_type, _, _ = ElvaMessage.peek(message)
+                    if message_type == ElvaMessage.SYNC_STEP1:
+                        break
+
+        # corrupt or foreign messages are ignored
+        state, _ = YMessage.SYNC_STEP1.encode(b"garbage")
+        update, _ = YMessage.SYNC_STEP2.encode(b"\x05\x07garbage")
+        for message_type, payload in (
+            (ElvaMessage.SYNC_STEP1, b"garbage"),
+            (ElvaMessage.SYNC_CROSS, state + update),
+            (ElvaMessage.SYNC_STEP2, b"\x05\x07garbage"),
+            (ElvaMessage.SYNC_UPDATE, b"\x05\x07garbage"),
+        ):
+            message, _ = message_type.encode(payload)
+            bus.publish(identifier, message)
+
+        # valid messages are still applied afterwards
+        doc = Doc()
+        doc["text"] = text = Text()
+        text += "foo"
+        message, _ = ElvaMessage.SYNC_UPDATE.encode(doc.get_update())
+        bus.publish(identifier, message)
+
+        with anyio.fail_after(2):
+            while True:
+                message_type, payload, _ = YMessage.infer_and_decode(
+                    await client.recv()
+                )
+                if message_type == YMessage.SYNC_UPDATE:
+                    break
+
+        assert payload == doc.get_update()
+        assert websocket_server.states.SERVING in websocket_server.state
+        assert websocket_server.rooms[identifier].states.RUNNING in (
+            websocket_server.rooms[identifier].state
+        )
+
+        await client.close()
+
+
+class SlowConnection:
+    """Stand-in for a connection whose write buffer is full until resumed."""
+
+    close_timeout = 1
+
+    def __init__(self):
+        self.paused = True
+        self.resumed = anyio.Event()
+        self.received = list()
+        self.close_code = None
+
+    async def send(self, message):
+        await self.resumed.wait()
+        self.received.append(message)
+
+    async def close(self, code=CloseCode.NORMAL_CLOSURE, reason=""):
+        if self.close_code is None:
+            self.close_code = code
+
+
+async def test_outbox(monkeypatch):
+    monkeypatch.setattr(elva.server, "OUTBOX_SIZE", 4)
+
+    async with Room(str(uuid.uuid4()), persistent=True) as room:
+        slow = SlowConnection()
+        room.add(slow)
+
+        doc = Doc()
+        doc["text"] = text = Text()
+        for char in "abcde":
+            state = doc.get_state()
+            text += char
+            message, _ = YMessage.SYNC_UPDATE.encode(doc.get_update(state))
+            room.send((slow,), message)
+
+        # queued updates are merged instead of exceeding the outbox size
+        assert room.stats["slow_connections"] == 1
+        assert room.stats["outbox_collapses"] == 1
+        stats = room.lag_statistics()[id(slow)]
+        assert stats["messages"] == 1
+        assert stats["collapses"] == 1
+
+        slow.resumed.set()
+        with anyio.fail_after(1):
+            while room.outboxes:
+                await anyio.sleep(1e-3)
+
+        assert len(slow.received) == 1
+        _, update, _ = YMessage.infer_and_decode(slow.received[0])
+        doc_slow = Doc()
+        doc_slow["text"] = text_slow = Text()
+        doc_slow.apply_update(update)
+        assert str(text_slow) == "abcde"
+        assert slow.close_code is None
+
+        # awareness messages cannot be merged, so the connection is given up
+        slow = SlowConnection()
+        room.add(slow)
+        for _ in range(5):
+            message, _ = YMessage.AWARENESS.encode(b"state")
+            room.send((slow,), message)
+
+        with anyio.fail_after(1):
+            while room.outboxes:
+                await anyio.sleep(1e-3)
+
+        assert slow.close_code == CloseCode.TRY_AGAIN_LATER
+        assert room.stats["slow_disconnects"] == 1
+
+
+async def test_slow_joiner():
+    """A connection not reading the answers to its sync step 1 message does not stall the room."""
+    async with Room(str(uuid.uuid4()), persistent=True, batch_ingest=True) as room:
+        slow = SlowConnection()
+        other = SlowConnection()
+        other.resumed.set()
+
+        room.add(slow)
+        room.add(other)
+
+        step1, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+        await room.ingest(step1, slow)
+        await room.ingest(step1, other)
+
+        with anyio.fail_after(1):
+            while len(other.received) < 2:
+                await anyio.sleep(1e-3)
+
+        message_type, _, _ = YMessage.peek(other.received[0])
+        assert message_type == YMessage.SYNC_STEP2
+        assert not slow.received
+
+
+async def test_outbox_max_lag():
+    async with Room(str(uuid.uuid4()), persistent=True, max_lag=0.05) as room:
+        slow = SlowConnection()
+        room.add(slow)
+
+        message, _ = YMessage.SYNC_UPDATE.encode(Doc().get_update())
+        room.send((slow,), message)
+        assert room.lag_statistics()[id(slow)]["messages"] == 1
+
+        with anyio.fail_after(1):
+            while room.outboxes:
+                await anyio.sleep(1e-3)
+
+        assert slow.close_code == CloseCode.TRY_AGAIN_LATER
+        assert room.stats["slow_disconnects"] == 1
+
+
+async def test_awareness(free_tcp_port):
+    async with WebsocketServer(
+        host=LOCALHOST,
+        port=free_tcp_port,
+        persistent=True,
+        awareness_interval=0.2,
+    ) as websocket_server:
+        identifier = str(uuid.uuid4())
+        uri = websocket_client_uri(LOCALHOST, free_tcp_port, identifier)
+
+        async def sync(client: ClientConnection):
+            message, _ = YMessage.SYNC_STEP1.encode(Doc().get_state())
+            await client.send(message)
+            await client.recv()  # sync step 2
+            await client.recv()  # reactive cross sync
+
+        async def receive_awareness(client: ClientConnection, awareness: Awareness):
+            message_type, payload, _ = YMessage.infer_and_decode(await client.recv())
+            assert message_type == YMessage.AWARENESS
+            awareness.apply_awareness_update(payload, "remote")
+
+        client_a = await connect_websocket_client(uri)
+        await sync(client_a)
+
+        awareness_a = Awareness(Doc())
+        for index in range(5):
+            awareness_a.set_local_state({"cursor": index})
+            update = awareness_a.encode_awareness_update([awareness_a.client_id])
+            message, _ = YMessage.AWARENESS.encode(update)
+            await client_a.send(message)
+
+        # let the interval pass without other clients to broadcast to
+        await anyio.sleep(0.4)
+
+        # a joining client gets the latest state right after the sync
+        client_b = await connect_websocket_client(uri)
+        await sync(client_b)
+
+        awareness_b = Awareness(Doc())
+        with anyio.fail_after(1):
+            await receive_awareness(client_b, awareness_b)
+        assert awareness_b.states[awareness_a.client_id] == {"cursor": 4}
+
+        # the changes of an interval are broadcasted at once
+        room = websocket_server.rooms[identifier]
+        frames = room.stats["awareness_frames"]
+        for index in range(5, 10):
+            awareness_a.set_local_state({"cursor": index})
+            update = awareness_a.encode_awareness_update([awareness_a.client_id])
+            message, _ = YMessage.AWARENESS.encode(update)
+            await client_a.send(message)
+
+        with anyio.fail_after(1):
+            await receive_awareness(client_b, awareness_b)
+        assert awareness_b.states[awareness_a.client_id] == {"cursor": 9}
+        assert room.stats["awareness_frames"] == frames + 1
+
+        # the states of a closed connection are removed
+        await client_a.close()
+
+        with anyio.fail_after(1):
+            await receive_awareness(client_b, awareness_b)
+        assert awareness_a.client_id not in awareness_b.states
+
+        await client_b.close()
@@ -1,12 +1,36 @@
+import sqlite3
 import uuid
+from pathlib import Path
 
 import anyio
 import pytest
 from pycrdt import Doc, Text, TransactionEvent
 
+import elva.store
 from elva.component import create_component_state
 from elva.protocol import STATE_ZERO
-from elva.store import SQLiteStore, get_metadata, get_updates, set_metadata
+from elva.store import (
+    LOG_HEADER,
+    SHARD_NAME,
+    SYNCED_STATE_KEY,
+    LogRecord,
+    LogStore,
+    ShardedSQLiteDatabase,
+    ShardedSQLiteStore,
+    SQLiteStore,
+    Store,
+    UpdateBuffer,
+    compact_updates,
+    export_rooms,
+    get_metadata,
+    get_pragma_statements,
+    get_pragmas,
+    get_statistics,
+    get_updates,
+    import_rooms,
+    read_log_records,
+    set_metadata,
+)
 
 pytestmark = pytest.mark.anyio
 
@@ -116,13 +140,13 @@ async def test_read_write(tmp_elva_file):
             await anyio.sleep(1e-6)
 
         # the update is now in the store's buffer
-        assert store._stream_recv.statistics().current_buffer_used > 0
+        assert store.buffer.depth > 0
 
         # cancel the task scope, triggering the cleanup
         tg.cancel_scope.cancel()
 
         # the update is still in the buffer, but should be written to file nonetheless
-        assert store._stream_recv.statistics().current_buffer_used > 0
+        assert store.buffer.depth > 0
 
     # check if update has really been written to `tmp_elva_file`
     updates = get_updates(tmp_elva_file)
@@ -196,3 +220,567 @@ async def test_non_empty_ydoc(tmp_elva_file):
 
     # we see the updates from the first and the second run
     assert len(updates) == 3
+
+
+@pytest.mark.parametrize("merge_batch", (False, True))
+async def test_group_commit(tmp_elva_file, merge_batch):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+    identifier = "group-commit"
+
+    store = SQLiteStore(
+        ydoc,
+        identifier,
+        tmp_elva_file,
+        max_batch_size=100,
+        max_batch_latency=60,
+        merge_batch=merge_batch,
+    )
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(store.start)
+
+        for char in "some characters":
+            text += char
+
+        # wait for the writer to take the updates from the buffer
+        while store.buffer.depth > 0:
+            await anyio.sleep(1e-3)
+
+        # the batch is still being collected, nothing has been written yet
+        assert get_updates(tmp_elva_file) == []
+
+        # cancel while collecting further updates
+        tg.cancel_scope.cancel()
+
+    # the collected batch has been written nonetheless
+    updates = get_updates(tmp_elva_file)
+    if merge_batch:
+        assert len(updates) == 1
+    else:
+        assert len(updates) == len("some characters")
+
+    doc_after = Doc()
+    async with SQLiteStore(doc_after, identifier, tmp_elva_file):
+        assert doc_after.get_state() == ydoc.get_state()
+        assert str(doc_after.get("text", type=Text)) == "some characters"
+
+
+def test_pragma_statements():
+    pragmas = {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "memory",
+    }
+    assert get_pragma_statements(pragmas) == [
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -2000",
+        "PRAGMA mmap_size = 0",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    assert get_pragma_statements(None) == []
+
+    # only pragmas are picked from configurations
+    assert get_pragmas({"host": "localhost", **pragmas, "port": None}) == pragmas
+
+    for invalid in (
+        {"foreign_keys": "ON"},
+        {"journal_mode": "wal; DROP TABLE yupdates"},
+        {"cache_size": "2000"},
+        {"mmap_size": True},
+    ):
+        with pytest.raises(ValueError):
+            get_pragma_statements(invalid)
+
+
+async def test_pragmas(tmp_elva_file):
+    pragmas = {"journal_mode": "wal", "synchronous": "normal"}
+
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, "pragmas", tmp_elva_file, pragmas=pragmas) as store:
+        await store._cursor.execute("PRAGMA synchronous")
+        (synchronous,) = await store._cursor.fetchone()
+        assert synchronous == 1  # NORMAL
+
+        text += "foo"
+
+        # reading does not contend with the running store
+        assert get_metadata(tmp_elva_file, pragmas=pragmas) == {"identifier": "pragmas"}
+
+    # the journal mode is persisted in the file
+    db = sqlite3.connect(tmp_elva_file)
+    (journal_mode,) = db.execute("PRAGMA journal_mode").fetchone()
+    db.close()
+    assert journal_mode == "wal"
+
+    assert len(get_updates(tmp_elva_file, pragmas=pragmas)) == 1
+
+
+@pytest.mark.parametrize("snapshot", (False, True))
+async def test_compact_updates(tmp_elva_file, snapshot):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, "compaction", tmp_elva_file):
+        for char in "compact me":
+            text += char
+
+    assert len(get_updates(tmp_elva_file)) == len("compact me")
+
+    num_rows, size = compact_updates(tmp_elva_file, snapshot=snapshot)
+    assert num_rows == len("compact me")
+
+    updates = get_updates(tmp_elva_file)
+    assert len(updates) == 1
+    assert len(updates[0][0]) == size
+
+    # compacting a compacted file is a no-op
+    assert compact_updates(tmp_elva_file) == (1, size)
+
+    # the content is restored completely
+    doc_after = Doc()
+    async with SQLiteStore(doc_after, None, tmp_elva_file):
+        assert str(doc_after.get("text", type=Text)) == "compact me"
+
+    # metadata are untouched
+    assert get_metadata(tmp_elva_file) == {"identifier": "compaction"}
+
+
+async def test_automatic_compaction(tmp_elva_file):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, "compaction", tmp_elva_file, compact_rows=4) as store:
+        for char in "compact me":
+            text += char
+
+            # give the store the chance to write each update separately
+            while store.buffer.depth > 0:
+                await anyio.sleep(1e-3)
+
+    # the updates have been compacted whenever there were more than 4 rows
+    assert len(get_updates(tmp_elva_file)) <= 4
+
+    doc_after = Doc()
+    async with SQLiteStore(doc_after, None, tmp_elva_file):
+        assert str(doc_after.get("text", type=Text)) == "compact me"
+
+
+async def test_chunked_load(tmp_elva_file, monkeypatch):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, "chunks", tmp_elva_file):
+        for char in "chunks":
+            text += char
+
+    assert len(get_updates(tmp_elva_file)) == len("chunks")
+
+    # read less rows at once than there are updates
+    monkeypatch.setattr(elva.store, "CHUNK_SIZE", 4)
+
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text("local ")
+
+    async with SQLiteStore(doc_after, None, tmp_elva_file) as store:
+        # all rows have been read plus the appended local content
+        assert store._num_rows == len("chunks") + 1
+        assert "chunks" in str(text_after)
+        assert "local " in str(text_after)
+
+    # only the local content has been appended
+    assert len(get_updates(tmp_elva_file)) == len("chunks") + 1
+
+
+@pytest.mark.parametrize("store_class", (SQLiteStore, LogStore))
+async def test_reserved_metadata(tmp_path, store_class):
+    path = tmp_path / "reserved"
+
+    async with store_class(Doc(), "reserved", path) as store:
+        await store.set_metadata({SYNCED_STATE_KEY: "{}", "foo": "bar"})
+
+        # reserved keys survive replacing the metadata
+        await store.set_metadata({"baz": "quux"}, replace=True)
+        metadata = await store.get_metadata()
+        assert metadata[SYNCED_STATE_KEY] == "{}"
+        assert "foo" not in metadata
+
+    # they are no parameters of a data file
+    if store_class is SQLiteStore:
+        assert get_metadata(Path(store.path)) == {"baz": "quux"}
+
+
+async def test_statistics(tmp_elva_file):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with SQLiteStore(ydoc, "statistics", tmp_elva_file) as store:
+        for char in "stats":
+            text += char
+
+    updates = [update for update, *_ in get_updates(tmp_elva_file)]
+
+    # the statistics describe the file contents
+    statistics = get_statistics(tmp_elva_file)
+    assert statistics == {
+        "state": ydoc.get_state(),
+        "rows": len(updates),
+        "bytes": sum(len(update) for update in updates),
+    }
+
+    # they are no metadata and survive replacing the metadata
+    set_metadata(tmp_elva_file, {"foo": "bar"}, replace=True)
+    assert get_metadata(tmp_elva_file) == {"foo": "bar"}
+    assert get_statistics(tmp_elva_file) == statistics
+
+    # compaction updates the size
+    _, size = compact_updates(tmp_elva_file)
+    assert get_statistics(tmp_elva_file) == {
+        "state": ydoc.get_state(),
+        "rows": 1,
+        "bytes": size,
+    }
+
+    # append an update without updating the statistics
+    other = Doc()
+    other["text"] = Text("other")
+    db = sqlite3.connect(tmp_elva_file)
+    db.execute("INSERT INTO yupdates VALUES (?)", [other.get_update()])
+    db.commit()
+    db.close()
+
+    # the stale statistics are detected and corrected on loading
+    doc_after = Doc()
+    async with SQLiteStore(doc_after, None, tmp_elva_file) as store:
+        assert await store.get_statistics() == {
+            "state": doc_after.get_state(),
+            "rows": 2,
+            "bytes": size + len(other.get_update()),
+        }
+
+
+def test_incomplete_store():
+    class IncompleteStore(Store):
+        async def load(self):
+            return None
+
+    # missing methods are detected on instantiation
+    with pytest.raises(TypeError):
+        IncompleteStore(Doc(), "document")
+
+
+async def test_sharded_store(tmp_path):
+    contents = {f"document-{index}": f"content {index}" for index in range(4)}
+
+    async with ShardedSQLiteDatabase(tmp_path, shards=2) as database:
+        for identifier, content in contents.items():
+            ydoc = Doc()
+            ydoc["text"] = text = Text()
+
+            async with ShardedSQLiteStore(ydoc, identifier, database) as store:
+                for word in content.split():
+                    text += word
+
+                await store.set_metadata({"title": identifier})
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        SHARD_NAME.format(0),
+        SHARD_NAME.format(1),
+    ]
+
+    # the number of shards is fixed
+    with pytest.raises(ValueError):
+        ShardedSQLiteDatabase(tmp_path, shards=3)
+
+    async with ShardedSQLiteDatabase(tmp_path, shards=2) as database:
+        for identifier, content in contents.items():
+            ydoc = Doc()
+            ydoc["text"] = text = Text()
+
+            async with ShardedSQLiteStore(ydoc, identifier, database) as store:
+                assert str(text) == content.replace(" ", "")
+                assert await store.get_metadata() == {"title": identifier}
+
+                # the statistics describe the stored updates
+                statistics = await store.get_statistics()
+                assert statistics["state"] == ydoc.get_state()
+                assert statistics["rows"] == store._num_rows == len(content.split())
+                assert statistics["bytes"] == store._num_bytes
+
+                # new content is written on leaving the context
+                text += "!"
+                while store._num_rows < len(content.split()) + 1:
+                    await anyio.sleep(1e-3)
+
+                await store.compact()
+
+                statistics = await store.get_statistics()
+                assert statistics["rows"] == store._num_rows == 1
+                assert statistics["bytes"] == store._num_bytes
+
+                # a single update is left after the compaction
+                shard = tmp_path / SHARD_NAME.format(database.get_shard(identifier))
+                db = sqlite3.connect(shard)
+                res = db.execute(
+                    "SELECT COUNT(*) FROM yupdates WHERE identifier = ?", (identifier,)
+                )
+                assert res.fetchone() == (1,)
+                db.close()
+
+        for identifier, content in contents.items():
+            ydoc = Doc()
+            ydoc["text"] = text = Text()
+
+            async with ShardedSQLiteStore(ydoc, identifier, database):
+                assert str(text) == content.replace(" ", "") + "!"
+
+
+async def test_sharded_store_failing_start(tmp_path):
+    class FailingStore(ShardedSQLiteStore):
+        async def _merge(self):
+            raise RuntimeError("failed to merge")
+
+    with anyio.fail_after(1):
+        async with ShardedSQLiteDatabase(tmp_path) as database:
+            store = FailingStore(Doc(), "document", database)
+            with pytest.RaisesGroup(RuntimeError, flatten_subgroups=True):
+                async with anyio.create_task_group() as tg:
+                    await tg.start(store.start)
+
+            # the failed store does not keep the database from closing
+            assert database._stores == 0
+
+
+async def test_sharded_store_full_buffer(tmp_path, monkeypatch):
+    create_stream = elva.store.create_memory_object_stream
+
+    # let the writer task of the database buffer only a few updates
+    monkeypatch.setattr(
+        elva.store,
+        "create_memory_object_stream",
+        lambda max_buffer_size: create_stream(max_buffer_size=4),
+    )
+
+    async with ShardedSQLiteDatabase(tmp_path) as database:
+        ydoc = Doc()
+        ydoc["text"] = text = Text()
+
+        async with ShardedSQLiteStore(ydoc, "document", database):
+            # changes do not fail without giving the writer task a chance to run
+            for _ in range(100):
+                text += "x"
+
+    async with ShardedSQLiteDatabase(tmp_path) as database:
+        ydoc = Doc()
+        ydoc["text"] = text = Text()
+
+        async with ShardedSQLiteStore(ydoc, "document", database):
+            assert str(text) == "x" * 100
+
+
+async def test_export_import_rooms(tmp_path):
+    database_path = tmp_path / "shards"
+    files_path = tmp_path / "files"
+
+    async with ShardedSQLiteDatabase(database_path, shards=3) as database:
+        for identifier in ("foo-document", "bar-document"):
+            ydoc = Doc()
+            ydoc["text"] = Text(identifier)
+
+            async with ShardedSQLiteStore(ydoc, identifier, database) as store:
+                await store.set_metadata(
+                    {"title": identifier.upper(), SYNCED_STATE_KEY: "{}"}
+                )
+
+    identifiers = export_rooms(database_path, files_path)
+    assert sorted(identifiers) == ["bar-document", "foo-document"]
+
+    for identifier in identifiers:
+        file = files_path / f"{identifier}.y"
+
+        # reserved keys are not exported
+        db = sqlite3.connect(file)
+        keys = {key for (key,) in db.execute("SELECT key FROM metadata").fetchall()}
+        db.close()
+        assert keys == {"identifier", "title"}
+
+        # the exported data files can be read by the file store
+        ydoc = Doc()
+        ydoc["text"] = text = Text()
+        async with SQLiteStore(ydoc, None, file):
+            assert str(text) == identifier
+
+    # the number of shards is fixed
+    with pytest.raises(ValueError):
+        import_rooms(files_path, database_path, shards=2)
+
+    other_path = tmp_path / "other"
+    identifiers = import_rooms(files_path, other_path, shards=2)
+    assert sorted(identifiers) == ["bar-document", "foo-document"]
+
+    async with ShardedSQLiteDatabase(other_path, shards=2) as database:
+        for identifier in identifiers:
+            ydoc = Doc()
+            ydoc["text"] = text = Text()
+
+            async with ShardedSQLiteStore(ydoc, identifier, database) as store:
+                assert str(text) == identifier
+                assert await store.get_metadata() == {"title": identifier.upper()}
+
+
+async def test_log_store(tmp_path):
+    path = tmp_path / "document.ylog"
+
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with LogStore(ydoc, "log", path, max_batch_size=10) as store:
+        for char in "log":
+            text += char
+
+        await store.set_metadata({"title": "Log"})
+
+    data = path.read_bytes()
+    assert data.startswith(LOG_HEADER)
+
+    records = [record for record, *_ in read_log_records(data, len(LOG_HEADER))]
+    assert records.count(LogRecord.UPDATE) == 3
+    assert LogRecord.METADATA in records
+
+    # simulate a crash while appending a record
+    incomplete, _ = LogRecord.UPDATE.encode(b"incomplete")
+    with path.open("ab") as file:
+        file.write(incomplete[:-3])
+
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text()
+
+    async with LogStore(doc_after, None, path) as store:
+        assert str(text_after) == "log"
+        assert store.identifier == "log"
+        assert await store.get_metadata() == {"identifier": "log", "title": "Log"}
+
+        # the incomplete record has been cut off
+        assert path.read_bytes() == data
+
+        text_after += "!"
+
+    # the appended content is read back
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text()
+
+    async with LogStore(doc_after, None, path):
+        assert str(text_after) == "log!"
+
+    # the metadata are read without starting a store as well
+    assert LogStore.read_metadata(path) == {"identifier": "log", "title": "Log"}
+
+    # unknown records are not skipped silently
+    with path.open("ab") as file:
+        file.write(b"\x00\x00\x00")
+
+    with pytest.raises(ValueError):
+        list(read_log_records(path.read_bytes(), len(LOG_HEADER)))
+
+
+@pytest.mark.parametrize("fsync", ("always", "interval", "never"))
+async def test_log_store_compaction(tmp_path, fsync):
+    path = tmp_path / "document.ylog"
+
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    async with LogStore(ydoc, "log", path, fsync=fsync, compact_rows=4) as store:
+        for char in "compaction":
+            text += char
+
+            # give the store the chance to write each update separately
+            while store.buffer.depth > 0:
+                await anyio.sleep(1e-3)
+
+    records = [
+        record for record, *_ in read_log_records(path.read_bytes(), len(LOG_HEADER))
+    ]
+    assert records.count(LogRecord.UPDATE) <= 4
+
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text()
+
+    async with LogStore(doc_after, None, path) as store:
+        assert str(text_after) == "compaction"
+        assert store.identifier == "log"
+
+
+async def test_update_buffer(tmp_path):
+    spill_path = tmp_path / "buffer.spill"
+
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    updates = []
+    ydoc.observe(lambda event: updates.append(event.update))
+
+    for char in "buffer":
+        text += char
+
+    size = sum(len(update) for update in updates)
+    buffer = UpdateBuffer(max_bytes=size // 2, spill_path=spill_path)
+
+    for update in updates:
+        buffer.put(update)
+
+    # updates have been merged and spilled to disk instead of being held in memory
+    stats = buffer.statistics()
+    assert stats["coalesced"] > 0
+    assert stats["spills"] > 0
+    assert stats["bytes"] <= size // 2
+    assert stats["peak_bytes"] > size // 2
+    assert buffer.spilled_bytes > 0
+    assert spill_path.exists()
+
+    # all content can be taken out again
+    taken = []
+    while buffer.depth:
+        taken.append(buffer.get_nowait())
+
+    with pytest.raises(anyio.WouldBlock):
+        buffer.get_nowait()
+
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text()
+    for update in taken:
+        doc_after.apply_update(update)
+    assert str(text_after) == "buffer"
+
+    # the empty spill file is removed
+    buffer.close()
+    assert not spill_path.exists()
+
+
+async def test_spill_recovery(tmp_elva_file):
+    ydoc = Doc()
+    ydoc["text"] = text = Text()
+
+    # simulate a crash after spilling updates, before writing them
+    buffer = UpdateBuffer(max_bytes=0, spill_path=f"{tmp_elva_file}.spill")
+    ydoc.observe(lambda event: buffer.put(event.update))
+    text += "spilled"
+    buffer._spill.close()
+
+    doc_after = Doc()
+    doc_after["text"] = text_after = Text()
+
+    async with SQLiteStore(doc_after, "spill", tmp_elva_file) as store:
+        assert str(text_after) == "spilled"
+
+        while store.buffer.depth > 0:
+            await anyio.sleep(1e-3)
+
+    # the spilled updates have been written and the spill file removed
+    assert len(get_updates(tmp_elva_file)) == 1
+    assert not Path(f"{tmp_elva_file}.spill").exists()